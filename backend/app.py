@@ -1,11 +1,26 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 import jwt
 from datetime import datetime, timedelta
 import os
+import math
 from dotenv import load_dotenv, find_dotenv
 import logging
-from openai import OpenAI
+from typing import Any, Callable, Dict, List, NamedTuple
+from backend.utils.llm_gateway import GATEWAY_SETTINGS, get_gateway, reset_deadline, set_deadline
+from backend.utils.sse import SSE_HEADERS, sse_stream
+from backend.utils.single_flight import llm_async_single_flight, llm_single_flight, prompt_key
+from backend.utils.circuit_breaker import CircuitOpenError
+from backend.utils.response_cache import MemoryCacheBackend, ResponseCache, create_response_cache
+from backend.utils.llm_telemetry import llm_labels, llm_telemetry, reset_llm_labels, set_llm_labels
+from backend.extensions import cache, db, migrate
+from config.config import Config
+from backend.models.ai_analyzer import AIAnalyzer
+from backend.models.insight_precompute import STANDARD_INSIGHTS, InsightPrecomputer
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+except ImportError:
+    CONTENT_TYPE_LATEST, generate_latest = None, None
 
 # 自動偵測並載入 .env（專案根目錄或 backend 目錄）
 env_path = find_dotenv()
@@ -41,9 +56,45 @@ def create_app():
     
     # 基本配置
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.getenv('DATABASE_URL', 'sqlite:///app.db'))
+    app.config.setdefault('SQLALCHEMY_TRACK_MODIFICATIONS', False)
+    db.init_app(app)
+    migrate.init_app(app, db)
+    # flask_caching（LLM_CACHE_BACKEND=flask 時的回應快取後端）；正式環境以 CACHE_TYPE=RedisCache 共用
+    app.config.setdefault('CACHE_TYPE', os.getenv('CACHE_TYPE', 'SimpleCache'))
+    app.config.setdefault('CACHE_REDIS_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    cache.init_app(app)
+    # LLM 回應快取（backend: memory / sqlite / flask）、LLM 閘道、洞察預先產生與 ASGI 模式的設定，預設值見 config/config.py
+    for key in ('LLM_CACHE_BACKEND', 'LLM_CACHE_TTL', 'LLM_CACHE_MAX_ENTRIES', 'LLM_CACHE_PATH') + GATEWAY_SETTINGS + (
+            'LLM_REQUEST_DEADLINE', 'LLM_MIN_REQUEST_DEADLINE', 'INSIGHT_WORKERS', 'INSIGHT_REQUESTS_PER_MINUTE',
+            'LLM_ASYNC_MAX_CONNECTIONS', 'ASGI_SYNC_THREADS'):
+        app.config.setdefault(key, getattr(Config, key))
     
-    # 設置 OpenAI API
-    client = OpenAI(api_key=openai_api_key)
+    # 設置 LLM 閘道（與 AIAnalyzer 共用連線池與重試預算）
+    gateway = get_gateway(app.config)
+
+    @app.before_request
+    def start_llm_deadline():
+        g.llm_deadline_token = set_deadline(llm_request_budget(request.headers.get('X-Request-Timeout'), app.config))
+        # 本次請求的 LLM 呼叫以端點名稱標記（見 llm_telemetry）
+        g.llm_labels_token = set_llm_labels(endpoint=request.endpoint or 'unknown')
+
+    @app.teardown_request
+    def clear_llm_deadline(exc):
+        token = g.pop('llm_deadline_token', None)
+        if token is not None:
+            reset_deadline(token)
+        labels_token = g.pop('llm_labels_token', None)
+        if labels_token is not None:
+            reset_llm_labels(labels_token)
+
+    def create_completion(model, messages):
+        """呼叫 chat completion；同時進行中的相同提示共用一次上游呼叫"""
+        return llm_single_flight.do(prompt_key(model, messages), gateway.chat, model, messages)
+
+    # 每個提示最近一次成功的 AI 回應，斷路器開啟時作為降級內容（ASGI 模式的端點共用，見 backend/asgi.py）
+    last_responses = ResponseCache(MemoryCacheBackend(max_entries=512), ttl=7 * 24 * 3600)
+    app.extensions['llm_last_responses'] = last_responses
     
     # 健康檢查端點
     @app.route('/api/health')
@@ -53,37 +104,240 @@ def create_app():
             'version': '1.0.0'
         })
     
-    # 城市運動分析端點
+    # 城市運動分析端點（請求解析與結果由模組層級的函式建立，ASGI 模式共用，見 backend/asgi.py）
     @app.route('/api/analyze/city', methods=['POST'])
     def analyze_city_sport():
         logging.info('收到 /api/analyze/city 請求')
-        data = request.get_json()
+        data = request.get_json(silent=True)
         logging.info(f'收到資料: {data}')
-        sport = data.get('sport')
-        location = data.get('location', '台北市')
-        weather = data.get('weather', '晴天')
-        time = data.get('time', '早晨')
-        
-        if not sport:
-            logging.warning('未提供運動類型')
+        call, error = city_analysis_call(data)
+        if error is not None:
+            return jsonify(error[0]), error[1]
+        if wants_stream(data, request.headers.get('Accept', '')):
+            return Response(stream_with_context(sse_stream(stream_completion(call))),
+                            mimetype='text/event-stream', headers=SSE_HEADERS)
+        logging.info('呼叫 OpenAI API...')
+        result, status = complete(call)
+        return jsonify(result), status
+
+    def complete(call):
+        """呼叫 LLM 並建立端點結果，回傳 (結果, HTTP 狀態碼)"""
+        try:
+            with llm_labels(insight_type=call.insight_type):
+                response = create_completion(CHAT_MODEL, call.messages)
+            return call.result(last_responses, response)
+        except Exception as e:
+            return call.failure(last_responses, e)
+
+    def stream_completion(call):
+        """以串流模式呼叫 OpenAI，逐段送出 token 事件，最後送出與非串流模式相同的結果"""
+        parts = []
+        try:
+            logging.info('呼叫 OpenAI API (stream)...')
+            with llm_labels(insight_type=call.insight_type):
+                stream = gateway.stream_chat(CHAT_MODEL, call.messages)
+            for chunk in stream:
+                content = chunk_content(chunk)
+                if content:
+                    parts.append(content)
+                    yield 'token', {'content': content}
+        except Exception as e:
+            yield from call.stream_failure(last_responses, e)
+            return
+        logging.info('串流分析完成')
+        yield from call.stream_done(last_responses, parts)
+    
+    # 獲取城市運動熱點
+    @app.route('/api/city/hotspots', methods=['GET'])
+    def get_city_hotspots():
+        result, status = complete(hotspots_call(request.args.get('location', '台北市')))
+        return jsonify(result), status
+    
+    # 用戶洞察：只讀取預先產生的結果，活動有變化時在背景重新產生（見 scripts/precompute_insights.py）
+    response_cache = create_response_cache(
+        backend=app.config['LLM_CACHE_BACKEND'],
+        ttl=app.config['LLM_CACHE_TTL'],
+        max_entries=app.config['LLM_CACHE_MAX_ENTRIES'],
+        path=app.config['LLM_CACHE_PATH']
+    )
+    app.extensions['llm_response_cache'] = response_cache
+    insights = InsightPrecomputer(
+        app,
+        AIAnalyzer(gateway=gateway, cache=response_cache),
+        max_workers=app.config['INSIGHT_WORKERS'],
+        requests_per_minute=app.config['INSIGHT_REQUESTS_PER_MINUTE']
+    )
+    app.extensions['insight_precomputer'] = insights
+
+    @app.route('/api/users/<int:user_id>/insights', methods=['GET'])
+    def get_user_insights(user_id):
+        insight_types = request.args.getlist('type') or insights.insight_types
+        unknown = [t for t in insight_types if t not in STANDARD_INSIGHTS]
+        if unknown:
             return jsonify({
                 'status': 'error',
-                'message': '請選擇運動類型'
+                'message': f"不支援的洞察類型: {', '.join(unknown)}"
             }), 400
-        
-        if not openai_api_key:
-            logging.error('AI 金鑰未設定')
+        results = insights.get_insights(user_id, insight_types)
+        if not results:
             return jsonify({
                 'status': 'error',
-                'message': 'AI 金鑰未設定，請聯絡管理員'
-            }), 500
-        try:
-            logging.info('呼叫 OpenAI API...')
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "你是一個專業的城市運動分析師，請根據用戶的運動類型、地點、天氣和時間提供專業的分析和建議。"},
-                    {"role": "user", "content": f"""
+                'message': '找不到用戶或尚無活動紀錄'
+            }), 404
+        # 尚未產生過的洞察在背景產生，客戶端稍後再讀取
+        if all(result.get('pending') for result in results.values()):
+            return jsonify({
+                'status': 'pending',
+                'insights': results
+            }), 202
+        return jsonify({
+            'status': 'success',
+            'insights': results
+        })
+
+    # Prometheus 指標（LLM 遙測、分區快取等在應用程式 process 內記錄的指標）
+    @app.route('/metrics')
+    def metrics():
+        if generate_latest is None:
+            return jsonify({'status': 'error', 'message': 'prometheus_client 未安裝'}), 501
+        registry = REGISTRY
+        if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+            # 多個 worker 時各自把指標寫入 PROMETHEUS_MULTIPROC_DIR，在此彙總所有 worker（見 config/gunicorn.conf.py）
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+    # LLM 呼叫統計
+    @app.route('/api/llm/stats')
+    def llm_stats():
+        stats = {
+            'status': 'success',
+            'single_flight': llm_single_flight.stats(),
+            'gateway': gateway.stats(),
+            'insights': insights.stats(),
+            'response_cache': response_cache.stats(),
+            'telemetry': llm_telemetry.stats()
+        }
+        # ASGI 模式（backend/asgi.py）另有非同步閘道與合併器
+        async_gateway = app.extensions.get('async_llm_gateway')
+        if async_gateway is not None:
+            stats['async_single_flight'] = llm_async_single_flight.stats()
+            stats['async_gateway'] = async_gateway.stats()
+        return jsonify(stats)
+    
+    return app
+
+# 城市分析與熱點端點使用的模型
+CHAT_MODEL = "gpt-3.5-turbo"
+
+def llm_request_budget(requested, config):
+    """
+    本次請求的 LLM 呼叫時間預算（秒）：客戶端以 X-Request-Timeout 指定
+
+    介於 LLM_MIN_REQUEST_DEADLINE 與伺服器上限 LLM_REQUEST_DEADLINE 之間；無法解析、nan 或 inf 時忽略標頭。
+    """
+    limit = config['LLM_REQUEST_DEADLINE']
+    try:
+        requested = float(requested)
+    except (TypeError, ValueError):
+        return limit
+    if not math.isfinite(requested):
+        return limit
+    return min(limit, max(config['LLM_MIN_REQUEST_DEADLINE'], requested))
+
+class LLMEndpointCall(NamedTuple):
+    """
+    一次端點 LLM 呼叫的提示與結果建立方式（同步與 ASGI 模式共用，兩種模式只差在如何等待上游）
+
+    build 以 AI 回應內容建立端點結果，rule_based 產生斷路器開啟且沒有最近回應時的降級內容。
+    """
+    insight_type: str
+    messages: List[Dict[str, str]]
+    build: Callable[[str], Dict[str, Any]]
+    rule_based: Callable[[], str]
+    error_message: str
+
+    def result(self, last_responses, response):
+        """由 chat completion 回應建立結果並記住回應，回傳 (結果, 200)"""
+        ai_response = response['choices'][0]['message']['content']
+        remember_response(last_responses, self.messages, ai_response)
+        return self.build(ai_response), 200
+
+    def failure(self, last_responses, error):
+        """呼叫失敗時的 (結果, HTTP 狀態碼)：斷路器開啟時回傳降級內容，其他錯誤回傳 500"""
+        if isinstance(error, CircuitOpenError):
+            return self.degraded(last_responses, error)[1], 200
+        logging.error(f"OpenAI API Error: {str(error)}", exc_info=error)
+        return {'status': 'error', 'message': self.error_message}, 500
+
+    def degraded(self, last_responses, error):
+        """斷路器開啟時的 (降級內容, 降級結果)：優先使用最近一次的 AI 回應，否則以規則產生"""
+        logging.warning(f"LLM circuit open, serving degraded {self.insight_type}: {error}")
+        content, source = degraded_content(last_responses, self.messages, self.rule_based)
+        return content, degraded_result(self.build(content), source)
+
+    def stream_done(self, last_responses, parts):
+        """串流完成後的事件"""
+        ai_response = ''.join(parts)
+        remember_response(last_responses, self.messages, ai_response)
+        return [('done', self.build(ai_response))]
+
+    def stream_failure(self, last_responses, error):
+        """串流失敗時的事件：降級時先以一個 token 事件送出降級內容"""
+        if isinstance(error, CircuitOpenError):
+            content, result = self.degraded(last_responses, error)
+            return [('token', {'content': content}), ('done', result)]
+        return [('error', self.failure(last_responses, error)[0])]
+
+def city_analysis_call(data):
+    """
+    解析 /api/analyze/city 的請求內容
+
+    Returns:
+        (LLMEndpointCall, None)，或請求無效時 (None, (錯誤回應, HTTP 狀態碼))
+    """
+    if not isinstance(data, dict):
+        return None, ({'status': 'error', 'message': '請求內容必須為 JSON 物件'}, 400)
+    sport = data.get('sport')
+    location = data.get('location', '台北市')
+    weather = data.get('weather', '晴天')
+    time = data.get('time', '早晨')
+    if not sport:
+        logging.warning('未提供運動類型')
+        return None, ({'status': 'error', 'message': '請選擇運動類型'}, 400)
+    if not openai_api_key:
+        logging.error('AI 金鑰未設定')
+        return None, ({'status': 'error', 'message': 'AI 金鑰未設定，請聯絡管理員'}, 500)
+    return LLMEndpointCall(
+        insight_type='city_analysis',
+        messages=build_city_analysis_messages(sport, location, weather, time),
+        build=lambda content: city_analysis_result(content, sport, location, weather, time),
+        rule_based=lambda: rule_based_city_analysis(sport, location, weather, time),
+        error_message='AI 分析服務暫時無法使用，請稍後再試'
+    ), None
+
+def hotspots_call(location):
+    location = location.strip()
+    return LLMEndpointCall(
+        insight_type='city_hotspots',
+        messages=build_hotspots_messages(location),
+        build=lambda content: {'status': 'success', 'location': location, 'hotspots': content},
+        rule_based=lambda: rule_based_hotspots(location),
+        error_message='無法獲取城市運動熱點信息'
+    )
+
+def wants_stream(data, accept):
+    """請求內容的 stream 或 Accept: text/event-stream 要求以 SSE 串流回應"""
+    return bool(data.get('stream')) or 'text/event-stream' in accept
+
+def chunk_content(chunk):
+    """串流 chunk 中的文字內容，沒有時為 None"""
+    return chunk['choices'][0].get('delta', {}).get('content') if chunk.get('choices') else None
+
+def build_city_analysis_messages(sport, location, weather, time):
+    return [
+        {"role": "system", "content": "你是一個專業的城市運動分析師，請根據用戶的運動類型、地點、天氣和時間提供專業的分析和建議。"},
+        {"role": "user", "content": f"""
                     請分析以下運動情況：
                     1. 運動類型：{get_sport_name(sport)}
                     2. 地點：{location}
@@ -97,65 +351,84 @@ def create_app():
                     4. 運動強度建議
                     5. 裝備建議
                     """}
-                ]
-            )
-            logging.info(f'OpenAI 回應: {response}')
-            ai_response = response.choices[0].message.content
-            
-            # 格式化分析結果
-            analysis_result = {
-                'status': 'success',
-                'sport': sport,
-                'location': location,
-                'weather': weather,
-                'time': time,
-                'analysis': {
-                    'ai_response': ai_response,
-                    'timestamp': datetime.now().isoformat()
-                }
-            }
-            logging.info('分析成功，回傳結果')
-            return jsonify(analysis_result)
-            
-        except Exception as e:
-            logging.error(f"OpenAI API Error: {str(e)}", exc_info=True)
-            return jsonify({
-                'status': 'error',
-                'message': 'AI 分析服務暫時無法使用，請稍後再試'
-            }), 500
-    
-    # 獲取城市運動熱點
-    @app.route('/api/city/hotspots', methods=['GET'])
-    def get_city_hotspots():
-        location = request.args.get('location', '台北市')
-        
-        try:
-            # 使用 OpenAI API 獲取熱點信息
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "你是一個專業的城市運動規劃師，請提供城市中適合運動的地點和路線建議。"},
-                    {"role": "user", "content": f"請提供{location}的運動熱點，包括：\n1. 公園\n2. 運動場\n3. 自行車道\n4. 跑步路線\n5. 每個地點的適合運動類型"}
-                ]
-            )
-            
-            # 解析 AI 回應
-            ai_response = response.choices[0].message.content
-            
-            return jsonify({
-                'status': 'success',
-                'location': location,
-                'hotspots': ai_response
-            })
-            
-        except Exception as e:
-            logging.error(f"OpenAI API Error: {str(e)}", exc_info=True)
-            return jsonify({
-                'status': 'error',
-                'message': '無法獲取城市運動熱點信息'
-            }), 500
-    
-    return app
+    ]
+
+def build_hotspots_messages(location):
+    return [
+        {"role": "system", "content": "你是一個專業的城市運動規劃師，請提供城市中適合運動的地點和路線建議。"},
+        {"role": "user", "content": f"請提供{location}的運動熱點，包括：\n1. 公園\n2. 運動場\n3. 自行車道\n4. 跑步路線\n5. 每個地點的適合運動類型"}
+    ]
+
+def city_analysis_result(ai_response, sport, location, weather, time):
+    # 格式化分析結果
+    return {
+        'status': 'success',
+        'sport': sport,
+        'location': location,
+        'weather': weather,
+        'time': time,
+        'analysis': {
+            'ai_response': ai_response,
+            'timestamp': datetime.now().isoformat()
+        }
+    }
+
+# 降級回應的說明文字
+DEGRADED_NOTICES = {
+    'cached': 'AI 分析服務暫時無法使用，以下為最近一次的分析結果',
+    'rule_based': 'AI 分析服務暫時無法使用，以下為系統依規則產生的建議',
+}
+
+def remember_response(last_responses, messages, content):
+    last_responses.set(prompt_key(CHAT_MODEL, messages), {'content': content})
+
+def degraded_content(last_responses, messages, rule_based):
+    """回傳 (降級內容, 來源)：優先使用最近一次的 AI 回應，否則以規則產生"""
+    cached = last_responses.get(prompt_key(CHAT_MODEL, messages), count=False)
+    if cached is not None:
+        return cached['content'], 'cached'
+    return rule_based(), 'rule_based'
+
+def degraded_result(result, source):
+    # 標記為降級回應，前端據此顯示提示
+    result.update({
+        'degraded': True,
+        'degraded_source': source,
+        'notice': DEGRADED_NOTICES[source]
+    })
+    return result
+
+def rule_based_city_analysis(sport, location, weather, time):
+    """不經 AI、依天氣與時段產生的基本建議"""
+    if '雨' in weather:
+        weather_tip = '路面濕滑，建議縮短距離或改為室內運動'
+    elif '熱' in weather or '晴' in weather:
+        weather_tip = '注意補充水分與防曬，避開正午高溫時段'
+    elif '冷' in weather or '寒' in weather:
+        weather_tip = '延長暖身時間並注意保暖'
+    else:
+        weather_tip = '出發前留意即時天氣與空氣品質'
+    if '晚' in time or '夜' in time:
+        safety_tip = '穿著反光衣物，選擇照明充足的路段'
+    else:
+        safety_tip = '告知親友運動路線，攜帶手機與證件'
+    return "\n".join([
+        f"1. 路線建議：選擇{location}熟悉、人車分道的公園或河濱路線進行{get_sport_name(sport)}",
+        f"2. 天氣注意事項：{weather_tip}",
+        f"3. 安全建議：{safety_tip}",
+        "4. 運動強度建議：以可以正常對話的中低強度為主，循序漸進",
+        "5. 裝備建議：合適的運動鞋與透氣衣物，並攜帶飲水",
+    ])
+
+def rule_based_hotspots(location):
+    """不經 AI 的一般性熱點建議"""
+    return "\n".join([
+        f"1. 公園：{location}的大型都會公園適合慢跑、健走與瑜伽",
+        "2. 運動場：學校操場與運動中心適合跑步與球類運動",
+        "3. 自行車道：河濱自行車道適合騎乘與長距離慢跑",
+        "4. 跑步路線：選擇照明充足、人車分道的環狀路線",
+        "5. 建議使用地圖服務查詢最新的開放時間與設施",
+    ])
 
 def get_sport_name(sport_id):
     sport_names = {
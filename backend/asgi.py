@@ -0,0 +1,220 @@
+"""
+ASGI 服務模式
+
+LLM 端點（/api/analyze/city、/api/city/hotspots）直接在事件迴圈上以 AsyncLLMGateway 呼叫上游，
+等待 OpenAI 的數秒內不佔用執行緒；請求解析與結果建立沿用 backend/app.py 的函式，回應內容與同步模式相同。
+其他端點仍由 create_app() 的 Flask 應用程式處理（經 a2wsgi 在執行緒池中執行）；
+/api/users/<id>/insights 只讀取資料庫（LLM 在背景執行緒中呼叫），不需要移到事件迴圈上。
+
+啟動：uvicorn --factory backend.asgi:create_asgi_app --host 0.0.0.0 --port 5000
+"""
+import json
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+from backend.app import (
+    CHAT_MODEL, chunk_content, city_analysis_call, create_app, hotspots_call, llm_request_budget, wants_stream
+)
+from backend.utils.async_llm_gateway import AsyncLLMGateway
+from backend.utils.llm_gateway import get_gateway, reset_deadline, set_deadline
+from backend.utils.llm_telemetry import llm_labels, reset_llm_labels, set_llm_labels
+from backend.utils.single_flight import llm_async_single_flight, prompt_key
+from backend.utils.sse import SSE_HEADERS, format_sse
+
+# 與 Flask 的 CORS(app) 預設值相同
+CORS_HEADERS = [(b"access-control-allow-origin", b"*")]
+
+# httpx 以 INFO 記錄每個請求，與同步模式（requests）一致只保留警告以上
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+
+class AsyncApp:
+    """
+    ASGI 應用程式：LLM 端點以 async 處理，其餘請求交給 Flask
+
+    Args:
+        flask_app: create_app() 建立的 Flask 應用程式
+        gateway: 非同步 LLM 閘道
+        sync_threads: 執行 Flask 端點的執行緒數
+    """
+
+    def __init__(self, flask_app, gateway: AsyncLLMGateway, sync_threads: int = 16):
+        self.flask_app = flask_app
+        self.gateway = gateway
+        self.wsgi = WSGIMiddleware(flask_app.wsgi_app, workers=sync_threads)
+        self.last_responses = flask_app.extensions['llm_last_responses']
+        # (方法, 路徑) -> (端點名稱, 處理函式)；端點名稱與 Flask 相同，遙測標籤在兩種模式下一致
+        self.routes: Dict[tuple, tuple] = {
+            ('POST', '/api/analyze/city'): ('analyze_city_sport', self.analyze_city_sport),
+            ('GET', '/api/city/hotspots'): ('get_city_hotspots', self.get_city_hotspots),
+        }
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        route = self.routes.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if route is None:
+            await self.wsgi(scope, receive, send)
+            return
+        endpoint, handler = route
+        deadline_token = set_deadline(self.request_budget(scope))
+        labels_token = set_llm_labels(endpoint=endpoint)
+        try:
+            await handler(scope, receive, send)
+        finally:
+            reset_llm_labels(labels_token)
+            reset_deadline(deadline_token)
+
+    async def lifespan(self, receive: Callable, send: Callable) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.gateway.aclose()
+                self.wsgi.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def request_budget(self, scope: Dict[str, Any]) -> float:
+        # 與 Flask 的 before_request 相同（見 llm_request_budget）
+        return llm_request_budget(header(scope, 'x-request-timeout') or None, self.flask_app.config)
+
+    async def create_completion(self, model, messages):
+        """呼叫 chat completion；同時進行中的相同提示共用一次上游呼叫"""
+        return await llm_async_single_flight.do(prompt_key(model, messages), self.gateway.chat, model, messages)
+
+    async def send_json(self, send: Callable, payload: Any, status: int = 200) -> None:
+        # 以 Flask 的 JSON provider 編碼，回應內容與 jsonify 相同
+        body = (self.flask_app.json.dumps(payload) + '\n').encode('utf-8')
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(body)).encode())] + CORS_HEADERS})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def analyze_city_sport(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        logging.info('收到 /api/analyze/city 請求 (async)')
+        try:
+            data = json.loads(await read_body(receive) or b'null')
+        except ValueError:
+            data = None
+        call, error = city_analysis_call(data)
+        if error is not None:
+            await self.send_json(send, *error)
+            return
+        if wants_stream(data, header(scope, 'accept')):
+            await self.send_sse(receive, send, self.stream_completion(call))
+            return
+        await self.send_json(send, *await self.complete(call))
+
+    async def complete(self, call):
+        """呼叫 LLM 並建立端點結果，回傳 (結果, HTTP 狀態碼)"""
+        try:
+            with llm_labels(insight_type=call.insight_type):
+                response = await self.create_completion(CHAT_MODEL, call.messages)
+            return call.result(self.last_responses, response)
+        except Exception as e:
+            return call.failure(self.last_responses, e)
+
+    async def stream_completion(self, call):
+        """以串流模式呼叫 OpenAI，逐段送出 token 事件，最後送出與非串流模式相同的結果"""
+        parts = []
+        try:
+            with llm_labels(insight_type=call.insight_type):
+                stream = self.gateway.stream_chat(CHAT_MODEL, call.messages)
+            async for chunk in stream:
+                content = chunk_content(chunk)
+                if content:
+                    parts.append(content)
+                    yield 'token', {'content': content}
+        except Exception as e:
+            for event in call.stream_failure(self.last_responses, e):
+                yield event
+            return
+        for event in call.stream_done(self.last_responses, parts):
+            yield event
+
+    async def send_sse(self, receive: Callable, send: Callable, events) -> None:
+        """送出 SSE 回應；客戶端中斷連線時取消串流，上游呼叫隨之結束"""
+        headers = [(b'content-type', b'text/event-stream; charset=utf-8')] + CORS_HEADERS
+        headers += [(name.lower().encode(), value.encode()) for name, value in SSE_HEADERS.items()]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+        async def pump():
+            try:
+                async for event, data in events:
+                    await send({'type': 'http.response.body', 'body': format_sse(event, data).encode('utf-8'),
+                                'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            finally:
+                await events.aclose()
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        streaming, watcher = asyncio.ensure_future(pump()), asyncio.ensure_future(disconnected())
+        done, _ = await asyncio.wait({streaming, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        for task in (streaming, watcher):
+            if task not in done:
+                task.cancel()
+        if streaming in done:
+            streaming.result()
+        else:
+            logging.info('客戶端中斷串流連線')
+            await asyncio.gather(streaming, return_exceptions=True)
+
+    async def get_city_hotspots(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        await self.send_json(send, *await self.complete(hotspots_call(query_param(scope, 'location', '台北市'))))
+
+
+async def read_body(receive: Callable) -> bytes:
+    """讀取完整的 ASGI 請求內容"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+def header(scope: Dict[str, Any], name: str) -> str:
+    """取得請求標頭（name 為小寫），沒有時回傳空字串"""
+    for raw_name, raw_value in scope.get('headers', []):
+        if raw_name.decode('latin-1').lower() == name:
+            return raw_value.decode('latin-1')
+    return ''
+
+
+def query_param(scope: Dict[str, Any], name: str, default: str = '') -> str:
+    """取得查詢參數的第一個值"""
+    values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(name)
+    return values[0] if values else default
+
+
+def create_asgi_app(flask_app=None, gateway: Optional[AsyncLLMGateway] = None,
+                    sync_threads: Optional[int] = None) -> AsyncApp:
+    """
+    建立 ASGI 應用程式
+
+    Args:
+        flask_app: 處理非 LLM 端點的 Flask 應用程式，預設為 create_app()
+        gateway: 非同步 LLM 閘道，預設沿用 get_gateway() 的設定並共用其斷路器與重試預算，連線上限取 flask_app.config 的 LLM_ASYNC_MAX_CONNECTIONS
+        sync_threads: 執行 Flask 端點的執行緒數，預設取 flask_app.config 的 ASGI_SYNC_THREADS
+
+    Returns:
+        AsyncApp: ASGI 應用程式
+    """
+    flask_app = flask_app or create_app()
+    gateway = gateway or AsyncLLMGateway.from_gateway(
+        get_gateway(flask_app.config), max_connections=flask_app.config['LLM_ASYNC_MAX_CONNECTIONS'])
+    flask_app.extensions['async_llm_gateway'] = gateway
+    return AsyncApp(flask_app, gateway, sync_threads or flask_app.config['ASGI_SYNC_THREADS'])
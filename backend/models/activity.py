@@ -0,0 +1,78 @@
+from datetime import datetime
+from backend.extensions import db
+
+class Activity(db.Model):
+    """活動模型"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    title = db.Column(db.String(100), nullable=False)
+    type = db.Column(db.String(50), nullable=False)
+    date = db.Column(db.DateTime, nullable=False)
+    duration = db.Column(db.Integer)  # 以秒為單位
+    distance = db.Column(db.Float)    # 以公尺為單位
+    calories = db.Column(db.Integer)
+    heart_rate_avg = db.Column(db.Integer)
+    heart_rate_max = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # 單次活動的分析，以及以此活動為資料截止點的用戶洞察
+    analyses = db.relationship('ActivityAnalysis', backref='activity', lazy=True, cascade='all, delete-orphan')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'title': self.title,
+            'type': self.type,
+            'date': self.date.isoformat(),
+            'duration': self.duration,
+            'distance': self.distance,
+            'calories': self.calories,
+            'heart_rate_avg': self.heart_rate_avg,
+            'heart_rate_max': self.heart_rate_max
+        }
+
+    def __repr__(self):
+        return f'<Activity {self.id} {self.type}>'
+
+class ActivityAnalysis(db.Model):
+    """
+    活動分析模型
+
+    insight_type 為空時是單次活動的分析；否則為用戶層級的洞察（由批次預先產生），
+    activity_id 指向產生當時該用戶最後更新的活動，activities_updated_at / activity_count
+    用來判斷之後是否有新增、修改或刪除的活動。
+    """
+    __table_args__ = (db.Index('ix_activity_analysis_user_insight', 'user_id', 'insight_type'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    activity_id = db.Column(db.Integer, db.ForeignKey('activity.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    insight_type = db.Column(db.String(50))
+    raw_analysis = db.Column(db.Text)
+    formatted_analysis = db.Column(db.Text)
+    suggestions = db.Column(db.JSON)
+    activities_updated_at = db.Column(db.DateTime)  # 產生時該用戶活動的最後更新時間
+    activity_count = db.Column(db.Integer)          # 產生時該用戶的活動數（偵測刪除）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @classmethod
+    def latest_insight(cls, user_id, insight_type):
+        return cls.query.filter_by(user_id=user_id, insight_type=insight_type).order_by(cls.updated_at.desc()).first()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'activity_id': self.activity_id,
+            'user_id': self.user_id,
+            'insight_type': self.insight_type,
+            'raw': self.raw_analysis,
+            'formatted': self.formatted_analysis,
+            'suggestions': self.suggestions or [],
+            'generated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+    def __repr__(self):
+        return f'<ActivityAnalysis {self.id} {self.insight_type or "activity"}>'
@@ -1,12 +1,50 @@
-import openai
 import os
-from typing import Dict, Any
+import asyncio
+import threading
+import contextvars
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from backend.utils.response_cache import ResponseCache, create_response_cache, make_cache_key
+from backend.utils.circuit_breaker import CircuitOpenError
+from backend.utils.llm_gateway import LLMGateway, get_gateway, request_deadline
+from backend.utils.rate_limiter import RateLimiter
+from backend.utils.single_flight import SingleFlight, llm_single_flight, prompt_key
+from backend.utils.activity_features import prompt_size, render_features, summarize_for_prompt
+from backend.utils.llm_telemetry import llm_labels, llm_telemetry
+from backend.utils.response_formatter import ResponseFormatter, format_structured
+from backend.utils.training_load import TrainingLoadEngine, activities_to_frame
+from config.config import Config
+
+# 使用本機訓練負荷指標的洞察類型：LLM 只負責解讀數字，numbers_only 時完全不呼叫 LLM
+LOAD_INSIGHTS = ("training_load", "recovery")
 
 class AIAnalyzer:
-    def __init__(self, api_key: str = None, model: str = "gpt-4"):
+    def __init__(self, api_key: str = None, model: str = "gpt-4", cache: ResponseCache = None, prompt_token_budget: int = 600, single_flight: SingleFlight = None, gateway: LLMGateway = None, numbers_only: bool = False, rate_limiter: RateLimiter = None):
         self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        # 預設與 app.py 共用連線池與重試預算；指定不同金鑰時另建閘道
+        if gateway is None:
+            gateway = LLMGateway(api_key=api_key) if api_key else get_gateway()
+        self.gateway = gateway
         self.model = model
-        openai.api_key = self.api_key
+        # 訓練負荷類洞察只回傳本機計算的指標，不呼叫 LLM
+        self.numbers_only = numbers_only
+        # 活動歷史濃縮成特徵區塊後的 token 上限
+        self.prompt_token_budget = prompt_token_budget
+        self._prompt_stats = {"prompts": 0, "total_tokens": 0, "max_tokens": 0}
+        self._stats_lock = threading.Lock()
+        # 預設與 app.py 共用同一個實例，跨 AIAnalyzer 實例與請求執行緒合併相同的呼叫
+        self.single_flight = single_flight or llm_single_flight
+        # 回應快取，預設依 Config 的 LLM_CACHE_* 設定選擇後端（memory / sqlite / flask）；
+        # create_app 建立的實例會傳入依 app.config 建立的快取
+        self.cache = cache or create_response_cache(
+            backend=Config.LLM_CACHE_BACKEND,
+            ttl=Config.LLM_CACHE_TTL,
+            max_entries=Config.LLM_CACHE_MAX_ENTRIES,
+            path=Config.LLM_CACHE_PATH
+        )
+        # 指定時每次實際呼叫 LLM 前取得額度；快取命中與合併的呼叫不消耗額度
+        self.rate_limiter = rate_limiter
 
     def build_prompt(self, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None) -> str:
         """
@@ -19,7 +57,7 @@ class AIAnalyzer:
 {user_profile}
 
 [活動摘要]
-{activity_summary}
+{self._format_summary(activity_summary)}
 """
         if goal:
             prompt += f"\n[目標]\n{goal}\n"
@@ -28,22 +66,245 @@ class AIAnalyzer:
 
     def analyze(self, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None) -> Dict[str, Any]:
         """
-        呼叫 OpenAI API 進行分析，並解析回應
+        呼叫 LLM API 進行分析，並解析回應
         """
+        activity_summary = self.summarize_history(activity_summary, user_profile)
         prompt = self.build_prompt(user_profile, activity_summary, goal)
+        return self._complete(prompt, "analyze", user_profile, activity_summary, goal)
+
+    def _complete(self, prompt: str, insight_type: str, user_profile: Dict[str, Any],
+                  activity_summary: Dict[str, Any], goal: str = None) -> Dict[str, Any]:
+        """
+        呼叫 LLM API 並解析回應；相同 (model, insight_type, 提示輸入) 的結果直接由快取回傳
+        """
+        key = make_cache_key(self.model, insight_type, user_profile=user_profile,
+                             activity_summary=activity_summary, goal=goal)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with llm_labels(insight_type=insight_type):
+                llm_telemetry.record_cache_hit(self.model)
+            return cached
+        # 同時進行中的相同提示只呼叫一次 API，其他執行緒共用結果
+        messages = self._messages(prompt)
+        flight_key = prompt_key(self.model, messages, temperature=0.7, max_tokens=512)
+        return self.single_flight.do(flight_key, self._request, key, prompt, messages,
+                                     insight_type, user_profile, activity_summary)
+
+    def _request(self, key: str, prompt: str, messages: List[Dict[str, str]], insight_type: str,
+                 user_profile: Dict[str, Any], activity_summary: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        實際呼叫 LLM API，成功的結果寫入快取；斷路器開啟時回傳降級回應
+        """
+        self._record_prompt(prompt)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一位專業運動教練與數據分析師。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=512
-            )
-            return self.parse_response(response)
+            with llm_labels(insight_type=insight_type):
+                response = self.gateway.chat(
+                    self.model,
+                    messages,
+                    temperature=0.7,
+                    max_tokens=512
+                )
+            result = self.parse_response(response)
+        except CircuitOpenError as e:
+            return self._degraded_response(insight_type, user_profile, activity_summary, str(e))
         except Exception as e:
             return {"error": str(e)}
+        self._store(key, insight_type, user_profile, result)
+        return result
+
+    def _store(self, key: str, insight_type: str, user_profile: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """
+        寫入快取，並記錄為該用戶此洞察類型的最近一次結果（降級時使用）
+        """
+        self.cache.set(key, result)
+        last_key = self._last_insight_key(insight_type, user_profile)
+        if last_key:
+            self.cache.set(last_key, result)
+
+    def _last_insight_key(self, insight_type: str, user_profile: Dict[str, Any]) -> Optional[str]:
+        user = user_profile.get("user_id") or user_profile.get("id") or user_profile.get("name")
+        if user is None:
+            return None
+        return make_cache_key(self.model, insight_type, last_insight_for=user)
+
+    def _degraded_response(self, insight_type: str, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], reason: str) -> Dict[str, Any]:
+        """
+        LLM 無法使用時的降級回應：優先使用該用戶最近一次的洞察，否則以規則產生摘要；
+        回應標記 degraded 與來源（cached / rule_based）
+        """
+        last_key = self._last_insight_key(insight_type, user_profile)
+        cached = self.cache.get(last_key, count=False) if last_key else None
+        if cached is not None:
+            result, source = cached, "cached"
+            notice = "AI 分析暫時無法使用，以下為最近一次的分析結果"
+        else:
+            result = self.create_structured_response(self.rule_based_insight(insight_type, activity_summary))
+            source = "rule_based"
+            notice = "AI 分析暫時無法使用，以下為依據數據計算的摘要"
+        result.update({"degraded": True, "degraded_source": source, "degraded_reason": reason, "notice": notice})
+        return result
+
+    def rule_based_insight(self, insight_type: str, activity_summary: Dict[str, Any]) -> str:
+        """
+        不經 LLM、依活動摘要的數值產生條列式摘要
+        """
+        lines = []
+        summary = activity_summary if isinstance(activity_summary, dict) else {}
+        if insight_type in LOAD_INSIGHTS and summary.get("training_load"):
+            return "\n".join(TrainingLoadEngine.interpret(summary["training_load"]))
+        totals = summary.get("totals")
+        if totals is not None:
+            lines.append(f"- 共 {totals.get('activities', 0)} 次活動，累計 {totals.get('distance_km', 0)} 公里")
+            trends = summary.get("trends", {})
+            slope = trends.get("distance_km_per_week")
+            if slope:
+                direction = "上升" if slope > 0 else "下降"
+                lines.append(f"- 近期週距離呈{direction}趨勢（每週 {slope:+.1f} 公里）")
+            hr_slope = trends.get("avg_hr_per_week")
+            if hr_slope and hr_slope > 1:
+                lines.append("- 平均心率逐週升高，注意疲勞累積")
+        else:
+            if summary.get("distance"):
+                lines.append(f"- 距離 {float(summary['distance']) / 1000:.1f} 公里")
+            if summary.get("duration"):
+                lines.append(f"- 時間 {float(summary['duration']) / 60:.0f} 分鐘")
+            heart_rate = summary.get("avg_heart_rate")
+            if heart_rate:
+                level = "偏高，建議安排恢復日" if float(heart_rate) >= 160 else "在有氧範圍內"
+                lines.append(f"- 平均心率 {float(heart_rate):.0f}，{level}")
+        advice = {
+            "training_load": "- 建議每週訓練量增幅不超過 10%",
+            "recovery": "- 建議每週至少安排 1 至 2 天恢復日",
+            "goal_progress": "- 請持續記錄活動以追蹤目標進度",
+            "performance_trends": "- 維持規律訓練，比較相同路線的配速與心率以觀察進步",
+        }
+        lines.append(advice.get(insight_type, "- 維持規律訓練並注意充分休息"))
+        return "\n".join(lines)
+
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "你是一位專業運動教練與數據分析師。"},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _stream_complete(self, prompt: str, insight_type: str, user_profile: Dict[str, Any],
+                         activity_summary: Dict[str, Any], goal: str = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        以串流模式呼叫 LLM API；快取命中時直接送出完整內容
+        """
+        key = make_cache_key(self.model, insight_type, user_profile=user_profile,
+                             activity_summary=activity_summary, goal=goal)
+        cached = self.cache.get(key)
+        if cached is not None:
+            with llm_labels(insight_type=insight_type):
+                llm_telemetry.record_cache_hit(self.model)
+            yield "token", {"content": cached["raw"], "formatted": cached["formatted"]}
+            yield "done", cached
+            return
+        formatter = ResponseFormatter()
+        self._record_prompt(prompt)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        try:
+            with llm_labels(insight_type=insight_type):
+                response = self.gateway.stream_chat(
+                    self.model,
+                    self._messages(prompt),
+                    temperature=0.7,
+                    max_tokens=512
+                )
+            for chunk in response:
+                content = chunk["choices"][0].get("delta", {}).get("content")
+                if content:
+                    # 邊接收邊格式化，formatted 為這段輸出完成的行（可能為空字串）
+                    yield "token", {"content": content, "formatted": formatter.feed(content)}
+        except CircuitOpenError as e:
+            degraded = self._degraded_response(insight_type, user_profile, activity_summary, str(e))
+            yield "token", {"content": degraded["raw"], "formatted": degraded["formatted"]}
+            yield "done", degraded
+            return
+        except Exception as e:
+            yield "error", {"error": str(e)}
+            return
+        result = formatter.result()
+        self._store(key, insight_type, user_profile, result)
+        yield "done", result
+
+    def summarize_history(self, activity_summary: Any, user_profile: Dict[str, Any] = None) -> Any:
+        """
+        將活動歷史（DataFrame、活動 dict 或 Activity 物件列表）濃縮為符合 prompt_token_budget 的特徵區塊，
+        並附上本機計算的訓練負荷指標（training_load）；已是摘要 dict 時原樣回傳
+        """
+        if not isinstance(activity_summary, (pd.DataFrame, list)):
+            return activity_summary
+        frame = activities_to_frame(activity_summary)
+        metrics = TrainingLoadEngine.for_profile(user_profile).compute(frame) if not frame.empty else None
+        if metrics is None:
+            return summarize_for_prompt(frame, self.prompt_token_budget)
+        load_tokens = prompt_size(render_features({"training_load": metrics}))["tokens"]
+        features = summarize_for_prompt(frame, max(self.prompt_token_budget - load_tokens, 1))
+        features["training_load"] = metrics
+        return features
+
+    def _load_note(self, activity_summary: Any) -> str:
+        """摘要含訓練負荷指標時，要求 LLM 直接引用而不重新計算"""
+        if isinstance(activity_summary, dict) and activity_summary.get("training_load"):
+            return "\n[活動摘要] 中的 training_load（ATL/CTL/TSB/ACWR/單調性/壓力）已由系統計算，請直接引用這些數值解讀，不要自行重新計算。"
+        return ""
+
+    def numbers_only_response(self, insight_type: str, activity_summary: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        不呼叫 LLM，只以本機計算的訓練負荷指標產生回應（附 metrics）
+        """
+        metrics = activity_summary["training_load"]
+        result = self.create_structured_response("\n".join(TrainingLoadEngine.interpret(metrics)))
+        result.update({"metrics": metrics, "numbers_only": True})
+        return result
+
+    def _use_numbers_only(self, insight_type: str, activity_summary: Any, numbers_only: Optional[bool]) -> bool:
+        if numbers_only is None:
+            numbers_only = self.numbers_only
+        return (numbers_only and insight_type in LOAD_INSIGHTS
+                and isinstance(activity_summary, dict) and bool(activity_summary.get("training_load")))
+
+    def _format_summary(self, activity_summary: Any) -> str:
+        """
+        活動摘要在提示中的精簡表示
+        """
+        activity_summary = self.summarize_history(activity_summary)
+        if isinstance(activity_summary, dict):
+            return render_features(activity_summary)
+        return str(activity_summary)
+
+    def _record_prompt(self, prompt: str) -> None:
+        size = prompt_size(prompt)
+        with self._stats_lock:
+            self._prompt_stats["prompts"] += 1
+            self._prompt_stats["total_tokens"] += size["tokens"]
+            self._prompt_stats["max_tokens"] = max(self._prompt_stats["max_tokens"], size["tokens"])
+
+    def prompt_stats(self) -> Dict[str, Any]:
+        """
+        已送出提示的數量與估算 token 數（總計、平均、最大）
+        """
+        with self._stats_lock:
+            stats = dict(self._prompt_stats)
+        stats["avg_tokens"] = round(stats["total_tokens"] / stats["prompts"], 1) if stats["prompts"] else 0.0
+        return stats
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        回應快取的命中/未命中統計
+        """
+        return self.cache.stats()
+
+    def single_flight_stats(self) -> Dict[str, int]:
+        """
+        實際 API 呼叫數與被合併的呼叫數
+        """
+        return self.single_flight.stats()
 
     def parse_response(self, response: Any) -> Dict[str, Any]:
         """
@@ -58,57 +319,158 @@ class AIAnalyzer:
     # ----------- 分析模板區 -----------
     def template_performance_trends(self, user_profile, activity_summary):
         return f"""
-請根據以下運動數據，分析近期表現趨勢，指出進步與待加強之處：\n[用戶資料]\n{user_profile}\n[活動摘要]\n{activity_summary}\n請條列說明趨勢與建議。
+請根據以下運動數據，分析近期表現趨勢，指出進步與待加強之處：\n[用戶資料]\n{user_profile}\n[活動摘要]\n{self._format_summary(activity_summary)}\n請條列說明趨勢與建議。
 """
 
     def template_training_load(self, user_profile, activity_summary):
         return f"""
-請根據以下運動數據，分析訓練負荷是否適當，並給出調整建議：\n[用戶資料]\n{user_profile}\n[活動摘要]\n{activity_summary}\n請條列說明訓練負荷與建議。
+請根據以下運動數據，分析訓練負荷是否適當，並給出調整建議：\n[用戶資料]\n{user_profile}\n[活動摘要]\n{self._format_summary(activity_summary)}{self._load_note(activity_summary)}\n請條列說明訓練負荷與建議。
 """
 
     def template_recovery(self, user_profile, activity_summary):
         return f"""
-請根據以下運動數據，分析恢復狀態，並給出恢復建議：\n[用戶資料]\n{user_profile}\n[活動摘要]\n{activity_summary}\n請條列說明恢復狀態與建議。
+請根據以下運動數據，分析恢復狀態，並給出恢復建議：\n[用戶資料]\n{user_profile}\n[活動摘要]\n{self._format_summary(activity_summary)}{self._load_note(activity_summary)}\n請條列說明恢復狀態與建議。
 """
 
     def template_goal_progress(self, user_profile, activity_summary, goal):
         return f"""
-請根據以下運動數據，分析目標達成進度，指出目前進展與後續建議：\n[用戶資料]\n{user_profile}\n[活動摘要]\n{activity_summary}\n[目標]\n{goal}\n請條列說明進度與建議。
+請根據以下運動數據，分析目標達成進度，指出目前進展與後續建議：\n[用戶資料]\n{user_profile}\n[活動摘要]\n{self._format_summary(activity_summary)}\n[目標]\n{goal}\n請條列說明進度與建議。
 """
 
     # ----------- 洞察生成邏輯 -----------
-    def generate_insight(self, insight_type: str, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None, personalization: Dict[str, Any] = None) -> Dict[str, Any]:
+    def generate_insight(self, insight_type: str, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None, personalization: Dict[str, Any] = None, numbers_only: Optional[bool] = None) -> Dict[str, Any]:
         """
         根據 insight_type 產生不同主題的分析洞察，並可加入個人化參數
+
+        training_load / recovery 的負荷指標由 TrainingLoadEngine 在本機計算，LLM 只負責解讀；
+        numbers_only（預設取建構時的設定）為 True 時直接回傳指標，不呼叫 LLM。
         """
         # 個人化處理
         user_profile = self._personalize_profile(user_profile, personalization)
-        
+        activity_summary = self.summarize_history(activity_summary, user_profile)
+        if self._use_numbers_only(insight_type, activity_summary, numbers_only):
+            return self.numbers_only_response(insight_type, activity_summary)
+        prompt = self._insight_prompt(insight_type, user_profile, activity_summary, goal)
+        return self._complete(prompt, insight_type, user_profile, activity_summary, goal)
+
+    def stream_insight(self, insight_type: str, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None, personalization: Dict[str, Any] = None, numbers_only: Optional[bool] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        generate_insight 的串流版本，逐段產生 (事件名稱, 內容)：
+
+        - ("token", {"content": 片段}): 模型每產生一段文字即送出
+        - ("done", 結構化回應): 最後一個事件，內容同 create_structured_response
+        - ("error", {"error": 訊息}): 發生錯誤時取代 done
+        """
+        user_profile = self._personalize_profile(user_profile, personalization)
+        activity_summary = self.summarize_history(activity_summary, user_profile)
+        if self._use_numbers_only(insight_type, activity_summary, numbers_only):
+            result = self.numbers_only_response(insight_type, activity_summary)
+            return iter([("token", {"content": result["raw"], "formatted": result["formatted"]}), ("done", result)])
+        prompt = self._insight_prompt(insight_type, user_profile, activity_summary, goal)
+        return self._stream_complete(prompt, insight_type, user_profile, activity_summary, goal)
+
+    def stream_analyze(self, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        analyze 的串流版本，事件格式同 stream_insight
+        """
+        activity_summary = self.summarize_history(activity_summary, user_profile)
+        prompt = self.build_prompt(user_profile, activity_summary, goal)
+        return self._stream_complete(prompt, "analyze", user_profile, activity_summary, goal)
+
+    def _insight_prompt(self, insight_type: str, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None) -> str:
+        """
+        依洞察類型選擇提示模板
+        """
         if insight_type == "performance_trends":
-            prompt = self.template_performance_trends(user_profile, activity_summary)
-        elif insight_type == "training_load":
-            prompt = self.template_training_load(user_profile, activity_summary)
-        elif insight_type == "recovery":
-            prompt = self.template_recovery(user_profile, activity_summary)
-        elif insight_type == "goal_progress":
-            prompt = self.template_goal_progress(user_profile, activity_summary, goal or "")
-        else:
-            prompt = self.build_prompt(user_profile, activity_summary, goal)
-        
+            return self.template_performance_trends(user_profile, activity_summary)
+        if insight_type == "training_load":
+            return self.template_training_load(user_profile, activity_summary)
+        if insight_type == "recovery":
+            return self.template_recovery(user_profile, activity_summary)
+        if insight_type == "goal_progress":
+            return self.template_goal_progress(user_profile, activity_summary, goal or "")
+        return self.build_prompt(user_profile, activity_summary, goal)
+
+    async def agenerate_insight(self, insight_type: str, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None, personalization: Dict[str, Any] = None, timeout: Optional[float] = 60) -> Dict[str, Any]:
+        """
+        generate_insight 的非同步版本，API 呼叫在背景執行緒中進行，超過 timeout 秒回傳錯誤
+        """
+        return await self._run_insight(None, insight_type, user_profile, activity_summary, goal, personalization, timeout)
+
+    async def agenerate_insights(self, types: List[str], user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None, personalization: Dict[str, Any] = None, max_concurrency: int = 4, timeout: Optional[float] = 60) -> Dict[str, Dict[str, Any]]:
+        """
+        同時產生多種洞察
+
+        Args:
+            types: 洞察類型列表
+            max_concurrency: 同時進行的 API 呼叫上限
+            timeout: 每個呼叫的逾時秒數，None 表示不限
+
+        Returns:
+            Dict[str, Dict[str, Any]]: insight_type -> 結構化回應；失敗或逾時的類型為 {"error": ...}，其餘結果照常回傳
+        """
+        types = list(dict.fromkeys(types))
+        if not types:
+            return {}
+        # 活動歷史只濃縮一次，各洞察共用
+        activity_summary = self.summarize_history(activity_summary, self._personalize_profile(user_profile, personalization))
+        semaphore = asyncio.Semaphore(max_concurrency)
+        # 專用執行緒池：逾時的呼叫不會佔住預設執行緒池，也不阻塞其他洞察
+        executor = ThreadPoolExecutor(max_workers=min(max_concurrency, len(types)), thread_name_prefix="insight")
+
+        async def run(insight_type):
+            async with semaphore:
+                return await self._run_insight(executor, insight_type, user_profile, activity_summary,
+                                               goal, personalization, timeout)
+
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "你是一位專業運動教練與數據分析師。"},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=512
-            )
-            return self.parse_response(response)
+            results = await asyncio.gather(*(run(insight_type) for insight_type in types))
+        finally:
+            executor.shutdown(wait=False)
+        return dict(zip(types, results))
+
+    def generate_insights(self, types: List[str], user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str = None, personalization: Dict[str, Any] = None, max_concurrency: int = 4, timeout: Optional[float] = 60) -> Dict[str, Dict[str, Any]]:
+        """
+        agenerate_insights 的同步介面（供 Flask 等同步程式碼使用），總耗時約為最慢的單一呼叫
+
+        呼叫端已在事件迴圈中（例如 ASGI 模式）時無法再以 asyncio.run 執行，改在另一個執行緒建立事件迴圈；
+        此時呼叫會阻塞目前的事件迴圈直到完成，async 程式碼應直接 await agenerate_insights。
+        """
+        def run():
+            return asyncio.run(self.agenerate_insights(types, user_profile, activity_summary, goal,
+                                                       personalization, max_concurrency, timeout))
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return run()
+        # 沿用呼叫端的 context（包含請求截止時間）
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(context.run, run).result()
+
+    async def _run_insight(self, executor: Optional[ThreadPoolExecutor], insight_type: str, user_profile: Dict[str, Any], activity_summary: Dict[str, Any], goal: str, personalization: Dict[str, Any], timeout: Optional[float]) -> Dict[str, Any]:
+        """
+        在執行緒中執行 generate_insight，將逾時與例外轉為錯誤回應
+
+        執行緒沿用呼叫端的 context（包含請求截止時間），並以 timeout 作為 API 呼叫的截止時間，
+        逾時的上游請求會被中止而不是在背景繼續佔用連線。
+        """
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        call = loop.run_in_executor(executor, context.run, self._generate_within, timeout, insight_type,
+                                    user_profile, activity_summary, goal, personalization)
+        try:
+            return await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError:
+            return {"error": f"Insight generation timed out after {timeout}s"}
         except Exception as e:
             return {"error": str(e)}
 
+    def _generate_within(self, timeout: Optional[float], *args: Any) -> Dict[str, Any]:
+        with request_deadline(timeout):
+            return self.generate_insight(*args)
+
     def _personalize_profile(self, user_profile: Dict[str, Any], personalization: Dict[str, Any] = None) -> Dict[str, Any]:
         """
         根據個人化參數調整用戶資料
@@ -125,59 +487,10 @@ class AIAnalyzer:
         """
         將原始回應內容格式化，支援 Markdown 與 emoji
         """
-        if not raw_content:
-            return ""
-        content = raw_content
-        if use_markdown:
-            content = self._apply_markdown(content)
-        if use_emoji:
-            content = self._add_emoji(content)
-        return content
-
-    def _apply_markdown(self, content: str) -> str:
-        """
-        將條列式內容轉為 Markdown 格式
-        """
-        lines = content.split("\n")
-        formatted_lines = []
-        for line in lines:
-            line = line.strip()
-            if line.startswith("- "):
-                formatted_lines.append(f"* {line[2:]}")
-            else:
-                formatted_lines.append(line)
-        return "\n".join(formatted_lines)
-
-    def _add_emoji(self, content: str) -> str:
-        """
-        根據關鍵字加入 emoji
-        """
-        emoji_map = {
-            "進步": "🚀",
-            "建議": "💡",
-            "注意": "⚠️",
-            "目標": "🎯",
-            "恢復": "🔄",
-            "訓練": "💪",
-            "分析": "📊",
-            "總結": "📝"
-        }
-        for keyword, emoji in emoji_map.items():
-            content = content.replace(keyword, f"{emoji} {keyword}")
-        return content
+        return format_structured(raw_content, use_markdown, use_emoji)["formatted"]
 
     def create_structured_response(self, raw_content: str, use_markdown: bool = True, use_emoji: bool = True) -> Dict[str, Any]:
         """
-        產生結構化回應物件，包含原始內容、格式化內容與建議列表
-        """
-        formatted_content = self.format_response(raw_content, use_markdown, use_emoji)
-        suggestions = []
-        for line in raw_content.split("\n"):
-            line = line.strip("- ")
-            if line:
-                suggestions.append(line)
-        return {
-            "raw": raw_content,
-            "formatted": formatted_content,
-            "suggestions": suggestions
-        }
+        產生結構化回應物件，包含原始內容、格式化內容與建議列表（單次掃描，見 ResponseFormatter）
+        """
+        return format_structured(raw_content, use_markdown, use_emoji)
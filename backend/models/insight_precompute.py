@@ -0,0 +1,237 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.activity import Activity, ActivityAnalysis
+from backend.models.ai_analyzer import AIAnalyzer
+from backend.utils.rate_limiter import RateLimiter
+from backend.utils.llm_telemetry import llm_labels
+
+logger = logging.getLogger(__name__)
+
+# 每位用戶預先產生的標準洞察（goal_progress 需要目標，不預先產生）
+STANDARD_INSIGHTS = ["performance_trends", "training_load", "recovery"]
+
+
+class InsightPrecomputer:
+    """
+    預先產生並保存用戶洞察
+
+    洞察存在 ActivityAnalysis（insight_type 不為空），並記錄產生時的活動版本；
+    讀取時活動沒有變化就直接回傳保存的結果，新增、修改或刪除活動後在背景重新呼叫 LLM，
+    請求本身不等待 LLM 或限流。
+    批次與背景更新各以 max_workers 個執行緒並行處理，所有 LLM 呼叫共用同一個 RateLimiter。
+    """
+
+    def __init__(self, app, analyzer: Optional[AIAnalyzer] = None, insight_types: Optional[List[str]] = None,
+                 max_workers: int = 4, requests_per_minute: float = 60, history_days: int = 180):
+        self.app = app
+        self.analyzer = analyzer or AIAnalyzer()
+        self.insight_types = list(insight_types or STANDARD_INSIGHTS)
+        self.max_workers = max_workers
+        # 只有實際的 LLM 呼叫受限流，回應快取命中不消耗額度
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.analyzer.rate_limiter = self.rate_limiter
+        self.history_days = history_days
+        self._lock = threading.Lock()
+        self._stats = {"generated": 0, "fresh": 0, "failed": 0}
+        # 背景更新：(user_id, insight_type) -> 排隊或執行中的更新，同一項不重複排入
+        self._refresh_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="insight-refresh")
+        self._refreshing: Dict[Tuple[int, str], Future] = {}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """產生、沿用與失敗的洞察數、排隊中的背景更新數，以及限流等待的總秒數"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["refreshing"] = len(self._refreshing)
+        stats["rate_limit_wait_seconds"] = round(self.rate_limiter.waited, 3)
+        return stats
+
+    def active_users(self, days: int = 30) -> List[int]:
+        """最近 days 天內有新增或更新活動的用戶"""
+        since = datetime.utcnow() - timedelta(days=days)
+        rows = db.session.query(Activity.user_id).filter(Activity.updated_at >= since).distinct()
+        return sorted(user_id for user_id, in rows)
+
+    def _activity_version(self, user_id: int):
+        """(最後更新的活動, 最後更新時間, 活動數)；沒有活動時回傳 None"""
+        updated_at, count = db.session.query(func.max(Activity.updated_at), func.count(Activity.id)).filter(
+            Activity.user_id == user_id).one()
+        if not count:
+            return None
+        latest = Activity.query.filter_by(user_id=user_id).order_by(
+            Activity.updated_at.desc(), Activity.id.desc()).first()
+        return latest, updated_at, count
+
+    @staticmethod
+    def is_fresh(analysis: Optional[ActivityAnalysis], version) -> bool:
+        """保存的洞察產生後活動是否沒有變化"""
+        return (analysis is not None and version is not None
+                and analysis.activities_updated_at == version[1] and analysis.activity_count == version[2])
+
+    def user_profile(self, user: User) -> Dict[str, Any]:
+        profile = {"user_id": user.id, "name": user.username}
+        if user.preferences is not None:
+            profile["language"] = user.preferences.language
+        return profile
+
+    def _generate(self, user: User, insight_type: str, version) -> Optional[ActivityAnalysis]:
+        """呼叫 LLM 產生洞察並保存；失敗或降級的回應不保存，回傳 None"""
+        since = datetime.utcnow() - timedelta(days=self.history_days)
+        history = Activity.query.filter(Activity.user_id == user.id, Activity.date >= since).order_by(Activity.date).all()
+        result = self.analyzer.generate_insight(insight_type, self.user_profile(user), history)
+        if "error" in result or result.get("degraded"):
+            logger.warning(f"Insight {insight_type} for user {user.id} not stored: "
+                           f"{result.get('error') or result.get('degraded_reason')}")
+            self._count("failed")
+            return None
+        analysis = ActivityAnalysis.latest_insight(user.id, insight_type)
+        if analysis is None:
+            analysis = ActivityAnalysis(user_id=user.id, insight_type=insight_type)
+            db.session.add(analysis)
+        analysis.activity_id = version[0].id
+        analysis.raw_analysis = result["raw"]
+        analysis.formatted_analysis = result["formatted"]
+        analysis.suggestions = result["suggestions"]
+        analysis.activities_updated_at = version[1]
+        analysis.activity_count = version[2]
+        analysis.updated_at = datetime.utcnow()
+        db.session.commit()
+        self._count("generated")
+        return analysis
+
+    def refresh_user(self, user_id: int, insight_types: Optional[List[str]] = None,
+                     force: bool = False) -> Dict[str, str]:
+        """
+        更新一位用戶的洞察（需在 app context 中呼叫）
+
+        Args:
+            user_id: 用戶ID
+            insight_types: 洞察類型，預設為建構時的標準洞察
+            force: 活動沒有變化也重新產生
+
+        Returns:
+            Dict[str, str]: insight_type -> generated / fresh / failed / no_activities
+        """
+        user = db.session.get(User, user_id)
+        version = self._activity_version(user_id) if user is not None else None
+        if version is None:
+            return {insight_type: "no_activities" for insight_type in insight_types or self.insight_types}
+        statuses = {}
+        for insight_type in insight_types or self.insight_types:
+            if not force and self.is_fresh(ActivityAnalysis.latest_insight(user_id, insight_type), version):
+                self._count("fresh")
+                statuses[insight_type] = "fresh"
+                continue
+            try:
+                analysis = self._generate(user, insight_type, version)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Insight {insight_type} for user {user_id} failed: {e}")
+                self._count("failed")
+                analysis = None
+            statuses[insight_type] = "generated" if analysis is not None else "failed"
+        return statuses
+
+    def get_insights(self, user_id: int, insight_types: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        讀取洞察（需在 app context 中呼叫），只讀取資料庫，不在請求中呼叫 LLM
+
+        活動沒有變化時回傳保存的結果（precomputed）；活動有變化時回傳保存的舊結果並標記 stale，
+        同時排入背景更新；尚未產生過的洞察回傳 {"insight_type": ..., "pending": True}。
+
+        Returns:
+            Dict[str, Dict[str, Any]]: insight_type -> 洞察；找不到用戶或沒有活動時為空 dict
+        """
+        user = db.session.get(User, user_id)
+        version = self._activity_version(user_id) if user is not None else None
+        if version is None:
+            return {}
+        results = {}
+        for insight_type in insight_types or self.insight_types:
+            analysis = ActivityAnalysis.latest_insight(user_id, insight_type)
+            fresh = self.is_fresh(analysis, version)
+            if fresh:
+                self._count("fresh")
+            else:
+                self.schedule_refresh(user_id, insight_type)
+            if analysis is None:
+                results[insight_type] = {"insight_type": insight_type, "pending": True}
+                continue
+            result = analysis.to_dict()
+            result["precomputed"] = fresh
+            result["stale"] = not fresh
+            results[insight_type] = result
+        return results
+
+    def schedule_refresh(self, user_id: int, insight_type: str) -> bool:
+        """排入一項洞察的背景更新；同一項已在排隊或執行中時不重複排入，回傳是否排入"""
+        key = (user_id, insight_type)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            # 持有鎖時送出，工作執行緒結束時移除 key 前必定已登記
+            self._refreshing[key] = self._refresh_executor.submit(self._refresh_queued, user_id, insight_type)
+        return True
+
+    def wait_refreshes(self, timeout: Optional[float] = None) -> bool:
+        """等待目前排入的背景更新完成（測試或關閉前使用），回傳是否全部完成"""
+        with self._lock:
+            futures = list(self._refreshing.values())
+        return not wait(futures, timeout).not_done
+
+    def _refresh_queued(self, user_id: int, insight_type: str) -> None:
+        try:
+            self._refresh_in_context(user_id, False, [insight_type], endpoint="insight_refresh")
+        except Exception as e:
+            logger.error(f"Background refresh of insight {insight_type} for user {user_id} failed: {e}")
+        finally:
+            with self._lock:
+                del self._refreshing[(user_id, insight_type)]
+
+    def _refresh_in_context(self, user_id: int, force: bool, insight_types: Optional[List[str]] = None,
+                            endpoint: str = "insight_batch") -> Dict[str, str]:
+        with self.app.app_context(), llm_labels(endpoint=endpoint):
+            try:
+                return self.refresh_user(user_id, insight_types, force=force)
+            finally:
+                db.session.remove()
+
+    def run(self, user_ids: Optional[List[int]] = None, active_days: int = 30, force: bool = False) -> Dict[str, Any]:
+        """
+        批次更新洞察
+
+        Args:
+            user_ids: 要處理的用戶，預設為最近 active_days 天有活動的用戶
+            active_days: 活躍用戶的判斷期間
+            force: 活動沒有變化也重新產生
+
+        Returns:
+            Dict[str, Any]: 處理的用戶數與各狀態的洞察數
+        """
+        if user_ids is None:
+            with self.app.app_context():
+                user_ids = self.active_users(active_days)
+        report = {"users": len(user_ids), "generated": 0, "fresh": 0, "failed": 0, "no_activities": 0}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="insight-batch") as executor:
+            futures = {executor.submit(self._refresh_in_context, user_id, force): user_id for user_id in user_ids}
+            for future in as_completed(futures):
+                try:
+                    statuses = future.result()
+                except Exception as e:
+                    logger.error(f"Insight batch failed for user {futures[future]}: {e}")
+                    report["failed"] += len(self.insight_types)
+                    continue
+                for status in statuses.values():
+                    report[status] += 1
+        return report
@@ -0,0 +1,88 @@
+import unittest
+import os
+import shutil
+from datetime import datetime
+from unittest.mock import patch
+from backend.utils.data_storage import DataStorage
+from backend.utils.activity_aggregation import ActivityAggregator
+import pandas as pd
+
+class TestActivityAggregation(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置"""
+        self.test_data_dir = "test_data"
+        self.storage = DataStorage(base_path=self.test_data_dir)
+
+        # 兩位用戶，跨兩個月份與兩種活動類型；u1 有一筆缺少心率
+        self.data = {
+            "u1": pd.DataFrame({
+                'activity_id': ['a1', 'a2', 'a3', 'a4'],
+                'date': ['2024-01-29', '2024-01-31', '2024-02-02', '2024-02-06'],
+                'activity_type': ['running', 'running', 'running', 'cycling'],
+                'duration': [3600, 1800, 2400, 5400],
+                'distance': [10000, 5000, 8000, 30000],
+                'avg_heart_rate': [150, None, 160, 140],
+                'max_heart_rate': [180, 170, 190, 165]
+            }),
+            "u2": pd.DataFrame({
+                'activity_id': ['b1', 'b2'],
+                'date': ['2024-01-30', '2024-02-05'],
+                'activity_type': ['running', 'running'],
+                'duration': [1200, 1500],
+                'distance': [3000, 4000],
+                'avg_heart_rate': [140, 144],
+                'max_heart_rate': [160, 170]
+            })
+        }
+        for user_id, data in self.data.items():
+            months = pd.to_datetime(data['date']).dt.month
+            for (activity_type, month), group in data.groupby([data['activity_type'], months]):
+                self.storage.save_partition_data(user_id, activity_type, datetime(2024, month, 1), group)
+
+    def tearDown(self):
+        """測試後的清理"""
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+    def test_weekly_aggregate(self):
+        """測試跨分區的週彙總與平均心率（缺值不計入）"""
+        result = self.storage.aggregate(["u1", "u2"], group_by="week", workers=1)
+        self.assertEqual(result.columns.tolist(),
+                         ['user_id', 'period', 'activities', 'distance', 'duration', 'avg_heart_rate'])
+        u1 = result[result['user_id'] == 'u1'].set_index('period')
+        # 1/29 ~ 2/2 同屬 1/29 那一週，跨越兩個月份分區
+        self.assertEqual(u1.loc[pd.Timestamp('2024-01-29'), 'activities'], 3)
+        self.assertEqual(u1.loc[pd.Timestamp('2024-01-29'), 'distance'], 23000)
+        self.assertEqual(u1.loc[pd.Timestamp('2024-01-29'), 'avg_heart_rate'], 155)
+        self.assertEqual(u1.loc[pd.Timestamp('2024-02-05'), 'duration'], 5400)
+        self.assertEqual(len(result[result['user_id'] == 'u2']), 2)
+
+    def test_process_pool_matches_single_process(self):
+        """測試 process pool 的結果與單一 process 一致"""
+        metrics = ["activities", "distance", "avg_heart_rate", "max_heart_rate"]
+        aggregator = ActivityAggregator(self.storage, workers=2, parallel_min_partitions=1)
+        pooled = aggregator.aggregate(["u1", "u2"], metrics, group_by="month", by_activity_type=True)
+        single = ActivityAggregator(self.storage, workers=1).aggregate(
+            ["u1", "u2"], metrics, group_by="month", by_activity_type=True)
+        pd.testing.assert_frame_equal(pooled, single)
+        cycling = pooled[pooled['activity_type'] == 'cycling']
+        self.assertEqual(cycling['max_heart_rate'].tolist(), [165])
+
+    def test_few_partitions_stay_in_process(self):
+        """測試分區數未達門檻時不建立 process pool"""
+        with patch('backend.utils.activity_aggregation.ProcessPoolExecutor') as pool:
+            result = ActivityAggregator(self.storage, workers=4).aggregate(["u1", "u2"], group_by=None)
+        pool.assert_not_called()
+        self.assertEqual(result.set_index('user_id')['activities'].to_dict(), {'u1': 4, 'u2': 2})
+
+    def test_range_and_total(self):
+        """測試期間篩選與整段期間合計"""
+        result = self.storage.aggregate(["u1"], ["activities", "distance"], group_by=None,
+                                        start="2024-01-31", end="2024-02-02", activity_types=["running"])
+        self.assertEqual(result.to_dict('records'), [{'user_id': 'u1', 'activities': 2, 'distance': 13000.0}])
+        self.assertTrue(self.storage.aggregate(["nobody"]).empty)
+        with self.assertRaises(ValueError):
+            self.storage.aggregate(["u1"], ["pace"])
+
+if __name__ == '__main__':
+    unittest.main()
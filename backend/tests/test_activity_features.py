@@ -0,0 +1,47 @@
+import unittest
+import pandas as pd
+from backend.utils.activity_features import (
+    estimate_tokens, fit_to_budget, render_features, summarize_activities, summarize_for_prompt
+)
+
+class TestActivityFeatures(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置：每週兩次跑步，距離逐週增加"""
+        dates = pd.date_range("2024-01-01", periods=20, freq="7D")
+        self.history = pd.DataFrame({
+            'activity_id': [f"a{i}" for i in range(40)],
+            'date': list(dates) + list(dates + pd.Timedelta(days=2)),
+            'activity_type': ['running'] * 40,
+            'duration': [1800] * 40,
+            'distance': [5000 + 1000 * (i % 20) for i in range(40)],
+            'avg_heart_rate': [150] * 40,
+            'max_heart_rate': [170] * 39 + [195]
+        })
+
+    def test_weekly_features_and_trends(self):
+        """測試週彙總、趨勢斜率與近期極值"""
+        features = summarize_activities(self.history, weeks=4)
+        self.assertEqual(features["totals"]["activities"], 40)
+        self.assertEqual(len(features["weekly"]), 4)
+        self.assertEqual(features["weekly"][-1], {"week": "2024-05-13", "activities": 2, "distance_km": 48.0,
+                                                  "duration_min": 60.0, "avg_hr": 150.0})
+        # 每週兩次各增加 1 公里
+        self.assertEqual(features["trends"]["distance_km_per_week"], 2.0)
+        self.assertEqual(features["trends"]["avg_hr_per_week"], 0.0)
+        self.assertEqual(features["recent_extremes"]["longest_distance"][0]["distance_km"], 24.0)
+        self.assertEqual(features["recent_extremes"]["max_heart_rate"]["bpm"], 195)
+        self.assertEqual(summarize_activities([]), {"totals": {"activities": 0}})
+
+    def test_size_independent_of_history_and_budget(self):
+        """測試特徵區塊大小不隨歷史長度成長，且符合 token 預算"""
+        long_history = pd.concat([self.history] * 50, ignore_index=True)
+        short = render_features(summarize_for_prompt(self.history))
+        long = render_features(summarize_for_prompt(long_history.to_dict('records')))
+        self.assertLess(abs(estimate_tokens(long) - estimate_tokens(short)), 20)
+
+        features, text = fit_to_budget(summarize_activities(long_history), 200)
+        self.assertLessEqual(estimate_tokens(text), 200)
+        self.assertIn("trends", features)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,12 @@
 import unittest
-from unittest.mock import patch, MagicMock
+import asyncio
+import time
+import threading
+from unittest.mock import patch
 from backend.models.ai_analyzer import AIAnalyzer
+from backend.utils.single_flight import SingleFlight
+from backend.utils.circuit_breaker import CircuitOpenError
+from backend.utils.llm_telemetry import llm_telemetry
 
 class TestAIAnalyzer(unittest.TestCase):
     def setUp(self):
@@ -18,18 +24,154 @@ class TestAIAnalyzer(unittest.TestCase):
             "avg_heart_rate": 150
         }
 
-    @patch('openai.ChatCompletion.create')
+    @patch('backend.utils.llm_gateway.LLMGateway.chat')
     def test_analyze(self, mock_create):
-        # 模擬 OpenAI API 回應
-        mock_response = MagicMock()
-        mock_response.choices = [MagicMock(message={'content': '分析結果'})]
-        mock_create.return_value = mock_response
+        # 模擬 LLM API 回應
+        mock_create.return_value = {'choices': [{'message': {'content': '分析結果'}}]}
 
         # 測試分析數據
         result = self.analyzer.analyze(self.test_user_profile, self.test_activity_summary)
         self.assertIsInstance(result, dict)
         self.assertIn('formatted', result)
 
+    @patch('backend.utils.llm_gateway.LLMGateway.chat')
+    def test_generate_insight_cached(self, mock_create):
+        # 相同模型、洞察類型與輸入只呼叫一次 API
+        mock_create.return_value = {'choices': [{'message': {'content': '- 增加恢復日'}}]}
+        first = self.analyzer.generate_insight("recovery", self.test_user_profile, self.test_activity_summary)
+        second = self.analyzer.generate_insight("recovery", dict(reversed(self.test_user_profile.items())),
+                                                self.test_activity_summary)
+        self.assertEqual(first, second)
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(self.analyzer.cache_stats()['hits'], 1)
+        hits = [row for row in llm_telemetry.stats() if row['insight_type'] == 'recovery' and row['cache_hits']]
+        self.assertEqual(hits[0]['model'], self.analyzer.model)
+
+        # 不同洞察類型不共用快取
+        self.analyzer.generate_insight("training_load", self.test_user_profile, self.test_activity_summary)
+        self.assertEqual(mock_create.call_count, 2)
+
+    @patch('backend.utils.llm_gateway.LLMGateway.chat')
+    def test_generate_insights_concurrent(self, mock_create):
+        # 多個洞察同時產生，單一失敗或逾時不影響其他結果
+        def fake_create(model, messages, **kwargs):
+            prompt = messages[1]['content']
+            if "恢復狀態" in prompt:
+                raise RuntimeError("rate limited")
+            time.sleep(2 if "目標達成" in prompt else 0.2)
+            return {'choices': [{'message': {'content': '- 保持訓練'}}]}
+        mock_create.side_effect = fake_create
+
+        started = time.perf_counter()
+        results = self.analyzer.generate_insights(
+            ["performance_trends", "training_load", "recovery", "goal_progress"],
+            self.test_user_profile, self.test_activity_summary, max_concurrency=4, timeout=1
+        )
+        self.assertLess(time.perf_counter() - started, 1.5)
+        self.assertEqual(results["performance_trends"]["suggestions"], ["保持訓練"])
+        self.assertIn("suggestions", results["training_load"])
+        self.assertEqual(results["recovery"], {"error": "rate limited"})
+        self.assertIn("timed out", results["goal_progress"]["error"])
+
+    @patch('backend.utils.llm_gateway.LLMGateway.chat')
+    def test_generate_insights_inside_event_loop(self, mock_create):
+        # 在事件迴圈中（ASGI 模式）呼叫同步介面仍可取得結果
+        mock_create.return_value = {'choices': [{'message': {'content': '- 保持訓練'}}]}
+
+        async def call():
+            return self.analyzer.generate_insights(["performance_trends"], self.test_user_profile,
+                                                   self.test_activity_summary)
+        results = asyncio.run(call())
+        self.assertEqual(results["performance_trends"]["suggestions"], ["保持訓練"])
+
+    @patch('backend.utils.llm_gateway.LLMGateway.stream_chat')
+    def test_stream_insight(self, mock_create):
+        # 串流模式逐段送出 token，最後送出結構化回應；第二次由快取直接回傳
+        mock_create.return_value = iter([
+            {'choices': [{'delta': {'role': 'assistant'}}]},
+            {'choices': [{'delta': {'content': '- 增加'}}]},
+            {'choices': [{'delta': {'content': '恢復日'}}]}
+        ])
+        events = list(self.analyzer.stream_insight("recovery", self.test_user_profile, self.test_activity_summary))
+        # 行尚未結束時 formatted 為空，完整格式化內容在 done 中
+        self.assertEqual(events[:2], [("token", {"content": "- 增加", "formatted": ""}),
+                                      ("token", {"content": "恢復日", "formatted": ""})])
+        self.assertEqual(events[-1], ("done", self.analyzer.create_structured_response("- 增加恢復日")))
+
+        cached = list(self.analyzer.stream_insight("recovery", self.test_user_profile, self.test_activity_summary))
+        self.assertEqual(cached[-1], events[-1])
+        self.assertEqual(mock_create.call_count, 1)
+
+    @patch('backend.utils.llm_gateway.LLMGateway.chat')
+    def test_history_summarized_in_prompt(self, mock_create):
+        # 活動歷史先濃縮為固定大小的特徵區塊，並記錄提示大小
+        mock_create.return_value = {'choices': [{'message': {'content': '- 維持'}}]}
+        history = [{"date": f"2024-03-{day:02d}", "activity_type": "running", "distance": 5000,
+                    "duration": 1800, "avg_heart_rate": 150} for day in range(1, 29)]
+        self.analyzer.generate_insight("training_load", self.test_user_profile, history * 20)
+        prompt = mock_create.call_args.args[1][1]["content"]
+        self.assertIn('"weekly"', prompt)
+        self.assertIn('"activities":560', prompt)
+        stats = self.analyzer.prompt_stats()
+        self.assertEqual(stats["prompts"], 1)
+        self.assertLess(stats["max_tokens"], self.analyzer.prompt_token_budget + 200)
+
+    @patch('backend.utils.llm_gateway.LLMGateway.chat')
+    def test_training_load_precomputed(self, mock_create):
+        # 負荷指標在本機計算：一般模式由 LLM 解讀，numbers_only 模式不呼叫 LLM
+        mock_create.return_value = {'choices': [{'message': {'content': '- 負荷適中'}}]}
+        history = [{"date": f"2024-03-{day:02d}", "activity_type": "running", "distance": 5000,
+                    "duration": 1800, "avg_heart_rate": 150} for day in range(1, 29)]
+        self.analyzer.generate_insight("training_load", self.test_user_profile, history)
+        prompt = mock_create.call_args.args[1][1]["content"]
+        self.assertIn('"training_load"', prompt)
+        self.assertIn("不要自行重新計算", prompt)
+
+        result = self.analyzer.generate_insight("recovery", self.test_user_profile, history, numbers_only=True)
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertTrue(result["numbers_only"])
+        self.assertIn("training_stress_balance", result["metrics"])
+        self.assertIn("TSB", result["raw"])
+
+    @patch('backend.utils.llm_gateway.LLMGateway.chat')
+    def test_concurrent_identical_calls_coalesced(self, mock_create):
+        # 不同 AIAnalyzer 實例在多個執行緒同時送出相同提示，只呼叫一次 API
+        def slow_create(*args, **kwargs):
+            time.sleep(0.3)
+            return {'choices': [{'message': {'content': '- 減量'}}]}
+        mock_create.side_effect = slow_create
+        flight = SingleFlight()
+        analyzers = [AIAnalyzer(single_flight=flight) for _ in range(4)]
+        results = []
+        threads = [threading.Thread(target=lambda a=a: results.append(
+            a.generate_insight("recovery", self.test_user_profile, self.test_activity_summary))) for a in analyzers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(mock_create.call_count, 1)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(analyzers[0].single_flight_stats()["coalesced"], 3)
+
+    @patch('backend.utils.llm_gateway.LLMGateway.chat')
+    def test_degraded_when_circuit_open(self, mock_create):
+        # 斷路器開啟時回傳規則摘要，有成功結果後改用該用戶最近一次的洞察
+        mock_create.side_effect = CircuitOpenError("llm", 30)
+        result = self.analyzer.generate_insight("recovery", self.test_user_profile, self.test_activity_summary)
+        self.assertTrue(result["degraded"])
+        self.assertEqual(result["degraded_source"], "rule_based")
+        self.assertIn("距離 5.0 公里", result["raw"])
+
+        mock_create.side_effect = None
+        mock_create.return_value = {'choices': [{'message': {'content': '- 安排輕鬆跑'}}]}
+        self.analyzer.generate_insight("recovery", self.test_user_profile, self.test_activity_summary)
+
+        mock_create.side_effect = CircuitOpenError("llm", 30)
+        newer_summary = dict(self.test_activity_summary, distance=8000)
+        result = self.analyzer.generate_insight("recovery", self.test_user_profile, newer_summary)
+        self.assertEqual(result["degraded_source"], "cached")
+        self.assertEqual(result["raw"], "- 安排輕鬆跑")
+
     def test_build_prompt(self):
         # 測試提示詞生成
         prompt = self.analyzer.build_prompt(self.test_user_profile, self.test_activity_summary)
@@ -0,0 +1,175 @@
+import unittest
+import asyncio
+import json
+import os
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+import httpx
+import backend.app as app_module
+from backend.asgi import create_asgi_app
+from backend.utils.async_llm_gateway import AsyncLLMGateway
+from backend.utils.circuit_breaker import CircuitOpenError
+from backend.utils.llm_gateway import LLMDeadlineExceeded, request_deadline
+from backend.utils.llm_telemetry import LLMTelemetry
+
+class _SlowStubHandler(BaseHTTPRequestHandler):
+    """OpenAI 相容的測試伺服器：每個請求等待 server.delay 秒後回傳提示的前幾個字"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.server.lock:
+            self.server.calls += 1
+        time.sleep(self.server.delay)
+        content = body["messages"][-1]["content"].split()[0]
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for piece in ("路線", "建議"):
+                chunk = {"choices": [{"delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+            return
+        data = json.dumps({"choices": [{"message": {"content": content}}],
+                           "usage": {"prompt_tokens": 10, "completion_tokens": 2}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class _StubServer(ThreadingHTTPServer):
+    # 預設的 listen backlog（5）容不下同時建立的 50 條連線，多出的連線可能被重設
+    request_queue_size = 128
+
+class TestAsgiApp(unittest.TestCase):
+    def setUp(self):
+        """啟動 stub 上游並建立 ASGI 應用程式"""
+        self.server = _StubServer(("127.0.0.1", 0), _SlowStubHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.calls = 0
+        self.server.delay = 0.3
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.telemetry = LLMTelemetry()
+        self.gateway = AsyncLLMGateway(api_key="test", base_url=f"http://127.0.0.1:{self.server.server_port}/v1",
+                                       telemetry=self.telemetry)
+        with patch.dict(os.environ, {"DATABASE_URL": "sqlite://"}):
+            self.app = create_asgi_app(app_module.create_app(), gateway=self.gateway, sync_threads=4)
+        self.key_patch = patch.object(app_module, "openai_api_key", "test-key")
+        self.key_patch.start()
+
+    def tearDown(self):
+        """關閉伺服器"""
+        self.key_patch.stop()
+        self.app.wsgi.executor.shutdown(wait=False)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _run(self, *requests):
+        """在同一個事件迴圈上同時送出 (method, url, kwargs) 請求"""
+        async def send_all():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                try:
+                    return await asyncio.gather(*(client.request(method, url, **kwargs)
+                                                  for method, url, kwargs in requests))
+                finally:
+                    await self.gateway.aclose()
+        return asyncio.run(send_all())
+
+    def test_llm_requests_wait_concurrently(self):
+        """測試 LLM 端點在事件迴圈上並行等待上游，總耗時接近單次上游延遲"""
+        started = time.perf_counter()
+        responses = self._run(*[("GET", "/api/city/hotspots", {"params": {"location": f"城市{i}"}})
+                                for i in range(50)])
+        elapsed = time.perf_counter() - started
+        self.assertEqual({response.status_code for response in responses}, {200})
+        self.assertEqual(responses[7].json()["location"], "城市7")
+        self.assertIn("城市7", responses[7].json()["hotspots"])
+        self.assertEqual(self.server.calls, 50)
+        self.assertLess(elapsed, 0.3 * 50 / 4)
+        [row] = self.telemetry.stats()
+        self.assertEqual((row["endpoint"], row["insight_type"], row["calls"]), ("get_city_hotspots", "city_hotspots", 50))
+
+    def test_identical_requests_coalesced(self):
+        """測試同時進行中的相同提示只呼叫上游一次"""
+        body = {"sport": "running", "location": "台中市"}
+        responses = self._run(*[("POST", "/api/analyze/city", {"json": body})] * 20)
+        self.assertEqual(self.server.calls, 1)
+        results = [response.json() for response in responses]
+        self.assertEqual({result["analysis"]["ai_response"] for result in results}, {"請分析以下運動情況："})
+        self.assertEqual(responses[0].headers["access-control-allow-origin"], "*")
+
+    def test_stream_and_degraded(self):
+        """測試 SSE 串流，以及斷路器開啟時回傳降級內容"""
+        [response] = self._run(("POST", "/api/analyze/city", {"json": {"sport": "running", "stream": True}}))
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = [message.split("\n") for message in response.text.strip().split("\n\n")]
+        self.assertEqual([lines[0] for lines in events], ["event: token", "event: token", "event: done"])
+        self.assertEqual(json.loads(events[-1][1][6:])["analysis"]["ai_response"], "路線建議")
+
+        with patch.object(self.gateway.breaker, "acquire", side_effect=CircuitOpenError("llm", 5)):
+            cached, fresh = self._run(("POST", "/api/analyze/city", {"json": {"sport": "running"}}),
+                                      ("GET", "/api/city/hotspots", {"params": {"location": "花蓮"}}))
+        self.assertEqual(cached.json()["degraded_source"], "cached")
+        self.assertEqual(cached.json()["analysis"]["ai_response"], "路線建議")
+        self.assertEqual(fresh.json()["degraded_source"], "rule_based")
+
+    def test_caller_deadline_not_counted_by_breaker(self):
+        """測試非同步閘道同樣不把呼叫端的截止時間逾時計入斷路器"""
+        async def expire():
+            for seconds in (0, 0, 0, 0, 0.1):
+                with request_deadline(seconds):
+                    with self.assertRaises(LLMDeadlineExceeded):
+                        await self.gateway.chat("gpt-test", [{"role": "user", "content": "hi"}])
+            await self.gateway.aclose()
+        asyncio.run(expire())
+        self.assertEqual(self.gateway.breaker.stats()["state"], "closed")
+        self.assertEqual(self.gateway.stats()["circuit"]["opened"], 0)
+
+    def test_sync_endpoints_through_flask(self):
+        """測試其他端點與錯誤處理仍由 Flask 處理"""
+        health, stats, wrong_method, missing_sport = self._run(
+            ("GET", "/api/health", {}),
+            ("GET", "/api/llm/stats", {}),
+            ("GET", "/api/analyze/city", {}),
+            ("POST", "/api/analyze/city", {"json": {}}))
+        self.assertEqual(health.json()["status"], "healthy")
+        self.assertIn("async_gateway", stats.json())
+        self.assertEqual(wrong_method.status_code, 405)
+        self.assertEqual(missing_sport.status_code, 400)
+
+    def test_settings_from_flask_config(self):
+        """測試未指定時連線上限與執行緒數取 Flask 應用程式的設定"""
+        flask_app = self.app.flask_app
+        flask_app.config.update(LLM_ASYNC_MAX_CONNECTIONS=50, ASGI_SYNC_THREADS=3)
+        app = create_asgi_app(flask_app)
+        try:
+            self.assertEqual(app.gateway.max_connections, 50)
+            self.assertEqual(app.wsgi.executor._max_workers, 3)
+        finally:
+            app.wsgi.executor.shutdown(wait=False)
+
+    def test_same_validation_as_flask(self):
+        """測試兩種模式以同一套函式解析請求，錯誤回應相同"""
+        bodies = [{"content": "not json", "headers": {"content-type": "application/json"}}, {"json": {"location": "台中市"}}]
+        async_responses = self._run(*[("POST", "/api/analyze/city", kwargs) for kwargs in bodies])
+        client = self.app.flask_app.test_client()
+        flask_responses = [client.post("/api/analyze/city", data="not json", content_type="application/json"),
+                           client.post("/api/analyze/city", json={"location": "台中市"})]
+        for async_response, flask_response in zip(async_responses, flask_responses):
+            self.assertEqual(async_response.status_code, flask_response.status_code)
+            self.assertEqual(async_response.json(), flask_response.get_json())
+        self.assertEqual(async_responses[0].json()["message"], "請求內容必須為 JSON 物件")
+
+if __name__ == '__main__':
+    unittest.main()
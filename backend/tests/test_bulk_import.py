@@ -0,0 +1,70 @@
+import unittest
+import os
+import shutil
+from datetime import datetime
+from backend.utils.data_storage import DataStorage
+from backend.utils.bulk_import import BulkImporter
+import pandas as pd
+
+class TestBulkImport(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置"""
+        self.test_data_dir = "test_data"
+        self.export_dir = os.path.join(self.test_data_dir, "temp", "export")
+        os.makedirs(self.export_dir)
+        self.storage = DataStorage(base_path=self.test_data_dir)
+        
+        # 兩個匯出檔，橫跨兩個月份，其中一筆日期無效、一筆重複
+        pd.DataFrame({
+            'activity_id': ['a1', 'a2', 'a3'],
+            'date': ['2023-01-05', '2023-01-20', '2023-02-03'],
+            'activity_type': ['running', 'running', 'cycling'],
+            'duration': [3600, 1800, 5400],
+            'distance': [10000, 5000, 30000],
+            'avg_heart_rate': [150, 160, 140],
+            'max_heart_rate': [180, 190, 170]
+        }).to_csv(os.path.join(self.export_dir, "2023_01.csv"), index=False)
+        pd.DataFrame({
+            'activity_id': ['a4', 'a5', 'a1'],
+            'date': ['2023-02-10', 'bad date', '2023-01-05'],
+            'activity_type': ['running', 'running', 'running'],
+            'duration': [2400, 1200, 3600],
+            'distance': [8000, 4000, 10000],
+            'avg_heart_rate': [155, 150, 150],
+            'max_heart_rate': [185, 175, 180]
+        }).to_json(os.path.join(self.export_dir, "2023_02.json"), orient="records")
+
+    def tearDown(self):
+        """測試後的清理"""
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+    def test_import_directory(self):
+        """測試依 (用戶, 類型, 月份) 分組，每個分區寫入一次"""
+        importer = BulkImporter(self.storage, workers=2)
+        report = importer.import_directory(self.export_dir, user_id="athlete")
+        
+        self.assertEqual(report["files"], 2)
+        self.assertEqual(report["rows_read"], 6)
+        self.assertEqual(report["rows_rejected"], 1)
+        self.assertEqual(report["partitions"], 3)
+        self.assertEqual(report["rows_written"], 4)
+        self.assertEqual(report["failed_partitions"], 0)
+        self.assertGreater(report["rows_per_second"], 0)
+        # 每秒筆數以寫入筆數計算，重複與被拒絕的列不灌高吞吐量
+        self.assertAlmostEqual(report["rows_per_second"] / report["read_rows_per_second"], 4 / 6, delta=0.01)
+        
+        january = self.storage.get_activity_file_path("athlete", "running", datetime(2023, 1, 1))
+        self.assertEqual(sorted(pd.read_csv(january)['activity_id']), ['a1', 'a2'])
+        
+        running = self.storage.load_activities("athlete", "running", "2023-01-01", "2023-02-28")
+        self.assertEqual(sorted(running['activity_id']), ['a1', 'a2', 'a4'])
+        self.assertTrue(self.storage.activity_exists("athlete", "a3", "cycling"))
+
+    def test_import_requires_user_id(self):
+        """測試匯出檔沒有 user_id 欄位時必須指定用戶"""
+        with self.assertRaises(ValueError):
+            BulkImporter(self.storage, workers=1).import_directory(self.export_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import time
+from unittest.mock import patch, MagicMock
+import backend.app as app_module
+from backend.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_open_half_open_close(self):
+        """測試失敗率超過門檻時開啟，冷卻後以單一探測呼叫恢復"""
+        breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, open_seconds=0.2)
+        for success in (True, False, True, False):
+            breaker.acquire()
+            breaker.record(success, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.acquire()
+
+        time.sleep(0.25)
+        breaker.acquire()  # 探測呼叫
+        with self.assertRaises(CircuitOpenError):
+            breaker.acquire()
+        breaker.record(True, 0.1)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.stats(), {"state": "closed", "opened": 1, "rejected": 2})
+
+    def test_slow_calls_open_circuit(self):
+        """測試慢速呼叫比例過高時開啟，探測呼叫過慢則再次開啟"""
+        breaker = CircuitBreaker(slow_call_seconds=1.0, slow_call_rate=0.5, min_calls=2, open_seconds=0.1)
+        breaker.record(True, 2.0)
+        breaker.record(True, 3.0)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        time.sleep(0.15)
+        breaker.acquire()
+        breaker.record(True, 5.0)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+class TestDegradedEndpoints(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置"""
+        self.gateway = MagicMock()
+        self.gateway.chat.side_effect = CircuitOpenError("llm", 30)
+        with patch.object(app_module, "get_gateway", return_value=self.gateway):
+            self.client = app_module.create_app().test_client()
+        self.key_patch = patch.object(app_module, "openai_api_key", "test-key")
+        self.key_patch.start()
+
+    def tearDown(self):
+        """測試後的清理"""
+        self.key_patch.stop()
+
+    def test_rule_based_then_cached_fallback(self):
+        """測試斷路器開啟時先以規則產生內容，有成功回應後改用最近一次的回應"""
+        payload = {"sport": "running", "weather": "小雨", "time": "晚上"}
+        data = self.client.post("/api/analyze/city", json=payload).get_json()
+        self.assertTrue(data["degraded"])
+        self.assertEqual(data["degraded_source"], "rule_based")
+        self.assertIn("路面濕滑", data["analysis"]["ai_response"])
+        self.assertIn("反光", data["analysis"]["ai_response"])
+
+        self.gateway.chat.side_effect = None
+        self.gateway.chat.return_value = {"choices": [{"message": {"content": "AI 路線分析"}}]}
+        self.assertNotIn("degraded", self.client.post("/api/analyze/city", json=payload).get_json())
+
+        self.gateway.chat.side_effect = CircuitOpenError("llm", 30)
+        data = self.client.post("/api/analyze/city", json=payload).get_json()
+        self.assertEqual((data["degraded_source"], data["analysis"]["ai_response"]), ("cached", "AI 路線分析"))
+
+    def test_hotspots_degraded(self):
+        """測試熱點端點的降級回應"""
+        data = self.client.get("/api/city/hotspots", query_string={"location": "新竹市"}).get_json()
+        self.assertEqual(data["status"], "success")
+        self.assertEqual(data["degraded_source"], "rule_based")
+        self.assertIn("新竹市", data["hotspots"])
+        self.assertIn("notice", data)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,31 @@
 import unittest
+import unittest.mock
 import os
 import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from backend.utils.data_storage import DataStorage
+from backend.utils.activity_schema import apply_schema
 import pandas as pd
+from prometheus_client import REGISTRY
+
+def _concurrent_save(args):
+    """在獨立 process 中多次寫入同一分區"""
+    base_path, user_id, worker, batches, mode = args
+    storage = DataStorage(base_path=base_path)
+    ok = True
+    for batch in range(batches):
+        ok &= storage.save_activity_data(user_id, "running", pd.DataFrame({
+            'activity_id': [f"w{worker}_b{batch}_{i}" for i in range(5)],
+            'date': ['2024-03-21'] * 5,
+            'activity_type': ['running'] * 5,
+            'duration': [3600] * 5,
+            'distance': [10000] * 5,
+            'avg_heart_rate': [150] * 5,
+            'max_heart_rate': [180] * 5
+        }), mode=mode)
+    return ok
 
 class TestDataStorage(unittest.TestCase):
     def setUp(self):
@@ -74,6 +96,371 @@ class TestDataStorage(unittest.TestCase):
         self.assertEqual(len(saved_data), len(self.test_data))
         self.assertTrue(all(saved_data['activity_id'] == self.test_data['activity_id']))
 
+    def test_save_activity_data_append_mode(self):
+        """測試附加寫入模式只寫入新資料並去重"""
+        user_id = "test_user"
+        activity_type = "running"
+        file_path = self.storage.get_activity_file_path(user_id, activity_type, datetime.now())
+        
+        self.assertTrue(self.storage.save_activity_data(user_id, activity_type, self.test_data))
+        
+        new_data = self.test_data.copy()
+        new_data['activity_id'] = ['act2', 'act3']
+        self.assertTrue(self.storage.save_activity_data(user_id, activity_type, new_data, mode="append"))
+        
+        # 主檔不變，新資料只寫入 journal
+        self.assertEqual(len(pd.read_csv(file_path)), 2)
+        journal = pd.read_csv(file_path + ".journal.csv")
+        self.assertEqual(journal['activity_id'].tolist(), ['act3'])
+        
+        # 合併後主檔包含所有資料且無重複
+        self.assertTrue(self.storage.merge_journal(file_path))
+        merged = pd.read_csv(file_path)
+        self.assertEqual(sorted(merged['activity_id']), ['act1', 'act2', 'act3'])
+        self.assertFalse(os.path.exists(file_path + ".journal.csv"))
+
+    def test_append_mode_background_merge(self):
+        """測試 journal 超過門檻時於背景合併"""
+        storage = DataStorage(base_path=self.test_data_dir, write_mode="append", journal_merge_threshold=3)
+        file_path = storage.get_activity_file_path("test_user", "running", datetime.now())
+        
+        storage.save_activity_data("test_user", "running", self.test_data)
+        more_data = self.test_data.copy()
+        more_data['activity_id'] = ['act3', 'act4']
+        storage.save_activity_data("test_user", "running", more_data)
+        storage.wait_for_merges()
+        
+        self.assertFalse(os.path.exists(file_path + ".journal.csv"))
+        self.assertEqual(len(pd.read_csv(file_path)), 4)
+
+    def test_columnar_format_roundtrip(self):
+        """測試欄式格式保存與讀取"""
+        storage = DataStorage(base_path=self.test_data_dir, storage_format="columnar")
+        file_path = storage.get_activity_file_path("test_user", "running", datetime(2024, 3, 21))
+        self.assertTrue(file_path.endswith("202403.col"))
+        
+        data = self.test_data.copy()
+        data.loc[1, 'activity_type'] = None
+        storage.storage_format.write(file_path, data)
+        loaded = storage.storage_format.read(file_path)
+        self.assertEqual(loaded['activity_id'].tolist(), ['act1', 'act2'])
+        self.assertEqual(loaded['duration'].tolist(), [3600, 1800])
+        self.assertTrue(pd.isna(loaded.loc[1, 'activity_type']))
+        self.assertEqual(storage.storage_format.read(file_path, columns=['distance']).columns.tolist(), ['distance'])
+
+    def test_convert_partitions(self):
+        """測試將 CSV 分區就地轉換為欄式格式"""
+        self.storage.save_activity_data("test_user", "running", self.test_data)
+        csv_path = self.storage.get_activity_file_path("test_user", "running", datetime.now())
+        
+        self.assertEqual(self.storage.convert_partitions("columnar"), 1)
+        self.assertFalse(os.path.exists(csv_path))
+        
+        col_path = self.storage.get_activity_file_path("test_user", "running", datetime.now())
+        self.assertTrue(col_path.endswith(".col"))
+        loaded = self.storage.storage_format.read(col_path)
+        self.assertEqual(loaded['activity_id'].tolist(), ['act1', 'act2'])
+        
+        # 轉換後仍可繼續寫入
+        new_data = self.test_data.copy()
+        new_data['activity_id'] = ['act3', 'act4']
+        self.assertTrue(self.storage.save_activity_data("test_user", "running", new_data))
+        self.assertEqual(len(self.storage.storage_format.read(col_path)), 4)
+
+    def test_activity_schema_dtypes(self):
+        """測試讀寫時套用宣告的精簡欄位型別"""
+        data = self.test_data.copy()
+        data['avg_heart_rate'] = [150, None]
+        for storage_format in ("csv", "columnar"):
+            storage = DataStorage(base_path=os.path.join(self.test_data_dir, storage_format),
+                                  storage_format=storage_format, cache_max_bytes=0)
+            storage.save_partition_data("test_user", "running", datetime(2024, 3, 1), data)
+            loaded = storage.load_activities("test_user", "running")
+            self.assertEqual(str(loaded['activity_type'].dtype), 'category')
+            self.assertEqual(str(loaded['date'].dtype), 'datetime64[ns]')
+            self.assertEqual(str(loaded['distance'].dtype), 'float32')
+            self.assertEqual(str(loaded['avg_heart_rate'].dtype), 'Int16')
+            self.assertEqual(str(loaded['duration'].dtype), 'Int32')
+            self.assertTrue(pd.isna(loaded.loc[1, 'avg_heart_rate']))
+            self.assertEqual(loaded['duration'].tolist(), [3600, 1800])
+            self.assertEqual(loaded['date'].dt.strftime('%Y-%m-%d').tolist(), ['2024-03-21', '2024-03-22'])
+            chunk = next(storage.iter_activities("test_user", "running", chunk_size=1))
+            self.assertEqual(str(chunk['max_heart_rate'].dtype), 'Int16')
+
+        # 整數欄位含小數時不截斷
+        data['duration'] = [3600.5, 1800]
+        self.assertEqual(apply_schema(data)['duration'].tolist()[0], 3600.5)
+
+    def test_sharded_roots_and_rebalance(self):
+        """測試多個根目錄依 user_id 一致性雜湊分配，新增根目錄後只搬移受影響的用戶"""
+        roots = [os.path.join(self.test_data_dir, f"volume{i}") for i in range(3)]
+        storage = DataStorage(base_path=self.test_data_dir, roots=roots[:2])
+        users = [f"u{i}" for i in range(30)]
+        for user_id in users:
+            data = self.test_data.copy()
+            data['activity_id'] = [f"{user_id}_a", f"{user_id}_b"]
+            storage.save_partition_data(user_id, "running", datetime(2024, 3, 1), data)
+        for user_id in users:
+            expected = os.path.join(storage.root_for(user_id), "users", f"user_{user_id}")
+            self.assertTrue(os.path.isdir(expected))
+        self.assertTrue(storage.backup_data("daily"))
+
+        grown = DataStorage(base_path=self.test_data_dir, roots=roots)
+        affected = [u for u in users if grown.root_for(u) != storage.root_for(u)]
+        self.assertTrue(affected)
+        self.assertTrue(all(grown.root_for(u) == os.path.normpath(roots[2]) for u in affected))
+
+        plan = grown.rebalance(dry_run=True)
+        self.assertEqual(plan["users_moved"], len(affected))
+        self.assertFalse(os.listdir(os.path.join(roots[2], "users")))
+
+        report = grown.rebalance()
+        self.assertEqual(report["users_moved"], len(affected))
+        self.assertEqual(report["partitions_moved"], len(affected))
+        self.assertEqual(grown.rebalance()["users_moved"], 0)
+        for user_id in users:
+            self.assertEqual(len(grown.load_activities(user_id, "running")), 2)
+            self.assertTrue(grown.activity_exists(user_id, f"{user_id}_a"))
+        moved_path = grown.get_activity_file_path(affected[0], "running", datetime(2024, 3, 1))
+        self.assertTrue(moved_path.startswith(roots[2]))
+        self.assertIsNotNone(grown.catalog.get_partition(moved_path))
+
+        # 還原時依目前的雜湊環放到所屬根目錄
+        self.assertTrue(grown.restore_backup(grown.list_backups()[0]["name"]))
+        self.assertTrue(os.path.exists(moved_path))
+        self.assertEqual(len(grown.load_activities(affected[0], "running")), 2)
+
+        # 清理會處理每個根目錄的暫存區
+        old_file = os.path.join(roots[2], "temp", "old.tmp")
+        with open(old_file, "w") as f:
+            f.write("x")
+        grown.cleanup_temp_files(max_age_days=0)
+        self.assertFalse(os.path.exists(old_file))
+
+    def test_shard_placement_follows_root_ids(self):
+        """測試用戶歸屬取決於根目錄的 ID 檔，而非根目錄的路徑寫法或位置"""
+        roots = [os.path.join(self.test_data_dir, f"volume{i}") for i in range(3)]
+        storage = DataStorage(base_path=self.test_data_dir, roots=roots)
+        users = [f"u{i}" for i in range(30)]
+        placement = {u: roots.index(storage.root_for(u)) for u in users}
+
+        absolute = DataStorage(base_path=self.test_data_dir, roots=[os.path.abspath(root) for root in roots])
+        self.assertEqual({u: [os.path.abspath(root) for root in roots].index(absolute.root_for(u)) for u in users},
+                         placement)
+
+        # 搬移掛載點（改變根目錄路徑）後歸屬不變
+        moved = [os.path.join(self.test_data_dir, f"mount{i}") for i in range(3)]
+        for old, new in zip(roots, moved):
+            os.rename(old, new)
+        remounted = DataStorage(base_path=self.test_data_dir, roots=moved)
+        self.assertEqual({u: moved.index(remounted.root_for(u)) for u in users}, placement)
+
+        # 複製根目錄時 ID 重複
+        shutil.copytree(moved[0], roots[0])
+        with self.assertRaises(ValueError):
+            DataStorage(base_path=self.test_data_dir, roots=moved + [roots[0]])
+
+    def _write_monthly_partitions(self, storage):
+        """在 2024 年 1~3 月各寫入兩筆活動"""
+        for month in (1, 2, 3):
+            data = self.test_data.copy()
+            data['activity_id'] = [f"m{month}a", f"m{month}b"]
+            data['date'] = [f"2024-{month:02d}-05", f"2024-{month:02d}-25"]
+            file_path = storage.get_activity_file_path("test_user", "running", datetime(2024, month, 1))
+            storage.storage_format.write(file_path, data)
+            storage._reset_journal(file_path, data)
+
+    def test_load_activities_range(self):
+        """測試區間查詢只讀取重疊月份並過濾日期"""
+        self._write_monthly_partitions(self.storage)
+        
+        result = self.storage.load_activities("test_user", "running", "2024-02-01", "2024-03-05")
+        self.assertEqual(result['activity_id'].tolist(), ['m2a', 'm2b', 'm3a'])
+        
+        result = self.storage.load_activities("test_user", "running", start="2024-03-01",
+                                              columns=['activity_id', 'distance'])
+        self.assertEqual(result.columns.tolist(), ['activity_id', 'distance'])
+        self.assertEqual(len(result), 2)
+        
+        with unittest.mock.patch.object(self.storage.storage_format, 'read',
+                                        wraps=self.storage.storage_format.read) as mock_read:
+            self.storage.load_activities("test_user", "running", "2024-01-10", "2024-01-31")
+            self.assertEqual(mock_read.call_count, 1)
+        
+        self.assertTrue(self.storage.load_activities("other_user", "running").empty)
+
+    def test_iter_activities_chunks(self):
+        """測試以固定大小分批讀取"""
+        storage = DataStorage(base_path=self.test_data_dir, storage_format="columnar")
+        self._write_monthly_partitions(storage)
+        storage.save_activity_data("test_user", "running", pd.DataFrame({
+            'activity_id': ['j1'], 'date': ['2024-03-28'], 'activity_type': ['running'],
+            'duration': [100], 'distance': [1000], 'avg_heart_rate': [140], 'max_heart_rate': [170]
+        }), mode="append")
+        
+        chunks = list(storage.iter_activities("test_user", "running", chunk_size=1))
+        self.assertTrue(all(len(chunk) == 1 for chunk in chunks))
+        ids = [chunk['activity_id'].iloc[0] for chunk in chunks]
+        self.assertEqual(ids[:6], ['m1a', 'm1b', 'm2a', 'm2b', 'm3a', 'm3b'])
+
+    def test_catalog_index(self):
+        """測試分區目錄記錄統計並提供 activity_id 索引"""
+        self.storage.save_activity_data("test_user", "running", self.test_data)
+        file_path = self.storage.get_activity_file_path("test_user", "running", datetime.now())
+        
+        partition = self.storage.catalog.get_partition(file_path)
+        self.assertEqual(partition["rows"], 2)
+        self.assertEqual(partition["min_date"][:10], "2024-03-21")
+        self.assertEqual(partition["max_date"][:10], "2024-03-22")
+        self.assertEqual(partition["bytes"], os.path.getsize(file_path))
+        self.assertIsNotNone(partition["checksum"])
+        
+        self.assertTrue(self.storage.activity_exists("test_user", "act1"))
+        self.assertFalse(self.storage.activity_exists("test_user", "act9"))
+        self.assertEqual(self.storage.get_storage_size("test_user"), os.path.getsize(file_path))
+        
+        # 附加寫入以索引去重並累加統計
+        new_data = self.test_data.copy()
+        new_data['activity_id'] = ['act2', 'act3']
+        new_data['date'] = ['2024-03-22', '2024-04-01']
+        self.storage.save_activity_data("test_user", "running", new_data, mode="append")
+        partition = self.storage.catalog.get_partition(file_path)
+        self.assertEqual(partition["rows"], 3)
+        self.assertEqual(partition["journal_rows"], 1)
+        self.assertEqual(partition["max_date"][:10], "2024-04-01")
+        self.assertTrue(self.storage.activity_exists("test_user", "act3", "running"))
+        
+        # 重新開啟時沿用既有目錄，重建結果一致
+        reopened = DataStorage(base_path=self.test_data_dir)
+        self.assertEqual(reopened.rebuild_catalog(), 1)
+        self.assertEqual(reopened.catalog.get_partition(file_path)["journal_rows"], 1)
+
+    def test_concurrent_writes_same_partition(self):
+        """壓力測試：多個 process 與執行緒同時寫入同一分區不會遺失資料"""
+        workers, batches = 4, 8
+        jobs = [(self.test_data_dir, "shared", w, batches, "rewrite" if w % 2 else "append")
+                for w in range(workers)]
+        jobs += [(self.test_data_dir, "other", w, batches, "rewrite") for w in range(2)]
+        
+        thread_results = []
+        def save_in_thread(worker):
+            thread_results.append(_concurrent_save((self.test_data_dir, "shared", worker, batches, "rewrite")))
+        threads = [threading.Thread(target=save_in_thread, args=(w,)) for w in range(workers, workers + 2)]
+        
+        with ProcessPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = [pool.submit(_concurrent_save, job) for job in jobs]
+            for thread in threads:
+                thread.start()
+            results = [future.result() for future in futures]
+            for thread in threads:
+                thread.join()
+        self.assertTrue(all(results + thread_results))
+        
+        shared = self.storage.load_activities("shared", "running")
+        self.assertEqual(len(shared), (workers + 2) * batches * 5)
+        self.assertEqual(shared['activity_id'].nunique(), len(shared))
+        self.assertEqual(len(self.storage.load_activities("other", "running")), 2 * batches * 5)
+        file_path = self.storage.get_activity_file_path("shared", "running", datetime.now())
+        self.assertEqual(self.storage.catalog.get_partition(file_path)["rows"], len(shared))
+
+    def test_partition_cache(self):
+        """測試分區快取的命中、失效與 LRU 淘汰"""
+        self._write_monthly_partitions(self.storage)
+        cache = self.storage.cache
+        hits_before = REGISTRY.get_sample_value('partition_cache_hits_total')
+        
+        self.storage.load_activities("test_user", "running", "2024-01-01", "2024-01-31")
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        with unittest.mock.patch.object(self.storage.storage_format, 'read') as mock_read:
+            result = self.storage.load_activities("test_user", "running", "2024-01-01", "2024-01-31")
+            mock_read.assert_not_called()
+        self.assertEqual(len(result), 2)
+        self.assertEqual(cache.hits, 1)
+        
+        # 寫入後版本改變，快取失效
+        january = self.storage.get_activity_file_path("test_user", "running", datetime(2024, 1, 1))
+        extra = self.test_data.iloc[:1].copy()
+        extra['activity_id'] = ['m1c']
+        extra['date'] = ['2024-01-15']
+        self.storage.save_partition_data("test_user", "running", datetime(2024, 1, 1), extra)
+        result = self.storage.load_activities("test_user", "running", "2024-01-01", "2024-01-31")
+        self.assertEqual(len(result), 3)
+        self.assertEqual(cache.misses, 2)
+        
+        # 容量只夠放一個分區時淘汰最久未使用的項目
+        entry_size = cache.stats()["bytes"]
+        cache.max_bytes = entry_size + entry_size // 2
+        self.storage.load_activities("test_user", "running", "2024-02-01", "2024-02-28")
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.stats()["entries"], 1)
+        
+        # 統計同時記錄到本 process 的 Prometheus 指標，由應用程式的 /metrics 匯出
+        self.assertEqual(REGISTRY.get_sample_value('partition_cache_hits_total') - hits_before, cache.hits)
+
+    def test_compact_partitions_cold_tier(self):
+        """測試壓縮排序去重，並將舊分區移入壓縮的冷資料層"""
+        for storage_format, cold_extension in (("csv", ".csv.gz"), ("columnar", ".colz")):
+            base_path = os.path.join(self.test_data_dir, storage_format)
+            storage = DataStorage(base_path=base_path, storage_format=storage_format)
+            self._write_monthly_partitions(storage)
+            # 2 月分區帶有未合併的 journal
+            february = storage.get_activity_file_path("test_user", "running", datetime(2024, 2, 1))
+            late = self.test_data.iloc[:1].copy()
+            late['activity_id'] = ['m2c']
+            late['date'] = ['2024-02-01']
+            storage._append_to_journal(february, late)
+            before = storage.load_activities("test_user", "running")
+
+            report = storage.compact_partitions(cold_after_days=170, now=datetime(2024, 9, 1))
+            self.assertEqual(report["cold"]["partitions"], 2)
+            self.assertEqual(report["hot"]["partitions"], 0)
+            self.assertEqual(report["cold"]["bytes_reclaimed"],
+                             report["cold"]["bytes_before"] - report["cold"]["bytes_after"])
+
+            type_dir = os.path.dirname(february)
+            self.assertEqual(sorted(os.listdir(type_dir)),
+                             ["202401" + cold_extension, "202402" + cold_extension,
+                              "202403" + storage.storage_format.extension])
+
+            # 讀取路徑透明解壓縮，2 月的 journal 已依日期排序合併
+            after = storage.load_activities("test_user", "running")
+            self.assertEqual(sorted(after['activity_id']), sorted(before['activity_id']))
+            self.assertEqual(after['activity_id'].tolist()[2:5], ['m2c', 'm2a', 'm2b'])
+            chunks = list(storage.iter_activities("test_user", "running", "2024-01-01", "2024-01-31", chunk_size=1))
+            self.assertEqual(len(chunks), 2)
+            self.assertTrue(storage.activity_exists("test_user", "m1a"))
+
+            # 已在冷資料層的分區不重複處理；寫入冷資料月份時先解壓回熱資料層
+            self.assertEqual(storage.compact_partitions(cold_after_days=170, now=datetime(2024, 9, 1))["cold"]["partitions"], 0)
+            extra = self.test_data.iloc[:1].copy()
+            extra['activity_id'] = ['m1c']
+            extra['date'] = ['2024-01-15']
+            self.assertEqual(storage.save_partition_data("test_user", "running", datetime(2024, 1, 1), extra), 1)
+            self.assertFalse(os.path.exists(os.path.join(type_dir, "202401" + cold_extension)))
+            self.assertEqual(len(storage.load_activities("test_user", "running", "2024-01-01", "2024-01-31")), 3)
+
+            reopened = DataStorage(base_path=base_path, storage_format=storage_format)
+            self.assertEqual(reopened.rebuild_catalog(), 3)
+
+    def test_compact_skips_hot_partition_that_grows(self):
+        """測試就地重寫後沒有變小的熱資料分區保持原狀"""
+        storage = DataStorage(base_path=self.test_data_dir, storage_format="columnar")
+        self._write_monthly_partitions(storage)
+        march = storage.get_activity_file_path("test_user", "running", datetime(2024, 3, 1))
+        # 欄式格式以固定寬度保存字串，一個很長的 activity_id 會放大整欄
+        late = self.test_data.iloc[:1].copy()
+        late['activity_id'] = ['m3c' + 'x' * 200]
+        late['date'] = ['2024-03-01']
+        storage._append_to_journal(march, late)
+        checksum = storage.storage_format.checksum(march)
+
+        report = storage.compact_partitions(cold_after_days=170, now=datetime(2024, 9, 1))
+        self.assertEqual(report["hot"]["partitions"], 0)
+        self.assertEqual(storage.storage_format.checksum(march), checksum)
+        self.assertTrue(os.path.exists(march + ".journal.csv"))
+        self.assertEqual(sorted(os.listdir(os.path.dirname(march)))[-1], "202403.col.journal.csv")
+        self.assertEqual(len(storage.load_activities("test_user", "running", "2024-03-01", "2024-03-31")), 3)
+
     def test_backup_data(self):
         """測試數據備份"""
         # 先保存一些測試數據
@@ -92,6 +479,64 @@ class TestDataStorage(unittest.TestCase):
         backup_dir = os.path.join(self.test_data_dir, "backups", backup_dirs[0])
         self.assertTrue(os.path.exists(os.path.join(backup_dir, "backup_info.json")))
 
+    def test_incremental_backup_and_restore(self):
+        """測試增量備份只保存變動的檔案，且可還原任一快照"""
+        self.storage.save_activity_data("test_user", "running", self.test_data)
+        self.assertTrue(self.storage.backup_data(backup_type="test"))
+        first = self.storage.list_backups()[-1]
+        self.assertGreater(first["size"], 0)
+        
+        # 未變動時不新增任何物件
+        self.assertTrue(self.storage.backup_data(backup_type="test"))
+        second = self.storage.list_backups()[-1]
+        self.assertEqual(second["size"], 0)
+        self.assertEqual(second["changed_files"], 0)
+        
+        new_data = self.test_data.copy()
+        new_data['activity_id'] = ['act3', 'act4']
+        self.storage.save_activity_data("other_user", "running", new_data)
+        self.assertTrue(self.storage.backup_data(backup_type="test"))
+        third = self.storage.list_backups()[-1]
+        self.assertEqual(third["changed_files"], 1)
+        
+        # 還原第一個快照
+        self.assertTrue(self.storage.restore_backup(first["name"]))
+        self.assertFalse(self.storage.activity_exists("other_user", "act3"))
+        self.assertTrue(self.storage.activity_exists("test_user", "act1"))
+        
+        # 刪除快照時保留仍被引用的物件
+        self.storage.delete_backup(first["name"])
+        self.assertTrue(self.storage.restore_backup(third["name"]))
+        self.assertTrue(self.storage.activity_exists("other_user", "act3"))
+
+    def test_backup_locks_partitions_and_keys_roots(self):
+        """測試備份等待分區的寫入鎖，且不同根目錄下相同的相對路徑各自保存"""
+        roots = [os.path.join(self.test_data_dir, f"volume{i}") for i in range(2)]
+        storage = DataStorage(base_path=self.test_data_dir, roots=roots)
+        storage.save_partition_data("test_user", "running", datetime(2024, 3, 1), self.test_data)
+        file_path = storage.get_activity_file_path("test_user", "running", datetime(2024, 3, 1))
+        # 重新平衡留下的另一份同名分區
+        home = storage.root_for("test_user")
+        other_root = next(root for root in storage.roots if root != home)
+        stale_path = os.path.join(other_root, os.path.relpath(file_path, home))
+        os.makedirs(os.path.dirname(stale_path))
+        shutil.copyfile(file_path, stale_path)
+
+        finished = threading.Event()
+        with storage._locks.exclusive(file_path):
+            worker = threading.Thread(target=lambda: storage.backup_data("test") and finished.set())
+            worker.start()
+            self.assertFalse(finished.wait(0.3))
+        worker.join()
+        self.assertTrue(finished.is_set())
+
+        [backup] = storage.list_backups()
+        self.assertEqual(backup["files"], 2)
+        os.remove(stale_path)
+        self.assertTrue(storage.restore_backup(backup["name"]))
+        self.assertTrue(os.path.exists(file_path))
+        self.assertEqual(len(storage.load_activities("test_user", "running")), 2)
+
     def test_validate_activity_data(self):
         """測試數據驗證"""
         # 測試有效數據
@@ -104,6 +549,76 @@ class TestDataStorage(unittest.TestCase):
         validation_results = self.storage.validate_activity_data(invalid_data)
         self.assertTrue(len(validation_results["errors"]) > 0)
 
+    def test_validation_row_masks(self):
+        """測試驗證引擎回傳每列遮罩與各規則筆數"""
+        data = self.test_data.astype({'duration': object})
+        data.loc[0, 'duration'] = 'invalid'
+        data.loc[1, 'avg_heart_rate'] = 300
+        
+        result = self.storage.validator.validate(data)
+        self.assertEqual(result.counts['duration_invalid'], 1)
+        self.assertEqual(result.counts['avg_heart_rate_out_of_range'], 1)
+        self.assertEqual(result.valid_mask.tolist(), [False, True])
+        self.assertEqual(result.warning_mask.tolist(), [False, True])
+        self.assertFalse(result.is_valid)
+
+    def test_save_with_quarantine(self):
+        """測試只隔離無效列，其餘列照常保存"""
+        data = self.test_data.copy()
+        data['date'] = ['2024-03-21', 'not a date']
+        
+        self.assertTrue(self.storage.save_activity_data("test_user", "running", data, quarantine=True))
+        self.assertTrue(self.storage.activity_exists("test_user", "act1"))
+        self.assertFalse(self.storage.activity_exists("test_user", "act2"))
+        
+        quarantined = os.listdir(self.storage.quarantine_path)
+        self.assertEqual(len(quarantined), 1)
+        bad_rows = pd.read_csv(os.path.join(self.storage.quarantine_path, quarantined[0]))
+        self.assertEqual(bad_rows['activity_id'].tolist(), ['act2'])
+        self.assertEqual(bad_rows['_violations'].tolist(), ['date_invalid'])
+
+    def test_save_rejects_unconvertible_values(self):
+        """測試寫入時無法轉型的值不會被存成缺值"""
+        self.assertTrue(self.storage.save_partition_data("test_user", "running", datetime(2024, 3, 1), self.test_data))
+        bad = self.test_data.astype({'duration': object})
+        bad['activity_id'] = ['act3', 'act4']
+        bad.loc[0, 'date'] = '21/03/2024 garbage'
+        bad.loc[1, 'duration'] = '1h'
+
+        with unittest.mock.patch('backend.utils.data_storage.datetime') as mock_datetime:
+            mock_datetime.now.return_value = datetime(2024, 3, 25)
+            self.assertFalse(self.storage.save_activity_data("test_user", "running", bad))
+            self.assertFalse(self.storage.save_activity_data("test_user", "running", bad, mode="append"))
+        loaded = self.storage.load_activities("test_user", "running")
+        self.assertEqual(loaded['activity_id'].tolist(), ['act1', 'act2'])
+        self.assertFalse(loaded[['date', 'duration']].isna().any().any())
+
+        # 隔離模式下，沒有專屬規則的欄位（max_heart_rate）無法轉型時也會被隔離
+        mixed = self.test_data.astype({'max_heart_rate': object})
+        mixed['activity_id'] = ['act5', 'act6']
+        mixed.loc[1, 'max_heart_rate'] = 'n/a'
+        valid, rejected = self.storage.quarantine_invalid_rows("test_user", mixed)
+        self.assertEqual((valid['activity_id'].tolist(), rejected), (['act5'], 1))
+        bad_rows = pd.read_csv(os.path.join(self.storage.quarantine_path, os.listdir(self.storage.quarantine_path)[0]))
+        self.assertEqual(bad_rows['_violations'].tolist(), ['schema_invalid'])
+
+    def test_validate_csv_streaming(self):
+        """測試分批串流驗證大型 CSV"""
+        data = pd.concat([self.test_data] * 5, ignore_index=True)
+        data['activity_id'] = [f"act{i}" for i in range(len(data))]
+        data.loc[3, 'distance'] = None
+        csv_path = os.path.join(self.test_data_dir, "temp", "upload.csv")
+        data.to_csv(csv_path, index=False)
+        
+        quarantine_path = os.path.join(self.test_data_dir, "temp", "bad.csv")
+        valid_path = os.path.join(self.test_data_dir, "temp", "good.csv")
+        result = self.storage.validator.validate_csv(csv_path, chunk_size=3,
+                                                     quarantine_path=quarantine_path, valid_path=valid_path)
+        self.assertEqual(result.rows, 10)
+        self.assertEqual(result.counts['distance_invalid'], 1)
+        self.assertEqual(len(pd.read_csv(quarantine_path)), 1)
+        self.assertEqual(len(pd.read_csv(valid_path)), 9)
+
     def test_cleanup_temp_files(self):
         """測試臨時文件清理"""
         # 創建一些臨時文件
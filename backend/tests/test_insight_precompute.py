@@ -0,0 +1,135 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch, MagicMock
+import backend.app as app_module
+from backend.extensions import db
+from backend.models import User, Activity, ActivityAnalysis
+from backend.utils.rate_limiter import RateLimiter
+
+class TestInsightPrecompute(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置：暫存資料庫檔案（批次與背景更新的執行緒各用自己的連線），兩位各有一週活動的用戶"""
+        self.temp_dir = tempfile.mkdtemp()
+        self.gateway = MagicMock()
+        self.gateway.chat.return_value = {'choices': [{'message': {'content': '- 維持目前訓練'}}]}
+        self.gateway.stats.return_value = {}
+        with patch.dict(os.environ, {"DATABASE_URL": f"sqlite:///{os.path.join(self.temp_dir, 'app.db')}"}), \
+                patch.object(app_module.Config, "INSIGHT_REQUESTS_PER_MINUTE", 6000), \
+                patch.object(app_module, "get_gateway", return_value=self.gateway):
+            self.app = app_module.create_app()
+        self.client = self.app.test_client()
+        self.precomputer = self.app.extensions['insight_precomputer']
+        with self.app.app_context():
+            db.create_all()
+            for name in ("alice", "bob"):
+                user = User(username=name, email=f"{name}@example.com")
+                db.session.add(user)
+                db.session.flush()
+                for day in range(7):
+                    db.session.add(self._activity(user.id, day))
+            db.session.commit()
+
+    def tearDown(self):
+        """測試後的清理"""
+        self.precomputer.wait_refreshes()
+        with self.app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+        shutil.rmtree(self.temp_dir)
+
+    def _activity(self, user_id, day):
+        return Activity(user_id=user_id, title="晨跑", type="running",
+                        date=datetime.utcnow() - timedelta(days=7 - day),
+                        duration=1800 + 60 * day, distance=5000 + 100 * day, heart_rate_avg=150)
+
+    def test_batch_then_serve_stored(self):
+        """測試批次產生後讀取端點直接回傳保存的結果，活動有變化才重新產生"""
+        report = self.precomputer.run()
+        self.assertEqual(report["users"], 2)
+        self.assertEqual(report["generated"], 6)
+        self.assertEqual(self.gateway.chat.call_count, 6)
+        with self.app.app_context():
+            self.assertEqual(ActivityAnalysis.query.filter(ActivityAnalysis.insight_type.isnot(None)).count(), 6)
+
+        # 活動沒有變化：第二次批次與讀取端點都不呼叫 LLM
+        self.assertEqual(self.precomputer.run()["fresh"], 6)
+        response = self.client.get("/api/users/1/insights?type=recovery")
+        insight = response.get_json()["insights"]["recovery"]
+        self.assertTrue(insight["precomputed"])
+        self.assertEqual(insight["suggestions"], ["維持目前訓練"])
+        self.assertEqual(self.gateway.chat.call_count, 6)
+
+        # 新增活動後先回傳舊結果並標記 stale，在背景重新產生
+        with self.app.app_context():
+            db.session.add(self._activity(1, 7))
+            db.session.commit()
+        insight = self.client.get("/api/users/1/insights?type=recovery").get_json()["insights"]["recovery"]
+        self.assertTrue(insight["stale"])
+        self.assertEqual(insight["suggestions"], ["維持目前訓練"])
+        self.assertTrue(self.precomputer.wait_refreshes(timeout=5))
+        self.assertEqual(self.gateway.chat.call_count, 7)
+        insight = self.client.get("/api/users/1/insights?type=recovery").get_json()["insights"]["recovery"]
+        self.assertTrue(insight["precomputed"])
+
+        self.assertEqual(self.client.get("/api/users/99/insights").status_code, 404)
+        self.assertEqual(self.client.get("/api/users/1/insights?type=unknown").status_code, 400)
+
+    def test_failed_generation_not_stored(self):
+        """測試 LLM 失敗時不保存結果，讀取時回傳 pending 並在背景重試"""
+        self.gateway.chat.side_effect = RuntimeError("upstream down")
+        report = self.precomputer.run(user_ids=[1])
+        self.assertEqual(report["failed"], 3)
+        with self.app.app_context():
+            self.assertIsNone(ActivityAnalysis.latest_insight(1, "recovery"))
+        response = self.client.get("/api/users/1/insights?type=recovery")
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.get_json()["insights"]["recovery"]["pending"])
+        self.assertTrue(self.precomputer.wait_refreshes(timeout=5))
+        self.assertEqual(self.gateway.chat.call_count, 4)
+
+    def test_read_does_not_wait_for_llm(self):
+        """測試讀取端點不等待 LLM 與限流，同一項洞察只排入一次背景更新"""
+        self.precomputer.run(user_ids=[1])
+        with self.app.app_context():
+            db.session.add(self._activity(1, 7))
+            db.session.commit()
+
+        def slow_chat(*args, **kwargs):
+            time.sleep(0.5)
+            return {'choices': [{'message': {'content': '- 增加恢復日'}}]}
+        self.gateway.chat.side_effect = slow_chat
+        started = time.monotonic()
+        for _ in range(3):
+            response = self.client.get("/api/users/1/insights")
+            self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertTrue(all(insight["stale"] for insight in response.get_json()["insights"].values()))
+        self.assertTrue(self.precomputer.wait_refreshes(timeout=10))
+        self.assertEqual(self.gateway.chat.call_count, 6)
+        self.assertEqual(self.precomputer.stats()["refreshing"], 0)
+
+    def test_cache_hits_not_rate_limited(self):
+        """測試回應快取命中時不呼叫 LLM，也不消耗限流額度"""
+        self.assertEqual(self.precomputer.rate_limiter.rate, 100)
+        self.precomputer.run()
+        with patch.object(self.precomputer.rate_limiter, "acquire") as acquire:
+            self.assertEqual(self.precomputer.run(force=True)["generated"], 6)
+        acquire.assert_not_called()
+        self.assertEqual(self.gateway.chat.call_count, 6)
+
+    def test_rate_limiter(self):
+        """測試限流器平均分散呼叫"""
+        limiter = RateLimiter(per_minute=600)
+        started = time.monotonic()
+        for _ in range(4):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.25)
+        self.assertFalse(limiter.try_acquire())
+        self.assertFalse(limiter.acquire(timeout=0.01))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,274 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import tempfile
+import subprocess
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch, MagicMock
+import backend.app as app_module
+from backend.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from backend.utils.llm_gateway import (
+    LLMDeadlineExceeded, LLMError, LLMGateway, LLMHTTPError, LLMTimeoutError, RetryBudget, remaining_time,
+    request_deadline
+)
+from backend.utils.llm_telemetry import LLMTelemetry, llm_labels
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """OpenAI 相容的測試伺服器：依序取出預先排定的回應"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        server = self.server
+        with server.lock:
+            server.clients.append(self.client_address)
+            action = server.script.pop(0) if server.script else ("ok", 0)
+        kind, value = action
+        if kind == "sleep":
+            time.sleep(value)
+            kind = "ok"
+        if kind == "status":
+            self._send(value, {"error": {"message": "stub failure"}})
+        elif body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for piece in ("跑", "步"):
+                chunk = {"choices": [{"delta": {"content": piece}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                if kind == "slow_stream":
+                    self.wfile.flush()
+                    time.sleep(value)
+            if body.get("stream_options", {}).get("include_usage"):
+                chunk = {"choices": [], "usage": {"prompt_tokens": 7, "completion_tokens": 2}}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+        else:
+            self._send(200, {"choices": [{"message": {"content": f"echo {body['model']}"}}],
+                             "usage": {"prompt_tokens": 12, "completion_tokens": 3}})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+class TestLLMGateway(unittest.TestCase):
+    def setUp(self):
+        """啟動本機 stub 伺服器"""
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.script = []
+        self.server.clients = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.gateway = LLMGateway(api_key="test", base_url=f"http://127.0.0.1:{self.server.server_port}/v1",
+                                  max_retries=2, backoff_base=0.01)
+
+    def tearDown(self):
+        """關閉伺服器與連線池"""
+        self.gateway.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_retry_and_keep_alive(self):
+        """測試 5xx 重試後成功，且多次請求共用同一條 keep-alive 連線"""
+        self.server.script = [("status", 503)]
+        response = self.gateway.chat("gpt-test", [{"role": "user", "content": "hi"}])
+        self.assertEqual(response["choices"][0]["message"]["content"], "echo gpt-test")
+        self.gateway.chat("gpt-test", [{"role": "user", "content": "again"}])
+        self.assertEqual(len(set(self.server.clients)), 1)
+        self.assertEqual(self.gateway.stats()["retries"], 1)
+
+        self.server.script = [("status", 400)]
+        with self.assertRaises(LLMHTTPError):
+            self.gateway.chat("gpt-test", [])
+        self.assertEqual(self.gateway.stats()["retries"], 1)
+
+    def test_deadline_and_retry_budget(self):
+        """測試截止時間中止慢速請求，全域重試預算用盡後不再重試"""
+        self.server.script = [("sleep", 2)]
+        started = time.perf_counter()
+        with request_deadline(0.3):
+            with self.assertRaises(LLMTimeoutError):
+                self.gateway.chat("gpt-test", [])
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+        gateway = LLMGateway(base_url=self.gateway.base_url, max_retries=5, backoff_base=0.01,
+                             retry_budget=RetryBudget(ratio=0, min_retries=2))
+        self.server.script = [("status", 500)] * 10
+        for _ in range(2):
+            with self.assertRaises(LLMHTTPError):
+                gateway.chat("gpt-test", [])
+        stats = gateway.stats()
+        self.assertEqual((stats["attempts"], stats["retries"]), (4, 2))
+        self.assertEqual(stats["retry_budget_exhausted"], 2)
+        gateway.close()
+
+    def test_circuit_opens_and_fails_fast(self):
+        """測試上游持續失敗時斷路器開啟，之後的呼叫不再送到上游"""
+        gateway = LLMGateway(base_url=self.gateway.base_url, max_retries=0,
+                             breaker=CircuitBreaker(min_calls=3, open_seconds=60))
+        self.server.script = [("status", 503)] * 10
+        for _ in range(3):
+            with self.assertRaises(LLMHTTPError):
+                gateway.chat("gpt-test", [])
+        with self.assertRaises(CircuitOpenError):
+            gateway.chat("gpt-test", [])
+        self.assertEqual(len(self.server.clients), 3)
+        self.assertEqual(gateway.stats()["circuit"]["state"], "open")
+        gateway.close()
+
+    def test_stream_chat(self):
+        """測試串流回應逐一解析 chunk"""
+        chunks = list(self.gateway.stream_chat("gpt-test", [{"role": "user", "content": "hi"}]))
+        self.assertEqual("".join(c["choices"][0]["delta"]["content"] for c in chunks), "跑步")
+
+    def test_stream_outcome_recorded_after_stream(self):
+        """測試串流中途上游逾時計入斷路器失敗，提前停止讀取的探測呼叫仍會關閉斷路器"""
+        breaker = CircuitBreaker(min_calls=1, open_seconds=0.2)
+        gateway = LLMGateway(api_key="test", base_url=self.gateway.base_url, timeout=0.2, max_retries=0,
+                             breaker=breaker)
+        messages = [{"role": "user", "content": "hi"}]
+        self.server.script = [("slow_stream", 0.5)]
+        with self.assertRaises(LLMError):
+            list(gateway.stream_chat("gpt-test", messages))
+        self.assertEqual(breaker.state, "open")
+
+        time.sleep(0.2)
+        stream = gateway.stream_chat("gpt-test", messages)
+        next(stream)
+        stream.close()
+        self.assertEqual(breaker.state, "closed")
+        gateway.close()
+
+    def test_caller_deadline_not_counted_by_breaker(self):
+        """測試呼叫端的截止時間已到不計入斷路器，單一客戶端無法以極短的截止時間開啟斷路器"""
+        breaker = CircuitBreaker(min_calls=3, open_seconds=60)
+        gateway = LLMGateway(api_key="test", base_url=self.gateway.base_url, max_retries=0, breaker=breaker)
+        messages = [{"role": "user", "content": "hi"}]
+        for _ in range(5):
+            with request_deadline(0), self.assertRaises(LLMDeadlineExceeded):
+                gateway.chat("gpt-test", messages)
+        # 讀取逾時被截止時間縮短，以及串流途中截止時間已到
+        self.server.script = [("sleep", 0.5), ("slow_stream", 0.5)]
+        with request_deadline(0.2), self.assertRaises(LLMDeadlineExceeded):
+            gateway.chat("gpt-test", messages)
+        with request_deadline(0.2), self.assertRaises(LLMDeadlineExceeded):
+            list(gateway.stream_chat("gpt-test", messages))
+        self.assertEqual(breaker.stats(), {"state": "closed", "opened": 0, "rejected": 0})
+        self.assertEqual(gateway.chat("gpt-test", messages)["choices"][0]["message"]["content"], "echo gpt-test")
+
+        gateway.close()
+
+        # half_open 的探測呼叫因截止時間結束時歸還名額，下一個呼叫仍可探測
+        breaker = CircuitBreaker(min_calls=1, open_seconds=0.1)
+        gateway = LLMGateway(api_key="test", base_url=self.gateway.base_url, max_retries=0, breaker=breaker)
+        self.server.script = [("status", 503)]
+        with self.assertRaises(LLMHTTPError):
+            gateway.chat("gpt-test", messages)
+        time.sleep(0.1)
+        with request_deadline(0), self.assertRaises(LLMDeadlineExceeded):
+            gateway.chat("gpt-test", messages)
+        gateway.chat("gpt-test", messages)
+        self.assertEqual(breaker.state, "closed")
+        gateway.close()
+
+    def test_telemetry_per_call(self):
+        """測試每次呼叫記錄 token、重試次數、第一個 token 時間與標籤"""
+        telemetry = LLMTelemetry()
+        gateway = LLMGateway(api_key="test", base_url=self.gateway.base_url, max_retries=2,
+                             backoff_base=0.01, telemetry=telemetry)
+        self.server.script = [("status", 503)]
+        messages = [{"role": "user", "content": "hi"}]
+        with llm_labels(endpoint="analyze_city_sport", insight_type="city_analysis"):
+            gateway.chat("gpt-4", messages)
+            stream = gateway.stream_chat("gpt-4", messages)
+        # 標籤在呼叫 stream_chat 時決定，離開 with 後才讀取串流
+        self.assertEqual(len(list(stream)), 2)
+        gateway.close()
+
+        [row] = telemetry.stats()
+        self.assertEqual((row["endpoint"], row["insight_type"], row["model"]),
+                         ("analyze_city_sport", "city_analysis", "gpt-4"))
+        self.assertEqual(row["calls"], 2)
+        self.assertEqual(row["retries"], 1)
+        self.assertEqual((row["prompt_tokens"], row["completion_tokens"]), (19, 5))
+        self.assertAlmostEqual(row["cost_usd"], (19 * 0.03 + 5 * 0.06) / 1000)
+        self.assertEqual(row["streams"], 1)
+        self.assertIsNotNone(row["avg_ttft_seconds"])
+
+    def test_request_deadline_propagated_from_http_request(self):
+        """測試 X-Request-Timeout 標頭成為端點內 LLM 呼叫的截止時間"""
+        gateway = MagicMock()
+        seen = []
+        gateway.chat.side_effect = lambda *args: seen.append(remaining_time()) or {
+            "choices": [{"message": {"content": "熱點"}}]}
+        with patch.object(app_module, "get_gateway", return_value=gateway):
+            client = app_module.create_app().test_client()
+            client.get("/api/city/hotspots", headers={"X-Request-Timeout": "2"})
+            client.get("/api/city/hotspots", query_string={"location": "台中市"})
+        self.assertTrue(0 < seen[0] <= 2)
+        self.assertTrue(2 < seen[1] <= 30)
+        self.assertIsNone(remaining_time())
+
+    def test_gateway_settings_from_config(self):
+        """測試共用閘道依傳入的設定（app.config）建立，未指定的設定取 Config"""
+        import backend.utils.llm_gateway as gateway_module
+        with patch.object(gateway_module, "_default_gateway", None):
+            gateway = gateway_module.get_gateway({'LLM_TIMEOUT': 7, 'LLM_MAX_RETRIES': 0})
+            self.assertIs(gateway_module.get_gateway(), gateway)
+            gateway.close()
+        self.assertEqual((gateway.timeout, gateway.max_retries), (7, 0))
+        self.assertEqual(gateway.base_url, gateway_module.Config.OPENAI_BASE_URL)
+
+    def test_request_timeout_header_clamped(self):
+        """測試 X-Request-Timeout 不低於 LLM_MIN_REQUEST_DEADLINE，無效的值忽略"""
+        config = {'LLM_REQUEST_DEADLINE': 30, 'LLM_MIN_REQUEST_DEADLINE': 1}
+        self.assertEqual(app_module.llm_request_budget('5', config), 5)
+        self.assertEqual(app_module.llm_request_budget('0', config), 1)
+        self.assertEqual(app_module.llm_request_budget('-10', config), 1)
+        self.assertEqual(app_module.llm_request_budget('120', config), 30)
+        for value in ('nan', 'inf', '-inf', 'abc', '', None):
+            self.assertEqual(app_module.llm_request_budget(value, config), 30)
+
+        gateway = MagicMock()
+        seen = []
+        gateway.chat.side_effect = lambda *args: seen.append(remaining_time()) or {
+            "choices": [{"message": {"content": "熱點"}}]}
+        with patch.object(app_module, "get_gateway", return_value=gateway):
+            client = app_module.create_app().test_client()
+            for value in ('0', 'nan'):
+                client.get("/api/city/hotspots", headers={"X-Request-Timeout": value},
+                           query_string={"location": value})
+        self.assertTrue(0.5 < seen[0] <= 1)
+        self.assertTrue(1 < seen[1] <= 30)
+
+    def test_metrics_aggregate_worker_processes(self):
+        """測試設定 PROMETHEUS_MULTIPROC_DIR 時 /metrics 彙總所有 worker process 的指標"""
+        multiproc_dir = tempfile.mkdtemp()
+        record = ("from backend.utils.llm_telemetry import LLM_REQUESTS; "
+                  "LLM_REQUESTS.labels('worker_test', 'none', 'gpt-test', 'success').inc(2)")
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=multiproc_dir)
+        try:
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c", record], env=env, check=True)
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": multiproc_dir}):
+                body = app_module.create_app().test_client().get("/metrics").get_data(as_text=True)
+        finally:
+            shutil.rmtree(multiproc_dir)
+        self.assertIn('llm_requests_total{endpoint="worker_test",insight_type="none",model="gpt-test",'
+                      'outcome="success"} 4.0', body)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os
+import shutil
+from unittest.mock import patch
+from backend.utils.response_cache import (
+    ResponseCache, MemoryCacheBackend, SQLiteCacheBackend, FlaskCacheBackend, make_cache_key
+)
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置"""
+        self.test_data_dir = "test_data"
+        self.response = {"raw": "- 多休息", "formatted": "* 多休息", "suggestions": ["多休息"]}
+
+    def tearDown(self):
+        """測試後的清理"""
+        if os.path.exists(self.test_data_dir):
+            shutil.rmtree(self.test_data_dir)
+
+    def test_canonical_key(self):
+        """測試快取鍵不受字典順序影響，但區分模型與洞察類型"""
+        key = make_cache_key("gpt-4", "recovery", user_profile={"a": 1, "b": 2}, goal=None)
+        self.assertEqual(key, make_cache_key("gpt-4", "recovery", goal=None, user_profile={"b": 2, "a": 1}))
+        self.assertNotEqual(key, make_cache_key("gpt-3.5-turbo", "recovery", user_profile={"a": 1, "b": 2}, goal=None))
+        self.assertNotEqual(key, make_cache_key("gpt-4", "training_load", user_profile={"a": 1, "b": 2}, goal=None))
+
+    def test_memory_ttl_and_lru(self):
+        """測試記憶體後端的過期與 LRU 淘汰"""
+        cache = ResponseCache(MemoryCacheBackend(max_entries=2), ttl=60)
+        cache.set("a", self.response)
+        cache.set("b", self.response)
+        self.assertEqual(cache.get("a"), self.response)  # a 成為最近使用
+        cache.set("c", self.response)
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("a"))
+
+        with patch("backend.utils.response_cache.time.time", return_value=10 ** 12):
+            self.assertIsNone(cache.get("a"))
+        cache.set("err", {"error": "timeout"})
+        self.assertIsNone(cache.get("err"))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (2, 3, 1))
+
+    def test_sqlite_persistence_and_lru(self):
+        """測試 SQLite 後端跨實例保留並淘汰最久未存取的項目"""
+        path = os.path.join(self.test_data_dir, "llm_cache.sqlite")
+        cache = ResponseCache(SQLiteCacheBackend(path, max_entries=2), ttl=60)
+        cache.set("a", self.response)
+        cache.set("b", self.response)
+        cache.get("a")
+        cache.set("c", self.response)
+
+        reopened = ResponseCache(SQLiteCacheBackend(path, max_entries=2), ttl=60)
+        self.assertEqual(reopened.get("a"), self.response)
+        self.assertIsNone(reopened.get("b"))
+        cache.set("short", self.response, ttl=-1)
+        self.assertIsNone(reopened.get("short"))
+
+    def test_flask_cache_backend(self):
+        """測試 flask_caching 後端使用 create_app 設定的 cache 擴充，並以 timeout 傳遞 TTL"""
+        import backend.app as app_module
+        with patch.dict(os.environ, {"DATABASE_URL": "sqlite://"}):
+            app = app_module.create_app()
+        with app.app_context():
+            cache = ResponseCache(FlaskCacheBackend(), ttl=60)
+            self.assertIsNone(cache.get("a"))
+            with patch.object(FlaskCacheBackend, "set", wraps=cache.backend.set) as backend_set:
+                cache.set("a", self.response)
+            self.assertEqual(backend_set.call_args.args[2], 60)
+            self.assertEqual(cache.get("a"), self.response)
+            self.assertEqual(cache.stats()["hit_rate"], 0.5)
+
+            # 共用的 flask_caching 儲存區中其他項目不受 clear() 影響
+            app_module.cache.set("session:1", "keep")
+            cache.clear()
+            self.assertEqual(app_module.cache.get("session:1"), "keep")
+
+    def test_app_response_cache_settings(self):
+        """測試 create_app 依 app.config 的 LLM_CACHE_* 建立回應快取，並在 /api/llm/stats 回報"""
+        import backend.app as app_module
+        with patch.dict(os.environ, {"DATABASE_URL": "sqlite://"}):
+            with patch.object(app_module.Config, "LLM_CACHE_MAX_ENTRIES", 7):
+                app = app_module.create_app()
+        response_cache = app.extensions['llm_response_cache']
+        self.assertEqual(app.config['LLM_CACHE_MAX_ENTRIES'], 7)
+        self.assertEqual(response_cache.backend.max_entries, 7)
+        self.assertIs(app.extensions['insight_precomputer'].analyzer.cache, response_cache)
+        response_cache.get("missing")
+        stats = app.test_client().get('/api/llm/stats').get_json()
+        self.assertEqual(stats['response_cache']['misses'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+from backend.utils.response_formatter import ResponseFormatter, format_structured
+
+class TestResponseFormatter(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置：含條列、關鍵字與空行的回應"""
+        self.raw = "總結：近期進步明顯\n\n- 建議增加恢復日\n  - 注意心率 \n-"
+
+    def test_format_structured(self):
+        """測試 Markdown、emoji 與建議擷取"""
+        result = format_structured(self.raw)
+        self.assertEqual(result["raw"], self.raw)
+        self.assertEqual(result["formatted"],
+                         "📝 總結：近期🚀 進步明顯\n\n* 💡 建議增加🔄 恢復日\n* ⚠️ 注意心率\n-")
+        self.assertEqual(result["suggestions"], ["總結：近期進步明顯", "建議增加恢復日", "注意心率"])
+        self.assertEqual(format_structured(""), {"raw": "", "formatted": "", "suggestions": []})
+        self.assertEqual(format_structured("- 訓練", use_markdown=False, use_emoji=False)["formatted"], "- 訓練")
+
+    def test_incremental_chunks(self):
+        """測試逐字送入（關鍵字被切開）時輸出與一次格式化相同"""
+        formatter = ResponseFormatter()
+        pieces = [formatter.feed(char) for char in self.raw]
+        # 每行結束時才送出該行的格式化內容
+        self.assertEqual(pieces[0], "")
+        self.assertEqual(pieces[self.raw.index("\n")], "📝 總結：近期🚀 進步明顯\n")
+        streamed = "".join(pieces) + formatter.finish()
+        self.assertEqual(streamed, format_structured(self.raw)["formatted"])
+        self.assertEqual(formatter.result(), format_structured(self.raw))
+        self.assertEqual(formatter.finish(), "")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import unittest
+import asyncio
+import time
+import threading
+from unittest.mock import patch, MagicMock
+import backend.app as app_module
+from backend.utils.llm_gateway import LLMDeadlineExceeded, LLMTimeoutError, remaining_time, request_deadline
+from backend.utils.single_flight import AsyncSingleFlight, SingleFlight, prompt_key
+
+def _run_concurrently(count, target):
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        """測試同一個 key 的並行呼叫只執行一次，並共用結果或例外"""
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return {"content": "ok"}
+
+        results = _run_concurrently(8, lambda: flight.do("k", slow))
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result == {"content": "ok"} for result in results))
+        self.assertEqual(flight.stats(), {"executed": 1, "coalesced": 7, "in_flight": 0})
+
+        def failing():
+            time.sleep(0.2)
+            raise RuntimeError("upstream down")
+
+        errors = _run_concurrently(4, lambda: flight.do("k", failing))
+        self.assertTrue(all(isinstance(error, RuntimeError) for error in errors))
+        # 呼叫結束後不保留結果
+        self.assertEqual(flight.do("k", lambda: "fresh"), "fresh")
+
+    def test_waiter_respects_own_deadline(self):
+        """測試等待者在自己的截止時間到時放棄等待，leader 的呼叫照常完成"""
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            time.sleep(0.5)
+            return "ok"
+
+        leader = threading.Thread(target=lambda: flight.do("k", slow))
+        leader.start()
+        started.wait()
+        t0 = time.perf_counter()
+        with request_deadline(0.1), self.assertRaises(LLMTimeoutError):
+            flight.do("k", slow)
+        self.assertLess(time.perf_counter() - t0, 0.4)
+        leader.join()
+        self.assertEqual(flight.stats(), {"executed": 1, "coalesced": 1, "in_flight": 0})
+
+        async def coalesced():
+            flight = AsyncSingleFlight()
+
+            async def slow_async():
+                await asyncio.sleep(0.5)
+                return "ok"
+
+            async def impatient():
+                with request_deadline(0.1):
+                    return await flight.do("k", slow_async)
+
+            leader = asyncio.ensure_future(flight.do("k", slow_async))
+            await asyncio.sleep(0)
+            results = await asyncio.gather(impatient(), return_exceptions=True)
+            return results + [await leader]
+
+        timed_out, result = asyncio.run(coalesced())
+        self.assertIsInstance(timed_out, LLMTimeoutError)
+        self.assertEqual(result, "ok")
+
+    def test_waiter_not_bound_by_leader_deadline(self):
+        """測試 leader 因自己較短的截止時間逾時後，仍有時間的等待者重新呼叫而取得結果"""
+        def upstream():
+            # 以目前 context 的截止時間為上限等待 0.3 秒的上游回應
+            remaining = remaining_time()
+            time.sleep(0.3 if remaining is None else min(0.3, max(0.0, remaining)))
+            if remaining is not None and remaining < 0.3:
+                raise LLMDeadlineExceeded("LLM request deadline exceeded")
+            return "ok"
+
+        flight = SingleFlight()
+        started = threading.Event()
+
+        results = []
+
+        def leader():
+            with request_deadline(0.1):
+                try:
+                    flight.do("k", lambda: started.set() or upstream())
+                except LLMDeadlineExceeded as e:
+                    results.append(e)
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait()
+        with request_deadline(2):
+            self.assertEqual(flight.do("k", upstream), "ok")
+        thread.join()
+        self.assertIsInstance(results[0], LLMDeadlineExceeded)
+        self.assertEqual(flight.stats()["executed"], 2)
+
+        async def coalesced():
+            flight = AsyncSingleFlight()
+
+            async def upstream_async():
+                remaining = remaining_time()
+                await asyncio.sleep(min(0.3, max(0.0, remaining)))
+                if remaining < 0.3:
+                    raise LLMDeadlineExceeded("LLM request deadline exceeded")
+                return "ok"
+
+            async def call(seconds):
+                with request_deadline(seconds):
+                    return await flight.do("k", upstream_async)
+
+            short = asyncio.ensure_future(call(0.1))
+            await asyncio.sleep(0)
+            results = await asyncio.gather(short, call(2), return_exceptions=True)
+            return results + [flight.executed]
+
+        short, patient, executed = asyncio.run(coalesced())
+        self.assertIsInstance(short, LLMDeadlineExceeded)
+        self.assertEqual(patient, "ok")
+        self.assertEqual(executed, 2)
+
+    def test_prompt_key_normalization(self):
+        """測試只差在空白排版的提示得到相同的鍵"""
+        a = [{"role": "user", "content": "請提供 台北市\n  的運動熱點"}]
+        b = [{"role": "user", "content": "  請提供 台北市 的運動熱點 "}]
+        self.assertEqual(prompt_key("gpt-3.5-turbo", a), prompt_key("gpt-3.5-turbo", b))
+        self.assertNotEqual(prompt_key("gpt-3.5-turbo", a), prompt_key("gpt-4", a))
+
+    def test_hotspots_coalesced(self):
+        """測試並行的相同熱點請求只呼叫一次 OpenAI"""
+        gateway = MagicMock()
+
+        def chat(model, messages):
+            time.sleep(0.3)
+            return {"choices": [{"message": {"content": "大安森林公園"}}]}
+        gateway.chat.side_effect = chat
+        gateway.stats.return_value = {}
+
+        flight = SingleFlight()
+        with patch.object(app_module, "get_gateway", return_value=gateway), \
+                patch.object(app_module, "llm_single_flight", flight):
+            app = app_module.create_app()
+            locations = ["台北市", " 台北市", "台北市 ", "台北市", "高雄市"]
+            responses = _run_concurrently(
+                len(locations),
+                lambda: app.test_client().get("/api/city/hotspots", query_string={"location": locations.pop()}))
+            stats = app.test_client().get("/api/llm/stats").get_json()["single_flight"]
+
+        self.assertTrue(all(response.get_json()["hotspots"] == "大安森林公園" for response in responses))
+        self.assertEqual(gateway.chat.call_count, 2)
+        self.assertEqual(stats["coalesced"], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import json
+from unittest.mock import patch, MagicMock
+import backend.app as app_module
+
+def _chunk(content):
+    return {"choices": [{"delta": {"content": content} if content else {}}]}
+
+def _parse_events(body):
+    events = []
+    for message in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+class TestCityAnalysisStreaming(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置"""
+        self.gateway = MagicMock()
+        with patch.object(app_module, "get_gateway", return_value=self.gateway):
+            self.app = app_module.create_app().test_client()
+        self.key_patch = patch.object(app_module, "openai_api_key", "test-key")
+        self.key_patch.start()
+
+    def tearDown(self):
+        """測試後的清理"""
+        self.key_patch.stop()
+
+    def test_stream_tokens_then_done(self):
+        """測試逐段送出 token 事件，最後的 done 事件與非串流結果相同"""
+        self.gateway.stream_chat.return_value = iter([_chunk("路線"), _chunk(None), _chunk("建議")])
+        response = self.app.post("/api/analyze/city", json={"sport": "running", "stream": True})
+        self.assertEqual(response.mimetype, "text/event-stream")
+        events = _parse_events(response.get_data(as_text=True))
+        self.assertEqual(events[:2], [("token", {"content": "路線"}), ("token", {"content": "建議"})])
+        self.assertEqual(events[-1][0], "done")
+        self.assertEqual(events[-1][1]["analysis"]["ai_response"], "路線建議")
+        self.assertEqual(events[-1][1]["sport"], "running")
+        self.gateway.chat.assert_not_called()
+
+    def test_stream_error_event(self):
+        """測試串流失敗時以 error 事件結束，非串流模式不受影響"""
+        self.gateway.stream_chat.side_effect = RuntimeError("boom")
+        response = self.app.post("/api/analyze/city", json={"sport": "running"},
+                                 headers={"Accept": "text/event-stream"})
+        self.assertEqual([event for event, _ in _parse_events(response.get_data(as_text=True))], ["error"])
+
+        self.gateway.chat.return_value = {"choices": [{"message": {"content": "完整分析"}}]}
+        response = self.app.post("/api/analyze/city", json={"sport": "running"})
+        self.assertEqual(response.get_json()["analysis"]["ai_response"], "完整分析")
+
+if __name__ == '__main__':
+    unittest.main()
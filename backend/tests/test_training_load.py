@@ -0,0 +1,55 @@
+import unittest
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from backend.utils.training_load import TrainingLoadEngine, activities_to_frame
+
+class TestTrainingLoad(unittest.TestCase):
+    def setUp(self):
+        """測試前的設置：連續 60 天每天 30 分鐘、平均心率 150"""
+        self.engine = TrainingLoadEngine(resting_hr=60, max_hr=190)
+        self.history = pd.DataFrame({
+            'date': pd.date_range("2024-01-01", periods=60, freq="D"),
+            'activity_type': ['running'] * 60,
+            'duration': [1800] * 60,
+            'distance': [5000] * 60,
+            'avg_heart_rate': [150] * 60
+        })
+
+    def test_steady_load(self):
+        """測試固定負荷時 ATL 接近每日負荷、CTL 仍在累積、TSB 為負"""
+        daily = 30 * (90 / 130) * 0.64 * np.exp(1.92 * 90 / 130)
+        metrics = self.engine.compute(self.history)
+        self.assertEqual(metrics["date"], "2024-02-29")
+        self.assertEqual(metrics["load_method"], "trimp")
+        self.assertAlmostEqual(metrics["acute_load"], daily, delta=0.5)
+        self.assertLess(metrics["chronic_load"], metrics["acute_load"])
+        self.assertLess(metrics["training_stress_balance"], 0)
+        self.assertAlmostEqual(metrics["weekly_load"], 7 * daily, delta=0.5)
+        # 每天負荷相同，標準差為 0，單調性無法定義
+        self.assertIsNone(metrics["monotony"])
+
+        # 停練兩週後急性負荷下降，TSB 轉正
+        rested = self.engine.compute(self.history, end="2024-03-14")
+        self.assertLess(rested["acute_load"], metrics["acute_load"])
+        self.assertGreater(rested["training_stress_balance"], 0)
+        self.assertEqual(rested["status"], "fresh")
+
+    def test_model_objects_and_monotony(self):
+        """測試 Activity 模型物件（無心率時以時間計）與單調性/壓力"""
+        activities = [SimpleNamespace(date=pd.Timestamp("2024-01-01") + pd.Timedelta(days=d), type="running",
+                                      duration=3600 if d % 2 else 1800, distance=5000,
+                                      heart_rate_avg=None, heart_rate_max=None) for d in range(14)]
+        frame = activities_to_frame(activities)
+        self.assertEqual(list(frame["activity_type"].unique()), ["running"])
+        metrics = self.engine.compute(activities)
+        self.assertEqual(metrics["load_method"], "duration")
+        week = np.array([60, 30] * 3 + [60], dtype=float)
+        self.assertAlmostEqual(metrics["weekly_load"], week.sum())
+        self.assertAlmostEqual(metrics["monotony"], round(week.mean() / week.std(), 2))
+        self.assertGreater(metrics["strain"], metrics["weekly_load"])
+        self.assertTrue(any("單調性" in line for line in self.engine.interpret(metrics)))
+        self.assertIsNone(self.engine.compute([]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,248 @@
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from backend.utils.data_storage import DataStorage, iter_partition_file
+from backend.utils.partition_lock import PartitionLocker
+from backend.utils.activity_schema import as_datetime
+
+logger = logging.getLogger(__name__)
+
+# 指標名稱 -> (來源欄位, 彙總方式)；每種方式都能先在各分區算出部分結果再合併
+METRICS: Dict[str, Tuple[str, str]] = {
+    "activities": ("activity_id", "count"),
+    "distance": ("distance", "sum"),
+    "duration": ("duration", "sum"),
+    "calories": ("calories", "sum"),
+    "avg_heart_rate": ("avg_heart_rate", "mean"),
+    "max_heart_rate": ("max_heart_rate", "max"),
+}
+
+# 各彙總方式需要的部分結果，以及合併部分結果的方式
+_PARTIALS = {
+    "count": ["count"],
+    "sum": ["sum"],
+    "mean": ["sum", "count"],
+    "max": ["max"],
+    "min": ["min"],
+}
+_MERGE = {"count": "sum", "sum": "sum", "max": "max", "min": "min"}
+
+GROUP_BY = ("day", "week", "month", "year", None)
+
+# 分區數少於此值時在本 process 計算：建立 process pool 與傳回結果的固定成本高於平行的收益
+PARALLEL_MIN_PARTITIONS = 32
+
+# worker process 只需要分區鎖（由 initializer 建立），依路徑直接讀取分區，不建立 DataStorage
+_worker_locks: Optional[PartitionLocker] = None
+
+# 單一分區的部分彙總：(user_id, activity_type, 期間起點陣列或 None, 部分結果名稱 -> 陣列, 掃描的筆數)
+Partial = Tuple[str, str, Optional[np.ndarray], Dict[str, np.ndarray], int]
+
+
+def _init_worker(locks_path: str) -> None:
+    global _worker_locks
+    _worker_locks = PartitionLocker(locks_path)
+
+
+def _period(dates: pd.Series, group_by: Optional[str]) -> pd.Series:
+    """日期所屬期間的起始時間（週以星期一為起點）"""
+    if group_by == "day":
+        return dates.dt.normalize()
+    if group_by == "week":
+        return dates.dt.normalize() - pd.to_timedelta(dates.dt.weekday, unit="D")
+    if group_by == "month":
+        return pd.Series(dates.to_numpy().astype("datetime64[M]").astype("datetime64[ns]"), index=dates.index)
+    return pd.Series(dates.to_numpy().astype("datetime64[Y]").astype("datetime64[ns]"), index=dates.index)
+
+
+def _reduce(codes: np.ndarray, groups: int, values: np.ndarray, part: str) -> np.ndarray:
+    """以 numpy 依群組編號計算一種部分結果（缺值不計入）"""
+    present = ~np.isnan(values)
+    if part == "count":
+        return np.bincount(codes, weights=present, minlength=groups).astype(np.int64)
+    if part == "sum":
+        return np.bincount(codes, weights=np.where(present, values, 0.0), minlength=groups)
+    out = np.full(groups, -np.inf if part == "max" else np.inf)
+    (np.fmax if part == "max" else np.fmin).at(out, codes[present], values[present])
+    out[np.isinf(out)] = np.nan
+    return out
+
+
+def _columns(metrics: List[str]) -> List[str]:
+    return sorted({"date"} | {METRICS[name][0] for name in metrics})
+
+
+def _partial_aggregate(chunks: Iterable[pd.DataFrame], task: Tuple) -> Partial:
+    """
+    由單一分區的資料批次計算部分彙總
+
+    每批先彙總成少量的期間列，記憶體與分區大小無關；回傳的只有每個期間一組數值，
+    在 worker process 中計算時傳回主 process 的資料量也很小。
+    """
+    path, user_id, activity_type, metrics, group_by, start_ts, end_ts, chunk_size = task
+    partials = []
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        dates = as_datetime(chunk["date"])
+        mask = dates.notna()
+        if start_ts is not None:
+            mask &= dates >= start_ts
+        if end_ts is not None:
+            mask &= dates < end_ts
+        if not mask.all():
+            chunk, dates = chunk[mask], dates[mask]
+        if chunk.empty:
+            continue
+
+        if group_by:
+            codes, periods = pd.factorize(_period(dates, group_by))
+        else:
+            codes, periods = np.zeros(len(chunk), dtype=np.int64), [pd.NaT]
+        partial = {}
+        for name in metrics:
+            column, how = METRICS[name]
+            if how == "count":
+                values = np.where(chunk[column].notna().to_numpy(), 1.0, np.nan)
+            else:
+                values = pd.to_numeric(chunk[column], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            for part in _PARTIALS[how]:
+                partial[f"{name}__{part}"] = _reduce(codes, len(periods), values, part)
+        partials.append(pd.DataFrame(partial, index=pd.Index(periods, name="period")))
+
+    if not partials:
+        return str(user_id), activity_type, None, {}, rows
+    merged = partials[0]
+    if len(partials) > 1:
+        merged = pd.concat(partials).groupby(level="period", sort=False, dropna=False).agg(
+            {column: _MERGE[column.rsplit("__", 1)[1]] for column in merged.columns})
+    periods = merged.index.to_numpy(dtype="datetime64[ns]") if group_by else None
+    return str(user_id), activity_type, periods, {c: merged[c].to_numpy() for c in merged.columns}, rows
+
+
+def _aggregate_partition(storage: DataStorage, task: Tuple) -> Partial:
+    """在本 process 計算單一分區的部分彙總；小分區一次讀入，可使用分區快取"""
+    path, chunk_size = task[0], task[-1]
+    partition = storage.catalog.get_partition(path)
+    if partition is not None and partition["rows"] <= chunk_size:
+        chunk_size = None
+    return _partial_aggregate(storage._iter_partition_chunks(path, chunk_size, _columns(task[3])), task)
+
+
+def _aggregate_in_worker(task: Tuple) -> Partial:
+    """在 worker process 依路徑讀取分區並計算部分彙總"""
+    path, chunk_size = task[0], task[-1]
+    with _worker_locks.shared(path):
+        return _partial_aggregate(iter_partition_file(path, chunk_size, _columns(task[3])), task)
+
+
+class ActivityAggregator:
+    """
+    活動數據彙總查詢
+
+    每個分區分批算出部分彙總（總和、筆數、最大值等），主 process 只合併少量的群組列，
+    不需要把原始資料全部載入同一個 process。分區數達到 parallel_min_partitions 時，
+    worker process 依路徑讀取分區並只傳回部分彙總，跨用戶或多年的彙總隨 CPU 核心數擴展。
+    """
+
+    def __init__(self, storage: DataStorage, workers: Optional[int] = None, chunk_size: int = 100000,
+                 parallel_min_partitions: int = PARALLEL_MIN_PARTITIONS):
+        self.storage = storage
+        self.workers = workers or available_cpus()
+        self.chunk_size = chunk_size
+        self.parallel_min_partitions = parallel_min_partitions
+
+    def aggregate(self, user_ids: List[str], metrics: Optional[List[str]] = None,
+                  group_by: Optional[str] = "week", start=None, end=None,
+                  activity_types: Optional[List[str]] = None,
+                  by_activity_type: bool = False) -> pd.DataFrame:
+        """
+        依期間彙總多位用戶的活動指標
+
+        Args:
+            user_ids: 用戶ID列表
+            metrics: 指標名稱 (見 METRICS)，None 表示距離、時間、活動數與平均心率
+            group_by: 期間 (day/week/month/year)，None 表示整段期間合計
+            start: 起始日期（含），None 表示不限
+            end: 結束日期（含當日），None 表示不限
+            activity_types: 只彙總指定的活動類型，None 表示全部
+            by_activity_type: 是否依活動類型分列
+
+        Returns:
+            pd.DataFrame: 每個 (user_id[, activity_type][, period]) 一列，欄位為各指標
+        """
+        metrics = metrics or ["activities", "distance", "duration", "avg_heart_rate"]
+        unknown = [name for name in metrics if name not in METRICS]
+        if unknown:
+            raise ValueError(f"Unsupported metrics: {', '.join(unknown)}")
+        if group_by not in GROUP_BY:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+
+        started = time.perf_counter()
+        start_ts, end_ts = self.storage._normalize_range(start, end)
+        tasks = []
+        for user_id in user_ids:
+            for activity_type in activity_types or self.storage.list_activity_types(user_id):
+                for path in self.storage._partitions_in_range(str(user_id), activity_type, start_ts, end_ts):
+                    tasks.append((path, str(user_id), activity_type, metrics, group_by,
+                                  start_ts, end_ts, self.chunk_size))
+
+        partials, rows = self._run(tasks)
+        result = self._merge(partials, metrics, group_by, by_activity_type)
+        logger.info(f"Aggregated {len(tasks)} partitions ({rows} rows) for {len(user_ids)} users "
+                    f"in {time.perf_counter() - started:.3f}s")
+        return result
+
+    def _run(self, tasks: List[Tuple]) -> Tuple[List[Partial], int]:
+        """計算各分區的部分彙總；分區數未達門檻或只有一個 worker 時直接在本 process 計算"""
+        if len(tasks) < self.parallel_min_partitions or self.workers == 1:
+            results = [_aggregate_partition(self.storage, task) for task in tasks]
+        else:
+            workers = min(self.workers, len(tasks))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(self.storage.locks_path,)) as pool:
+                # 批次送出任務，減少 process 間往返
+                results = list(pool.map(_aggregate_in_worker, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+        return [partial for partial in results if partial[3]], sum(partial[4] for partial in results)
+
+    def _merge(self, partials: List[pd.DataFrame], metrics: List[str], group_by: Optional[str],
+               by_activity_type: bool) -> pd.DataFrame:
+        """合併部分結果並計算最終指標"""
+        keys = ["user_id"] + (["activity_type"] if by_activity_type else []) + (["period"] if group_by else [])
+        if not partials:
+            return pd.DataFrame(columns=keys + metrics)
+
+        sizes = [len(next(iter(parts.values()))) for _, _, _, parts, _ in partials]
+        columns = {
+            "user_id": np.repeat([user_id for user_id, _, _, _, _ in partials], sizes),
+            "activity_type": np.repeat([activity_type for _, activity_type, _, _, _ in partials], sizes),
+        }
+        if group_by:
+            columns["period"] = np.concatenate([periods for _, _, periods, _, _ in partials])
+        for column in partials[0][3]:
+            columns[column] = np.concatenate([parts[column] for _, _, _, parts, _ in partials])
+        merged = pd.DataFrame(columns).groupby(keys, sort=True).agg(
+            {column: _MERGE[column.rsplit("__", 1)[1]] for column in columns if "__" in column})
+
+        result = pd.DataFrame(index=merged.index)
+        for name in metrics:
+            how = METRICS[name][1]
+            if how == "mean":
+                counts = merged[f"{name}__count"]
+                result[name] = merged[f"{name}__sum"].where(counts > 0) / counts.where(counts > 0)
+            else:
+                result[name] = merged[f"{name}__{_PARTIALS[how][0]}"]
+        return result.reset_index()
+
+
+def available_cpus() -> int:
+    """本 process 可使用的 CPU 數（考慮 CPU affinity）"""
+    try:
+        return len(os.sched_getaffinity(0)) or 1
+    except AttributeError:  # macOS / Windows 沒有 sched_getaffinity
+        return os.cpu_count() or 1
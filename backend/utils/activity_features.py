@@ -0,0 +1,196 @@
+import json
+import math
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from backend.utils.activity_schema import as_datetime
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except ImportError:  # 未安裝 tiktoken 時以字元數估算
+    _ENCODING = None
+
+# 縮減時週彙總至少保留的週數
+_MIN_WEEKS = 4
+
+History = Union[pd.DataFrame, List[Dict[str, Any]]]
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文字的 token 數
+
+    有 tiktoken 時精確計算；否則中日韓文字每字計 1 個 token，其餘每 4 個字元計 1 個 token。
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    cjk = sum(1 for char in text if ord(char) >= 0x2E80)
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def prompt_size(text: str) -> Dict[str, int]:
+    """提示的字元數與估算 token 數"""
+    return {"chars": len(text), "tokens": estimate_tokens(text)}
+
+
+def _to_frame(activities: History) -> pd.DataFrame:
+    data = activities if isinstance(activities, pd.DataFrame) else pd.DataFrame(list(activities))
+    frame = pd.DataFrame(index=data.index)
+    frame["date"] = as_datetime(data["date"]) if "date" in data else pd.NaT
+    frame["activity_type"] = data["activity_type"].astype(str) if "activity_type" in data else "unknown"
+    for column in ("distance", "duration", "avg_heart_rate", "max_heart_rate"):
+        frame[column] = pd.to_numeric(data[column], errors="coerce").astype(float) if column in data else np.nan
+    return frame.dropna(subset=["date"]).sort_values("date", kind="stable")
+
+
+def _slope(values: np.ndarray) -> Optional[float]:
+    """等間隔序列的線性回歸斜率（每週變化量），有效點少於 2 個時回傳 None"""
+    x = np.arange(len(values), dtype=float)
+    present = ~np.isnan(values)
+    if present.sum() < 2:
+        return None
+    return round(float(np.polyfit(x[present], values[present], 1)[0]), 2)
+
+
+def _round(value: float, digits: int = 1) -> Optional[float]:
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def _record(row: pd.Series, **fields: Any) -> Dict[str, Any]:
+    record = {"date": row["date"].strftime("%Y-%m-%d"), "type": row["activity_type"]}
+    record.update(fields)
+    return record
+
+
+def summarize_activities(activities: History, weeks: int = 8, extremes: int = 3,
+                         now: Optional[pd.Timestamp] = None) -> Dict[str, Any]:
+    """
+    將任意長度的活動歷史濃縮為固定大小的特徵區塊
+
+    Args:
+        activities: 活動資料（DataFrame 或 dict 列表），欄位同 ACTIVITY_SCHEMA
+        weeks: 週彙總與趨勢涵蓋的最近週數
+        extremes: 最長距離列出的筆數
+        now: 視為「現在」的時間，預設為最後一筆活動的日期
+
+    Returns:
+        Dict[str, Any]: totals / weekly / trends / recent_extremes / by_type，大小只與 weeks、extremes 有關
+    """
+    frame = _to_frame(activities)
+    if frame.empty:
+        return {"totals": {"activities": 0}}
+
+    now = pd.Timestamp(now) if now is not None else frame["date"].iloc[-1]
+    current_week = now.normalize() - pd.Timedelta(days=now.weekday())
+    week_starts = pd.date_range(end=current_week, periods=weeks, freq="7D")
+    week_of = frame["date"].dt.normalize() - pd.to_timedelta(frame["date"].dt.weekday, unit="D")
+    recent = frame[(week_of >= week_starts[0]) & (frame["date"] <= now)]
+    recent_weeks = week_of[recent.index]
+
+    grouped = recent.groupby(recent_weeks)
+    weekly_frame = pd.DataFrame({
+        "activities": grouped.size(),
+        "distance_km": grouped["distance"].sum(min_count=1) / 1000,
+        "duration_min": grouped["duration"].sum(min_count=1) / 60,
+        "avg_hr": grouped["avg_heart_rate"].mean(),
+    }).reindex(week_starts)
+    weekly_frame["activities"] = weekly_frame["activities"].fillna(0)
+    # 週配速 (分/公里)，沒有距離的週不計
+    pace = weekly_frame["duration_min"] / weekly_frame["distance_km"].where(weekly_frame["distance_km"] > 0)
+
+    weekly = [
+        {
+            "week": start.strftime("%Y-%m-%d"),
+            "activities": int(row["activities"]),
+            "distance_km": _round(row["distance_km"]) or 0.0,
+            "duration_min": _round(row["duration_min"], 0) or 0.0,
+            "avg_hr": _round(row["avg_hr"], 0),
+        }
+        for start, row in weekly_frame.iterrows()
+    ]
+    trends = {
+        "activities_per_week": _slope(weekly_frame["activities"].to_numpy(dtype=float)),
+        "distance_km_per_week": _slope(weekly_frame["distance_km"].fillna(0).to_numpy(dtype=float)),
+        "duration_min_per_week": _slope(weekly_frame["duration_min"].fillna(0).to_numpy(dtype=float)),
+        "avg_hr_per_week": _slope(weekly_frame["avg_hr"].to_numpy(dtype=float)),
+        "pace_min_per_km_per_week": _slope(pace.to_numpy(dtype=float)),
+    }
+
+    recent_extremes: Dict[str, Any] = {}
+    if recent["distance"].notna().any():
+        longest = recent.nlargest(extremes, "distance")
+        recent_extremes["longest_distance"] = [
+            _record(row, distance_km=_round(row["distance"] / 1000, 2)) for _, row in longest.iterrows()
+        ]
+    if recent["duration"].notna().any():
+        row = recent.loc[recent["duration"].idxmax()]
+        recent_extremes["longest_duration"] = _record(row, duration_min=_round(row["duration"] / 60, 0))
+    if recent["max_heart_rate"].notna().any():
+        row = recent.loc[recent["max_heart_rate"].idxmax()]
+        recent_extremes["max_heart_rate"] = _record(row, bpm=_round(row["max_heart_rate"], 0))
+    paced = recent[recent["distance"] >= 1000]
+    if not paced.empty and paced["duration"].notna().any():
+        paces = paced["duration"] / 60 / (paced["distance"] / 1000)
+        row = paced.loc[paces.idxmin()]
+        recent_extremes["fastest_pace"] = _record(row, min_per_km=_round(paces.min(), 2))
+
+    return {
+        "totals": {
+            "activities": int(len(frame)),
+            "first_date": frame["date"].iloc[0].strftime("%Y-%m-%d"),
+            "last_date": frame["date"].iloc[-1].strftime("%Y-%m-%d"),
+            "distance_km": _round(frame["distance"].sum() / 1000) or 0.0,
+            "duration_h": _round(frame["duration"].sum() / 3600) or 0.0,
+        },
+        "weekly": weekly,
+        "trends": trends,
+        "recent_extremes": recent_extremes,
+        "by_type": frame["activity_type"].value_counts().head(5).to_dict(),
+    }
+
+
+def render_features(features: Dict[str, Any]) -> str:
+    """特徵區塊的精簡 JSON 表示（嵌入提示使用）"""
+    return json.dumps(features, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _shrink_steps(features: Dict[str, Any]):
+    """依重要性由低到高逐步縮減特徵區塊"""
+    features = json.loads(render_features(features))
+    while len(features.get("weekly", [])) > _MIN_WEEKS:
+        features["weekly"] = features["weekly"][1:]
+        yield features
+    if features.get("recent_extremes", {}).get("longest_distance"):
+        features["recent_extremes"]["longest_distance"] = features["recent_extremes"]["longest_distance"][:1]
+        yield features
+    for key in ("by_type", "weekly", "recent_extremes"):
+        if key in features:
+            del features[key]
+            yield features
+
+
+def fit_to_budget(features: Dict[str, Any], max_tokens: int) -> Tuple[Dict[str, Any], str]:
+    """
+    縮減特徵區塊直到估算 token 數不超過 max_tokens
+
+    Returns:
+        Tuple[Dict[str, Any], str]: (縮減後的特徵, 對應的精簡 JSON)；只剩總計與趨勢時不再縮減
+    """
+    text = render_features(features)
+    if estimate_tokens(text) <= max_tokens:
+        return features, text
+    for features in _shrink_steps(features):
+        text = render_features(features)
+        if estimate_tokens(text) <= max_tokens:
+            break
+    return features, text
+
+
+def summarize_for_prompt(activities: History, max_tokens: int = 600, weeks: int = 8,
+                         now: Optional[pd.Timestamp] = None) -> Dict[str, Any]:
+    """活動歷史 -> 符合 token 預算的特徵區塊"""
+    features, _ = fit_to_budget(summarize_activities(activities, weeks=weeks, now=now), max_tokens)
+    return features
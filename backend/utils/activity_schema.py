@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Optional
+
+# 活動數據的欄位型別
+# pd.read_csv 預設會把整數讀成 int64、小數讀成 float64、字串讀成 object，
+# 跨多位用戶彙總時佔用數倍於實際需要的記憶體
+ACTIVITY_SCHEMA: Dict[str, str] = {
+    "date": "datetime64[ns]",
+    "activity_type": "category",
+    "duration": "Int32",        # 秒
+    "distance": "float32",      # 公尺
+    "calories": "Int32",
+    "avg_heart_rate": "Int16",
+    "max_heart_rate": "Int16",
+}
+
+
+class SchemaError(ValueError):
+    """寫入的數據含有無法轉為宣告型別的值"""
+
+    def __init__(self, failures: Dict[str, pd.Index]):
+        self.failures = failures
+        details = ", ".join(f"{column} (rows {list(index[:5])})" for column, index in failures.items())
+        super().__init__(f"Values cannot be converted to the declared column types: {details}")
+
+
+def apply_schema(data: pd.DataFrame, schema: Optional[Dict[str, str]] = None,
+                 errors: str = "coerce") -> pd.DataFrame:
+    """
+    將活動數據轉為宣告的精簡型別，只處理存在且型別不同的欄位
+
+    整數欄位含有小數或超出範圍時改用 float32，不截斷數值。
+
+    Args:
+        data: 活動數據
+        schema: 欄位名稱 -> dtype，None 表示使用 ACTIVITY_SCHEMA
+        errors: coerce 時無法轉換的值視為缺值（讀取路徑）；raise 時只要有非缺值無法轉換
+            就拋出 SchemaError（寫入路徑，不以缺值覆蓋用戶數據）
+
+    Returns:
+        pd.DataFrame: 轉型後的數據（欄位都已符合時回傳原物件）
+    """
+    converted = {}
+    failures = {}
+    for column, series, lost in _conversions(data, schema):
+        if errors == "raise" and lost.any():
+            failures[column] = data.index[lost]
+        converted[column] = series
+    if failures:
+        raise SchemaError(failures)
+    if not converted:
+        return data
+    data = data.copy(deep=False)
+    for column, series in converted.items():
+        data[column] = series
+    return data
+
+
+def conversion_failures(data: pd.DataFrame, schema: Optional[Dict[str, str]] = None) -> pd.Series:
+    """標記有非缺值無法轉為宣告型別的列（這些列以 apply_schema 寫入會失去原值）"""
+    failed = np.zeros(len(data), dtype=bool)
+    for _, _, lost in _conversions(data, schema):
+        failed |= lost
+    return pd.Series(failed, index=data.index)
+
+
+def _conversions(data: pd.DataFrame, schema: Optional[Dict[str, str]]):
+    """逐欄轉型，產生 (欄位, 轉型後的 Series, 原本有值但轉型後成為缺值的遮罩)"""
+    for column, dtype in (ACTIVITY_SCHEMA if schema is None else schema).items():
+        if column not in data.columns or str(data[column].dtype) == dtype:
+            continue
+        series = _convert(data[column], dtype)
+        yield column, series, series.isna().to_numpy() & data[column].notna().to_numpy()
+
+
+def _convert(series: pd.Series, dtype: str) -> pd.Series:
+    if dtype == "category":
+        return series.astype("category")
+    if dtype.startswith("datetime64"):
+        # 分區中的日期都是 ISO 格式，先以固定格式快速解析，失敗時才逐筆推斷格式
+        dates = pd.to_datetime(series, format="ISO8601", errors="coerce")
+        if dates.isna().sum() > series.isna().sum():
+            dates = pd.to_datetime(series, errors="coerce", format="mixed")
+        return dates
+
+    values = pd.to_numeric(series, errors="coerce")
+    if dtype.startswith("float"):
+        return values.astype(dtype)
+
+    # 可為空的整數型別（Int16/Int32），缺值以遮罩表示
+    info = np.iinfo(dtype.lower())
+    array = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    present = array[~np.isnan(array)]
+    if present.size and (present.min() < info.min or present.max() > info.max
+                         or (values.dtype.kind == "f" and (present % 1).any())):
+        return values.astype("float32")
+    return values.astype(dtype)
+
+
+def as_datetime(series: pd.Series) -> pd.Series:
+    """
+    取得日期欄位的 datetime64 Series
+
+    已是 datetime64 時直接回傳；pd.to_datetime 對已轉型的欄位仍會逐筆檢查，成本與重新解析相近。
+    """
+    if pd.api.types.is_datetime64_dtype(series.dtype):
+        return series
+    return pd.to_datetime(series, errors="coerce")
+
+
+def memory_usage(data: pd.DataFrame) -> int:
+    """DataFrame 實際佔用的位元組數（含 object 欄位的字串內容）"""
+    return int(data.memory_usage(deep=True).sum())
@@ -0,0 +1,208 @@
+import os
+import pandas as pd
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from backend.utils.activity_schema import ACTIVITY_SCHEMA, conversion_failures
+
+# 活動數據必要欄位
+REQUIRED_COLUMNS = [
+    "activity_id", "date", "activity_type", "duration",
+    "distance", "avg_heart_rate", "max_heart_rate"
+]
+
+# 需要轉為數值的欄位（每個 chunk 只轉換一次，所有規則共用）
+NUMERIC_COLUMNS = ["duration", "distance", "avg_heart_rate", "max_heart_rate"]
+
+# 隔離檔中記錄違反規則的欄位名稱
+VIOLATIONS_COLUMN = "_violations"
+
+# 已轉型欄位中標記「有值但無法轉為 ACTIVITY_SCHEMA 型別」的項目名稱
+SCHEMA_FAILURES = "_schema_failures"
+
+
+class ValidationRule(NamedTuple):
+    """
+    單一驗證規則
+
+    check 接收已轉型的欄位 (欄位名稱 -> Series)，回傳標記違規列的布林 Series。
+    """
+    name: str
+    severity: str  # error / warning
+    message: str
+    columns: List[str]
+    check: Callable[[Dict[str, pd.Series]], pd.Series]
+
+
+DEFAULT_RULES = [
+    ValidationRule("duration_invalid", "error", "Duration contains invalid values",
+                   ["duration"], lambda c: c["duration"].isna()),
+    ValidationRule("distance_invalid", "error", "Distance contains invalid values",
+                   ["distance"], lambda c: c["distance"].isna()),
+    ValidationRule("avg_heart_rate_out_of_range", "warning",
+                   "Average heart rate contains values outside normal range",
+                   ["avg_heart_rate"], lambda c: (c["avg_heart_rate"] < 0) | (c["avg_heart_rate"] > 250)),
+    ValidationRule("date_invalid", "error", "Invalid date format",
+                   ["date"], lambda c: c["date"].isna()),
+    # 寫入時 apply_schema 不接受的值（例如 calories、max_heart_rate 中的文字），隔離而不是整批拒絕；
+    # 已由其他 error 規則檢查的欄位不重複標記
+    ValidationRule("schema_invalid", "error", "Values cannot be converted to the declared column types",
+                   [SCHEMA_FAILURES], lambda c: c[SCHEMA_FAILURES]),
+]
+
+
+class ValidationResult:
+    """
+    驗證結果
+
+    masks 為每條規則一欄的布林 DataFrame（True 表示該列違反規則）；
+    串流驗證時只保留各規則的違規筆數。
+    """
+
+    def __init__(self, rules: List[ValidationRule], rows: int = 0, counts: Optional[Dict[str, int]] = None,
+                 masks: Optional[pd.DataFrame] = None, missing_columns: Optional[List[str]] = None):
+        self.rules = rules
+        self.rows = rows
+        self.counts = counts if counts is not None else {rule.name: 0 for rule in rules}
+        self.masks = masks
+        self.missing_columns = missing_columns or []
+
+    @property
+    def error_mask(self) -> pd.Series:
+        """違反任一 error 規則的列"""
+        names = [rule.name for rule in self.rules if rule.severity == "error"]
+        return self.masks[names].any(axis=1)
+
+    @property
+    def warning_mask(self) -> pd.Series:
+        """違反任一 warning 規則的列"""
+        names = [rule.name for rule in self.rules if rule.severity == "warning"]
+        return self.masks[names].any(axis=1)
+
+    @property
+    def valid_mask(self) -> pd.Series:
+        """可以保存的列（沒有違反 error 規則）"""
+        return ~self.error_mask
+
+    @property
+    def is_valid(self) -> bool:
+        return not self.missing_columns and not any(
+            self.counts[rule.name] for rule in self.rules if rule.severity == "error"
+        )
+
+    def merge(self, other: "ValidationResult") -> None:
+        """累加另一個 chunk 的結果（不保留列遮罩）"""
+        self.rows += other.rows
+        for name, count in other.counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+        for column in other.missing_columns:
+            if column not in self.missing_columns:
+                self.missing_columns.append(column)
+        self.masks = None
+
+    def to_messages(self) -> Dict[str, List[str]]:
+        """轉為舊版 validate_activity_data 的 errors / warnings 訊息格式"""
+        messages = {"errors": [], "warnings": []}
+        if self.missing_columns:
+            messages["errors"].append(f"Missing required columns: {', '.join(self.missing_columns)}")
+        for rule in self.rules:
+            if self.counts.get(rule.name):
+                messages["errors" if rule.severity == "error" else "warnings"].append(rule.message)
+        return messages
+
+
+class ActivityValidator:
+    """
+    向量化的活動數據驗證引擎
+
+    每個 chunk 只把各欄位轉型一次，所有規則在同一次走訪中完成，
+    結果以列遮罩表示，呼叫端可以只隔離違規列而不必拒絕整批上傳。
+    """
+
+    def __init__(self, rules: Optional[List[ValidationRule]] = None,
+                 required_columns: Optional[List[str]] = None):
+        self.rules = rules if rules is not None else DEFAULT_RULES
+        self.required_columns = required_columns if required_columns is not None else REQUIRED_COLUMNS
+        checked = {column for rule in self.rules if rule.severity == "error" for column in rule.columns}
+        self._schema = {column: dtype for column, dtype in ACTIVITY_SCHEMA.items() if column not in checked}
+
+    def validate(self, data: pd.DataFrame) -> ValidationResult:
+        """
+        驗證一個 DataFrame
+
+        Args:
+            data: 要驗證的活動數據
+
+        Returns:
+            ValidationResult: 含每列遮罩與各規則違規筆數
+        """
+        columns = self._prepare(data)
+        masks = pd.DataFrame(index=data.index)
+        for rule in self.rules:
+            if all(column in columns for column in rule.columns):
+                masks[rule.name] = rule.check(columns).fillna(False).astype(bool)
+            else:
+                # 缺少欄位已在 missing_columns 回報，不重複標記每一列
+                masks[rule.name] = False
+        counts = {name: int(masks[name].sum()) for name in masks.columns}
+        missing = [column for column in self.required_columns if column not in data.columns]
+        return ValidationResult(self.rules, len(data), counts, masks, missing)
+
+    def validate_csv(self, path: str, chunk_size: int = 100000,
+                     quarantine_path: Optional[str] = None,
+                     valid_path: Optional[str] = None) -> ValidationResult:
+        """
+        分批串流驗證 CSV 檔，記憶體用量與檔案大小無關
+
+        Args:
+            path: CSV 檔案路徑
+            chunk_size: 每批讀取筆數
+            quarantine_path: 違規列寫入的隔離檔，None 表示不輸出
+            valid_path: 通過驗證的列寫入的檔案，None 表示不輸出
+
+        Returns:
+            ValidationResult: 全檔的違規統計
+        """
+        total = ValidationResult(self.rules)
+        for output in (quarantine_path, valid_path):
+            if output and os.path.exists(output):
+                os.remove(output)
+
+        with pd.read_csv(path, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                result = self.validate(chunk)
+                total.merge(result)
+                if quarantine_path:
+                    self._append_csv(quarantine_path, self.quarantine_rows(chunk, result))
+                if valid_path:
+                    self._append_csv(valid_path, chunk[result.valid_mask])
+        return total
+
+    def quarantine_rows(self, data: pd.DataFrame, result: ValidationResult) -> pd.DataFrame:
+        """取出違反 error 規則的列，並附上違反的規則名稱"""
+        error_mask = result.error_mask
+        bad_rows = data[error_mask].copy()
+        names = [rule.name for rule in self.rules if rule.severity == "error"]
+        flags = result.masks.loc[error_mask, names]
+        violations = pd.Series("", index=flags.index)
+        for name in names:
+            violations = violations + flags[name].map({True: name + ",", False: ""})
+        bad_rows[VIOLATIONS_COLUMN] = violations.str.rstrip(",")
+        return bad_rows
+
+    def _prepare(self, data: pd.DataFrame) -> Dict[str, pd.Series]:
+        """將規則用到的欄位各轉型一次"""
+        columns = {}
+        for column in data.columns:
+            if column in NUMERIC_COLUMNS:
+                columns[column] = pd.to_numeric(data[column], errors="coerce")
+            elif column == "date":
+                columns[column] = pd.to_datetime(data[column], errors="coerce")
+            else:
+                columns[column] = data[column]
+        columns[SCHEMA_FAILURES] = conversion_failures(data, self._schema)
+        return columns
+
+    def _append_csv(self, path: str, rows: pd.DataFrame) -> None:
+        if rows.empty:
+            return
+        rows.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
@@ -0,0 +1,231 @@
+import time
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from backend.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from backend.utils.llm_gateway import (
+    RETRYABLE_STATUS, BaseLLMGateway, LLMDeadlineExceeded, LLMError, LLMGateway, LLMHTTPError, LLMTimeoutError,
+    RetryBudget, deadline_exceeded, parse_stream_line
+)
+from backend.utils.llm_telemetry import LLMTelemetry, current_labels
+
+
+class AsyncLLMGateway(BaseLLMGateway):
+    """
+    asyncio 版的 LLMGateway（ASGI 模式使用，見 backend/asgi.py）
+
+    以 httpx.AsyncClient 在事件迴圈上等待上游，等待中的請求不佔用執行緒，
+    單一 process 可同時保持數千個 LLM 請求；逾時、截止時間、重試、斷路器與遙測的行為與 LLMGateway 相同。
+    以 from_gateway 建立時與同步閘道共用斷路器、重試預算與遙測，兩種模式看到的是同一個上游狀態。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.openai.com/v1",
+                 timeout: float = 30.0, connect_timeout: float = 5.0, max_retries: int = 2,
+                 backoff_base: float = 0.25, backoff_cap: float = 4.0,
+                 retry_budget: Optional[RetryBudget] = None, max_connections: int = 1000,
+                 pool_shards: Optional[int] = None, breaker: Optional[CircuitBreaker] = None,
+                 telemetry: Optional[LLMTelemetry] = None, stream_usage: bool = True):
+        super().__init__(api_key, base_url, timeout, connect_timeout, max_retries, backoff_base, backoff_cap,
+                         retry_budget, breaker, telemetry, stream_usage)
+        self.max_connections = max_connections
+        # httpcore 每次分派請求都會掃描連線池中的連線與排隊中的請求，連線數上千時成為 CPU 瓶頸；
+        # 拆成多個各約 25 條連線的 client 輪流使用，掃描成本隨之大幅降低
+        self.pool_shards = pool_shards or max(1, max_connections // 25)
+        self._clients: List[httpx.AsyncClient] = []
+        self._next = 0
+
+    @classmethod
+    def from_gateway(cls, gateway: LLMGateway, max_connections: int = 1000,
+                     pool_shards: Optional[int] = None) -> "AsyncLLMGateway":
+        """沿用同步閘道的設定，並共用其斷路器、重試預算與遙測"""
+        return cls(api_key=gateway.api_key, base_url=gateway.base_url, timeout=gateway.timeout,
+                   connect_timeout=gateway.connect_timeout, max_retries=gateway.max_retries,
+                   backoff_base=gateway.backoff_base, backoff_cap=gateway.backoff_cap,
+                   retry_budget=gateway.retry_budget, max_connections=max_connections, pool_shards=pool_shards,
+                   breaker=gateway.breaker, telemetry=gateway.telemetry, stream_usage=gateway.stream_usage)
+
+    def _client(self) -> httpx.AsyncClient:
+        """輪流取得一個連線池；第一次使用時才建立，連線池綁定在實際執行請求的事件迴圈上"""
+        if not self._clients:
+            per_shard = -(-self.max_connections // self.pool_shards)
+            limits = httpx.Limits(max_connections=per_shard, max_keepalive_connections=per_shard)
+            # 共用同一個 SSL context，避免每個 client 各自載入 CA 憑證
+            ssl_context = httpx.create_ssl_context()
+            self._clients = [httpx.AsyncClient(limits=limits, verify=ssl_context) for _ in range(self.pool_shards)]
+        self._next = (self._next + 1) % len(self._clients)
+        return self._clients[self._next]
+
+    def _httpx_timeout(self) -> httpx.Timeout:
+        connect, read = self._timeouts()
+        return httpx.Timeout(read, connect=connect)
+
+    async def _post(self, payload: Dict[str, Any], stream: bool = False,
+                    call: Optional[Dict[str, int]] = None) -> httpx.Response:
+        """
+        經過斷路器送出請求；含重試在內的整體結果與耗時計入斷路器
+
+        只有上游的失敗（連線錯誤、5xx、上游逾時）算失敗；呼叫端的截止時間已到（LLMDeadlineExceeded）不計入。
+        串流請求取得回應後先不記錄成功，由 _stream 在串流結束後記錄結果。
+        """
+        self.breaker.acquire()
+        started = time.monotonic()
+        try:
+            response = await self._send(payload, stream, call)
+        except LLMDeadlineExceeded:
+            # 呼叫端的截止時間已到，無法判斷上游是否健康
+            self.breaker.release()
+            raise
+        except LLMHTTPError as e:
+            # 用戶端錯誤（400 等）表示上游正常運作
+            self.breaker.record(e.status not in RETRYABLE_STATUS, time.monotonic() - started)
+            raise
+        except Exception:
+            self.breaker.record(False, time.monotonic() - started)
+            raise
+        if not stream:
+            self.breaker.record(True, time.monotonic() - started)
+        return response
+
+    async def _send(self, payload: Dict[str, Any], stream: bool = False,
+                    call: Optional[Dict[str, int]] = None) -> httpx.Response:
+        """送出請求，依退避策略重試可重試的錯誤；重試次數累計到 call["retries"]"""
+        self._count("requests")
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            self._count("attempts")
+            try:
+                client = self._client()
+                request = client.build_request("POST", f"{self.base_url}/chat/completions", json=payload,
+                                               headers=self._headers(), timeout=self._httpx_timeout())
+                response = await client.send(request, stream=stream)
+                if response.status_code < 400:
+                    return response
+                try:
+                    text = (await response.aread()).decode("utf-8", "replace")
+                finally:
+                    await response.aclose()
+                error: LLMError = LLMHTTPError(response.status_code, text[:200])
+                retryable = response.status_code in RETRYABLE_STATUS
+            except LLMTimeoutError:
+                self._count("timeouts")
+                self._count("failures")
+                raise
+            except httpx.TimeoutException as e:
+                self._count("timeouts")
+                error, retryable = self._timeout_error(str(e) or type(e).__name__), True
+            except httpx.HTTPError as e:
+                error, retryable = LLMError(str(e) or type(e).__name__), True
+
+            delay = self._retry_delay(error, retryable, attempt, call)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def chat(self, model: str, messages: List[Dict[str, str]], **params: Any) -> Dict[str, Any]:
+        """
+        呼叫 chat completion
+
+        Args:
+            model: 模型名稱
+            messages: 對話訊息
+            **params: 其他 API 參數（temperature、max_tokens 等）
+
+        Returns:
+            Dict[str, Any]: OpenAI 格式的回應 JSON
+        """
+        started = time.monotonic()
+        call = {"retries": 0}
+        outcome, data = "error", {}
+        try:
+            response = await self._post({"model": model, "messages": messages, **params}, call=call)
+            try:
+                data = response.json()
+            finally:
+                await response.aclose()
+            outcome = "success"
+            return data
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            prompt_tokens, completion_tokens = self._usage(data, messages, outcome)
+            self.telemetry.record_call(model, time.monotonic() - started, prompt_tokens, completion_tokens,
+                                       call["retries"], outcome)
+
+    def stream_chat(self, model: str, messages: List[Dict[str, str]],
+                    **params: Any) -> AsyncIterator[Dict[str, Any]]:
+        """
+        以串流模式呼叫 chat completion，以 async for 逐一取得 chunk JSON
+
+        重試、usage chunk 與遙測標籤的處理同 LLMGateway.stream_chat。
+        """
+        payload = self._stream_payload(model, messages, **params)
+        return self._stream(model, messages, payload, current_labels(model))
+
+    async def _stream(self, model: str, messages: List[Dict[str, str]], payload: Dict[str, Any],
+                      labels: Dict[str, str]) -> AsyncIterator[Dict[str, Any]]:
+        started = time.monotonic()
+        call = {"retries": 0}
+        outcome, ttft, usage, parts = "error", None, {}, []
+        try:
+            response = await self._post(payload, stream=True, call=call)
+            # 串流總長度取決於輸出長度，是否過慢沿用收到回應標頭為止的耗時；
+            # healthy 為 None 表示呼叫端的截止時間已到，不計入斷路器
+            connected, healthy = time.monotonic() - started, False
+            try:
+                async for line in response.aiter_lines():
+                    if deadline_exceeded():
+                        self._count("timeouts")
+                        healthy = None
+                        raise LLMDeadlineExceeded("LLM stream deadline exceeded")
+                    done, chunk = parse_stream_line(line)
+                    if done:
+                        break
+                    if chunk is None:
+                        continue
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    if not chunk.get("choices"):
+                        continue
+                    content = chunk["choices"][0].get("delta", {}).get("content")
+                    if content:
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        parts.append(content)
+                    yield chunk
+                healthy = True
+            except httpx.HTTPError as e:
+                if deadline_exceeded():
+                    self._count("timeouts")
+                    healthy = None
+                    raise LLMDeadlineExceeded(f"LLM stream deadline exceeded ({e or type(e).__name__})") from e
+                raise LLMError(str(e) or type(e).__name__) from e
+            except (GeneratorExit, asyncio.CancelledError):
+                # 呼叫端提前停止讀取不代表上游異常；half_open 的探測呼叫也必須有結果
+                healthy = True
+                raise
+            finally:
+                self._record(healthy, connected)
+                await response.aclose()
+            outcome = "success"
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        except (GeneratorExit, asyncio.CancelledError):
+            # 呼叫端提前停止讀取或客戶端中斷連線
+            outcome = "cancelled"
+            raise
+        finally:
+            prompt_tokens, completion_tokens = self._usage({"usage": usage}, messages, outcome, "".join(parts))
+            self.telemetry.record_call(model, time.monotonic() - started, prompt_tokens, completion_tokens,
+                                       call["retries"], outcome, ttft, labels=labels)
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, []
+        for client in clients:
+            await client.aclose()
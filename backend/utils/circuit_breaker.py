@@ -0,0 +1,115 @@
+import time
+import threading
+from collections import deque
+from typing import Any, Dict
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，呼叫被直接拒絕"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuit '{name}' is open, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    以最近 window_size 次呼叫的失敗率與慢速呼叫比例判斷上游是否健康
+
+    - closed: 正常放行；呼叫數達 min_calls 且失敗率或慢速比例超過門檻時開啟
+    - open: 直接拒絕（CircuitOpenError），open_seconds 秒後進入 half_open
+    - half_open: 只放行 half_open_calls 個探測呼叫，成功則關閉，失敗或過慢則再次開啟
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str = "llm", failure_rate: float = 0.5, slow_call_rate: float = 0.5,
+                 slow_call_seconds: float = 10.0, window_size: int = 20, min_calls: int = 5,
+                 open_seconds: float = 30.0, half_open_calls: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._outcomes: deque = deque(maxlen=window_size)  # (是否失敗, 是否過慢)
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def _refresh(self, now: float) -> None:
+        if self._state == self.OPEN and now - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+
+    def _open(self, now: float) -> None:
+        self._state = self.OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        self.opened += 1
+
+    def acquire(self) -> None:
+        """呼叫上游前取得許可；斷路器開啟或探測名額已滿時拋出 CircuitOpenError"""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            if self._state == self.CLOSED:
+                return
+            if self._state == self.HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return
+            self.rejected += 1
+            retry_after = max(0.0, self._opened_at + self.open_seconds - now)
+            raise CircuitOpenError(self.name, retry_after)
+
+    def release(self) -> None:
+        """歸還 acquire 取得的許可而不記錄結果（例如呼叫端的截止時間已到，無法判斷上游是否健康）"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record(self, success: bool, elapsed: float) -> None:
+        """記錄一次呼叫的結果與耗時（秒）"""
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                if success and not slow:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open(now)
+                return
+            if self._state == self.OPEN:
+                return
+            self._outcomes.append((not success, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, is_slow in self._outcomes if is_slow)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._open(now)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._outcomes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """目前狀態、開啟次數與被拒絕的呼叫數"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return {"state": self._state, "opened": self.opened, "rejected": self.rejected}
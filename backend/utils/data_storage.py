@@ -1,17 +1,116 @@
 import os
+import time
+import uuid
 import shutil
+import threading
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
-from typing import Optional, Dict, List
+from typing import Optional, Dict, Iterator, List, Set, Tuple
 import json
+from backend.utils.storage_formats import (
+    StorageFormat, ColumnarFormat, STORAGE_FORMATS, get_storage_format, split_partition_name, format_for_path
+)
+from backend.utils.partition_catalog import PartitionCatalog
+from backend.utils.snapshot_store import SnapshotStore
+from backend.utils.activity_validation import ActivityValidator
+from backend.utils.partition_lock import PartitionLocker
+from backend.utils.partition_cache import PartitionCache
+from backend.utils.activity_schema import apply_schema, as_datetime
+from backend.utils.hash_ring import HashRing
+
+# 附加寫入模式的 journal 檔案後綴
+JOURNAL_SUFFIX = ".journal.csv"
+
+# 存放根目錄 ID 的檔案（位於每個根目錄中）
+ROOT_ID_FILE = ".storage_root_id"
+
+def read_root_id(root: str) -> str:
+    """
+    取得根目錄的 ID，沒有 ID 檔時建立一個新的
+    
+    雜湊環以 ID 而非路徑放置根目錄，以相對或絕對路徑指定、或更換掛載點都不會改變用戶的歸屬。
+    多個 process 同時建立時以 os.link 保證只有一個 ID 生效。
+    """
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, ROOT_ID_FILE)
+    if not os.path.exists(path):
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(uuid.uuid4().hex)
+        try:
+            os.link(temp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+def iter_partition_file(file_path: str, chunk_size: int, columns: Optional[List[str]] = None,
+                        default_format: Optional[StorageFormat] = None) -> Iterator[pd.DataFrame]:
+    """
+    逐批讀取分區主檔後接 journal，不經過 DataStorage 的目錄與快取（呼叫端需持有分區的共享鎖）
+    
+    只需要分區路徑，因此也能在不建立 DataStorage 的 worker process 中使用。
+    """
+    storage_format = format_for_path(file_path) or default_format
+    if storage_format is not None and storage_format.exists(file_path):
+        for chunk in storage_format.iter_chunks(file_path, chunk_size, columns):
+            yield apply_schema(chunk)
+    journal_path = file_path + JOURNAL_SUFFIX
+    if os.path.exists(journal_path):
+        with pd.read_csv(journal_path, usecols=columns, chunksize=chunk_size) as reader:
+            for chunk in reader:
+                yield apply_schema(chunk)
+
 
 class DataStorage:
-    def __init__(self, base_path: str = "data"):
+    def __init__(self, base_path: str = "data", write_mode: str = "rewrite",
+                 journal_merge_threshold: int = 5000, storage_format: str = "csv",
+                 cache_max_bytes: int = 64 * 1024 * 1024, cold_after_days: int = 180,
+                 roots: Optional[List[str]] = None):
+        """
+        Args:
+            base_path: 資料根目錄
+            write_mode: 預設寫入模式 (rewrite: 讀取並重寫整個月份檔案 / append: 只附加新資料到 journal)
+            journal_merge_threshold: journal 累積多少筆後於背景合併回月份檔案
+            storage_format: 分區檔案格式 (csv/columnar)
+            cache_max_bytes: 已解碼分區快取的記憶體上限，0 表示停用快取
+            cold_after_days: 壓縮時月份結束超過幾天的分區移入壓縮的冷資料層
+            roots: 存放用戶分區的多個根目錄（可位於不同磁碟），依 user_id 一致性雜湊分配到
+                各根目錄的 ID（見 read_root_id）；None 表示只使用 base_path。目錄、備份、鎖與隔離區仍放在 base_path
+        """
+        if write_mode not in ("rewrite", "append"):
+            raise ValueError(f"Unsupported write mode: {write_mode}")
         self.base_path = base_path
-        self.users_path = os.path.join(base_path, "users")
+        self.roots = [os.path.normpath(root) for root in roots] if roots else [base_path]
+        # 根目錄 ID -> 根目錄
+        self.root_ids = {read_root_id(root): root for root in self.roots}
+        if len(self.root_ids) != len(self.roots):
+            raise ValueError(f"Storage roots share a root ID ({ROOT_ID_FILE}): {self.roots}")
+        self.ring = HashRing(self.root_ids)
+        self.users_paths = [os.path.join(root, "users") for root in self.roots]
+        self.users_path = self.users_paths[0]
         self.backups_path = os.path.join(base_path, "backups")
         self.temp_path = os.path.join(base_path, "temp")
+        self.temp_paths = [self.temp_path] + [
+            os.path.join(root, "temp") for root in self.roots if os.path.normpath(root) != os.path.normpath(base_path)
+        ]
+        self.quarantine_path = os.path.join(base_path, "quarantine")
+        self.locks_path = os.path.join(base_path, "locks")
+        self.write_mode = write_mode
+        self.journal_merge_threshold = journal_merge_threshold
+        self.storage_format: StorageFormat = get_storage_format(storage_format)
+        self.cold_after_days = cold_after_days
+        self.validator = ActivityValidator()
+        self._locks = PartitionLocker(self.locks_path)
+        self.cache: Optional[PartitionCache] = PartitionCache(cache_max_bytes) if cache_max_bytes > 0 else None
+        
+        self._merge_guard = threading.Lock()
+        self._merge_executor: Optional[ThreadPoolExecutor] = None
+        self._pending_merges: Set[str] = set()
         
         # 確保所有必要的目錄存在
         self._ensure_directories()
@@ -23,12 +122,33 @@ class DataStorage:
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
         self.logger = logging.getLogger(__name__)
+        
+        # 分區目錄：首次建立時從既有檔案重建
+        catalog_file = os.path.join(base_path, "catalog.sqlite")
+        is_new_catalog = not os.path.exists(catalog_file)
+        self.catalog = PartitionCatalog(catalog_file)
+        self.snapshots = SnapshotStore(self.backups_path)
+        if is_new_catalog:
+            self.rebuild_catalog()
 
     def _ensure_directories(self):
         """確保所有必要的目錄存在"""
-        for path in [self.users_path, self.backups_path, self.temp_path]:
+        for path in self.users_paths + self.temp_paths + [self.backups_path, self.quarantine_path]:
             os.makedirs(path, exist_ok=True)
 
+    def root_for(self, user_id: str) -> str:
+        """用戶在雜湊環上所屬的根目錄"""
+        return self.root_ids[self.ring.get_node(str(user_id))]
+
+    def _users_path_for(self, user_id: str) -> str:
+        """用戶所在根目錄的 users 目錄"""
+        return os.path.join(self.root_for(user_id), "users")
+
+    def _walk_users(self) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """依序走訪所有根目錄的 users 目錄（呼叫端可修改 dirnames 略過子目錄）"""
+        for users_path in self.users_paths:
+            yield from os.walk(users_path)
+
     def get_activity_file_path(self, user_id: str, activity_type: str, date: datetime) -> str:
         """
         根據命名規範生成活動文件路徑
@@ -42,14 +162,15 @@ class DataStorage:
             str: 完整的文件路徑
         """
         # 確保用戶目錄存在
-        user_dir = os.path.join(self.users_path, f"user_{user_id}", activity_type)
+        user_dir = os.path.join(self._users_path_for(user_id), f"user_{user_id}", activity_type)
         os.makedirs(user_dir, exist_ok=True)
         
-        # 生成文件名 (YYYYMM.csv)
-        filename = f"{date.strftime('%Y%m')}.csv"
+        # 生成文件名 (YYYYMM.csv，欄式格式為 YYYYMM.col)
+        filename = f"{date.strftime('%Y%m')}{self.storage_format.extension}"
         return os.path.join(user_dir, filename)
 
-    def save_activity_data(self, user_id: str, activity_type: str, data: pd.DataFrame) -> bool:
+    def save_activity_data(self, user_id: str, activity_type: str, data: pd.DataFrame,
+                           mode: Optional[str] = None, quarantine: bool = False) -> bool:
         """
         保存活動數據到CSV文件
         
@@ -57,23 +178,35 @@ class DataStorage:
             user_id: 用戶ID
             activity_type: 活動類型
             data: 活動數據DataFrame
+            mode: 寫入模式 (rewrite/append)，未指定時使用 self.write_mode
+            quarantine: 是否先驗證並隔離無效的列，只保存有效的列
             
         Returns:
-            bool: 是否成功保存
+            bool: 是否成功保存；未隔離時，含有無法轉為宣告型別之值的批次整批不保存並回傳 False
         """
+        mode = mode or self.write_mode
         try:
+            if quarantine:
+                data, _ = self.quarantine_invalid_rows(user_id, data)
+                if data.empty:
+                    return True
+
             # 獲取當前日期
             current_date = datetime.now()
             file_path = self.get_activity_file_path(user_id, activity_type, current_date)
             
-            # 如果文件已存在，讀取並合併數據
-            if os.path.exists(file_path):
-                existing_data = pd.read_csv(file_path)
-                data = pd.concat([existing_data, data], ignore_index=True)
-                data = data.drop_duplicates(subset=['activity_id'])
+            # 同一分區的寫入以檔案鎖互斥（跨 worker process），不同分區可平行寫入
+            with self._locks.exclusive(file_path):
+                self._thaw_if_cold(file_path)
+                if mode == "append":
+                    appended = self._append_to_journal(file_path, data)
+                else:
+                    self._rewrite_partition(file_path, data)
+                    appended = 0
+            
+            if appended and self._journal_rows(file_path) >= self.journal_merge_threshold:
+                self._schedule_merge(file_path)
             
-            # 保存數據
-            data.to_csv(file_path, index=False)
             self.logger.info(f"Successfully saved activity data for user {user_id}, type {activity_type}")
             return True
             
@@ -81,9 +214,736 @@ class DataStorage:
             self.logger.error(f"Error saving activity data: {str(e)}")
             return False
 
+    def save_partition_data(self, user_id: str, activity_type: str, date: datetime, data: pd.DataFrame) -> int:
+        """
+        將數據合併寫入指定月份的分區（一次讀寫整個分區，供批次匯入使用）
+        
+        Args:
+            user_id: 用戶ID
+            activity_type: 活動類型
+            date: 分區月份內的任一日期
+            data: 屬於該月份的活動數據
+            
+        Returns:
+            int: 實際新增的筆數（已存在的 activity_id 不重複計算）
+        """
+        file_path = self.get_activity_file_path(user_id, activity_type, date)
+        with self._locks.exclusive(file_path):
+            self._thaw_if_cold(file_path)
+            before = self.catalog.get_partition(file_path)
+            self._rewrite_partition(file_path, data)
+            after = self.catalog.get_partition(file_path)
+        return after["rows"] - (before["rows"] if before else 0)
+
+    def _rewrite_partition(self, file_path: str, data: pd.DataFrame) -> None:
+        """讀取整個分區（含 journal）、合併新資料、去重後重寫"""
+        existing_data = self._read_partition(file_path)
+        if existing_data is not None:
+            data = pd.concat([existing_data, data], ignore_index=True)
+        data = data.drop_duplicates(subset=['activity_id'])
+        
+        self._write_partition(self.storage_format, file_path, data)
+        self._reset_journal(file_path, data)
+
+    def _write_partition(self, storage_format: StorageFormat, file_path: str, data: pd.DataFrame) -> None:
+        """
+        以宣告的欄位型別寫入分區主檔（呼叫端需持有該分區的獨佔鎖）
+        
+        有值無法轉型時拋出 SchemaError 而不寫入，需要部分保存時由呼叫端先以 quarantine_invalid_rows 隔離。
+        """
+        storage_format.write(file_path, apply_schema(data, errors="raise"))
+
+    def _read_partition(self, file_path: str, storage_format: Optional[StorageFormat] = None,
+                        columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """讀取分區主檔並套用尚未合併的 journal（呼叫端需持有該分區的鎖）"""
+        storage_format = storage_format or format_for_path(file_path) or self.storage_format
+        journal_path = file_path + JOURNAL_SUFFIX
+        has_journal = os.path.exists(journal_path)
+        read_columns = columns
+        if columns is not None and has_journal and 'activity_id' not in columns:
+            read_columns = list(columns) + ['activity_id']
+        
+        frames = []
+        if storage_format.exists(file_path):
+            frames.append(storage_format.read(file_path, read_columns))
+        if has_journal:
+            frames.append(pd.read_csv(journal_path, usecols=read_columns))
+        if not frames:
+            return None
+        if len(frames) == 1:
+            return apply_schema(frames[0])
+        # 主檔本身已去重，只有合併 journal 時才需要再去重
+        data = pd.concat(frames, ignore_index=True)
+        data = data.drop_duplicates(subset=['activity_id'])
+        return apply_schema(data[columns] if columns is not None else data)
+
+    # ----------- 區間查詢 -----------
+    def load_activities(self, user_id: str, activity_type: str, start=None, end=None,
+                        columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        讀取指定期間內的活動數據，只開啟與期間重疊的月份分區
+        
+        Args:
+            user_id: 用戶ID
+            activity_type: 活動類型
+            start: 起始日期（含），None 表示不限
+            end: 結束日期（含當日），None 表示不限
+            columns: 只讀取指定欄位，None 表示全部欄位
+            
+        Returns:
+            pd.DataFrame: 期間內的活動數據
+        """
+        chunks = list(self.iter_activities(user_id, activity_type, start, end, columns, chunk_size=None))
+        if not chunks:
+            return pd.DataFrame(columns=columns)
+        # 各分區的 category 欄位類別不同時 concat 會退回 object，合併後重新套用型別
+        return apply_schema(pd.concat(chunks, ignore_index=True))
+
+    def iter_activities(self, user_id: str, activity_type: str, start=None, end=None,
+                        columns: Optional[List[str]] = None,
+                        chunk_size: Optional[int] = 10000) -> Iterator[pd.DataFrame]:
+        """
+        以產生器逐批讀取指定期間內的活動數據，每批最多 chunk_size 筆，
+        多年資料也能以固定記憶體處理
+        
+        Args:
+            user_id: 用戶ID
+            activity_type: 活動類型
+            start: 起始日期（含），None 表示不限
+            end: 結束日期（含當日），None 表示不限
+            columns: 只讀取指定欄位，None 表示全部欄位
+            chunk_size: 每批最大筆數，None 表示每個分區一批
+            
+        Yields:
+            pd.DataFrame: 期間內的活動數據
+        """
+        start_ts, end_ts = self._normalize_range(start, end)
+        filter_dates = start_ts is not None or end_ts is not None
+        read_columns = columns
+        if columns is not None and filter_dates and 'date' not in columns:
+            read_columns = list(columns) + ['date']
+        
+        for file_path in self._partitions_in_range(user_id, activity_type, start_ts, end_ts):
+            for chunk in self._iter_partition_chunks(file_path, chunk_size, read_columns):
+                if filter_dates:
+                    dates = as_datetime(chunk['date'])
+                    mask = dates.notna()
+                    if start_ts is not None:
+                        mask &= dates >= start_ts
+                    if end_ts is not None:
+                        mask &= dates < end_ts
+                    chunk = chunk[mask]
+                if columns is not None:
+                    chunk = chunk[columns]
+                if not chunk.empty:
+                    yield chunk.reset_index(drop=True)
+
+    def list_activity_types(self, user_id: str) -> List[str]:
+        """
+        用戶有資料的活動類型
+        
+        Args:
+            user_id: 用戶ID
+            
+        Returns:
+            List[str]: 活動類型（依名稱排序）
+        """
+        types = {p["activity_type"] for p in self.catalog.list_partitions(str(user_id))}
+        for users_path in self.users_paths:
+            user_dir = os.path.join(users_path, f"user_{user_id}")
+            if os.path.isdir(user_dir):
+                types.update(entry for entry in os.listdir(user_dir) if os.path.isdir(os.path.join(user_dir, entry)))
+        return sorted(types)
+
+    def aggregate(self, user_ids: List[str], metrics: Optional[List[str]] = None, group_by: Optional[str] = "week",
+                  start=None, end=None, workers: Optional[int] = None, **kwargs) -> pd.DataFrame:
+        """
+        依期間彙總多位用戶的活動指標（各分區在 process pool 中計算部分彙總後合併）
+        
+        Args:
+            user_ids: 用戶ID列表
+            metrics: 指標名稱，None 表示距離、時間、活動數與平均心率
+            group_by: 期間 (day/week/month/year)，None 表示整段期間合計
+            start: 起始日期（含），None 表示不限
+            end: 結束日期（含當日），None 表示不限
+            workers: process 數量，None 表示 CPU 數
+            
+        Returns:
+            pd.DataFrame: 每個 (user_id, period) 一列，欄位為各指標
+        """
+        # activity_aggregation 匯入本模組，在此延遲匯入避免循環匯入
+        from backend.utils.activity_aggregation import ActivityAggregator
+        return ActivityAggregator(self, workers=workers).aggregate(user_ids, metrics, group_by, start, end, **kwargs)
+
+    def _read_partition_cached(self, file_path: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """經由分區快取讀取整個分區（呼叫端需持有該分區的鎖）"""
+        if self.cache is None:
+            return self._read_partition(file_path, columns=columns)
+        key = (file_path, tuple(columns) if columns is not None else None)
+        version = self._partition_version(file_path)
+        data = self.cache.get(key, version)
+        if data is None:
+            data = self._read_partition(file_path, columns=columns)
+            if data is not None:
+                self.cache.put(key, version, data)
+        return data
+
+    def _partition_version(self, file_path: str) -> Tuple:
+        """分區版本標記：目錄版本加上主檔與 journal 的 mtime，其他 process 寫入後也會改變"""
+        partition = self.catalog.get_partition(file_path)
+        tokens = [partition["version"] if partition else None]
+        for path in (file_path, file_path + JOURNAL_SUFFIX):
+            try:
+                tokens.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                tokens.append(None)
+        return tuple(tokens)
+
+    def _normalize_range(self, start, end) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        """將查詢區間轉為 [start, end) 的 Timestamp；只給日期的 end 包含當日"""
+        start_ts = pd.Timestamp(start) if start is not None else None
+        end_ts = pd.Timestamp(end) if end is not None else None
+        if end_ts is not None and end_ts == end_ts.normalize():
+            end_ts += pd.Timedelta(days=1)
+        elif end_ts is not None:
+            end_ts += pd.Timedelta(microseconds=1)
+        return start_ts, end_ts
+
+    def _partitions_in_range(self, user_id: str, activity_type: str, start_ts: Optional[pd.Timestamp],
+                             end_ts: Optional[pd.Timestamp]) -> List[str]:
+        """
+        挑出與查詢區間重疊的分區，依月份排序
+        
+        目錄中有記錄時依分區實際的 min/max 日期判斷；否則退回依 YYYYMM 檔名判斷。
+        """
+        cataloged = self.catalog.list_partitions(
+            user_id, activity_type,
+            start_date=start_ts.isoformat() if start_ts is not None else None,
+            end_date=end_ts.isoformat() if end_ts is not None else None
+        )
+        # 冷資料層的壓縮分區同樣納入，讀取時依副檔名解壓縮
+        formats = self._tier_formats()
+        if cataloged or self.catalog.list_partitions(user_id, activity_type):
+            return [p["path"] for p in cataloged if format_for_path(p["path"]) in formats]
+        
+        start_month = start_ts.strftime('%Y%m') if start_ts is not None else None
+        end_month = (end_ts - pd.Timedelta(microseconds=1)).strftime('%Y%m') if end_ts is not None else None
+        
+        partitions = []
+        # 重新平衡尚未完成時，用戶資料可能還留在其他根目錄
+        for users_path in self.users_paths:
+            type_dir = os.path.join(users_path, f"user_{user_id}", activity_type)
+            if not os.path.isdir(type_dir):
+                continue
+            for entry in os.listdir(type_dir):
+                # 只有 journal 尚未合併的分區也要納入
+                name = entry[:-len(JOURNAL_SUFFIX)] if entry.endswith(JOURNAL_SUFFIX) else entry
+                parsed = split_partition_name(name)
+                if parsed is None or parsed[1] not in formats:
+                    continue
+                month = parsed[0]
+                if (start_month is None or month >= start_month) and (end_month is None or month <= end_month):
+                    partitions.append((month, os.path.join(type_dir, name)))
+        return [path for _, path in sorted(set(partitions))]
+
+    def _tier_formats(self) -> List[StorageFormat]:
+        """目前格式與其冷資料層格式"""
+        cold = self._cold_format(self.storage_format)
+        return [self.storage_format, cold] if cold else [self.storage_format]
+
+    def _iter_partition_chunks(self, file_path: str, chunk_size: Optional[int],
+                               columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """
+        逐批讀取單一分區（主檔後接 journal）
+        
+        附加模式只會把主檔中不存在的 activity_id 寫入 journal，因此串流時不需跨批去重。
+        讀取期間持有分區的共享鎖，避免讀到合併或重寫到一半的分區。
+        """
+        with self._locks.shared(file_path):
+            if chunk_size is None:
+                data = self._read_partition_cached(file_path, columns)
+                if data is not None:
+                    yield data
+                return
+            yield from iter_partition_file(file_path, chunk_size, columns, self.storage_format)
+
+    # ----------- 附加寫入 (journal) -----------
+    def _append_to_journal(self, file_path: str, data: pd.DataFrame) -> int:
+        """
+        只將尚未存在的新資料附加到分區 journal，成本與批次大小成正比
+        
+        Returns:
+            int: 實際附加的筆數
+        """
+        ids = data['activity_id'].astype(str)
+        known_ids = self.catalog.existing_ids(file_path, ids.unique().tolist())
+        mask = ~ids.isin(known_ids) & ~ids.duplicated()
+        new_rows = data[mask]
+        if new_rows.empty:
+            return 0
+        
+        journal_path = file_path + JOURNAL_SUFFIX
+        write_header = not os.path.exists(journal_path)
+        size_before = os.path.getsize(journal_path) if not write_header else 0
+        apply_schema(new_rows, errors="raise").to_csv(journal_path, mode='a', header=write_header, index=False)
+        
+        user_id, activity_type, month = self._parse_partition_path(file_path)
+        min_date, max_date = self._date_range(new_rows)
+        self.catalog.add_ids(file_path, user_id, activity_type, ids[mask].tolist())
+        self.catalog.record_append(
+            file_path, user_id, activity_type, month, self.storage_format.name,
+            rows=len(new_rows), min_date=min_date, max_date=max_date,
+            bytes=os.path.getsize(journal_path) - size_before
+        )
+        return len(new_rows)
+
+    def _reset_journal(self, file_path: str, data: pd.DataFrame,
+                       storage_format: Optional[StorageFormat] = None) -> None:
+        """分區重寫後清除 journal 並以完整資料更新目錄"""
+        journal_path = file_path + JOURNAL_SUFFIX
+        if os.path.exists(journal_path):
+            os.remove(journal_path)
+        self._record_partition(file_path, data, storage_format)
+
+    def _record_partition(self, file_path: str, data: pd.DataFrame,
+                          storage_format: Optional[StorageFormat] = None, journal_rows: int = 0) -> None:
+        """將分區的筆數、日期範圍、大小、校驗碼與 activity_id 寫入目錄"""
+        storage_format = storage_format or format_for_path(file_path) or self.storage_format
+        user_id, activity_type, month = self._parse_partition_path(file_path)
+        min_date, max_date = self._date_range(data)
+        journal_path = file_path + JOURNAL_SUFFIX
+        journal_bytes = os.path.getsize(journal_path) if os.path.exists(journal_path) else 0
+        self.catalog.upsert_partition(
+            file_path, user_id, activity_type, month, storage_format.name,
+            rows=len(data), min_date=min_date, max_date=max_date,
+            bytes=storage_format.size(file_path) + journal_bytes,
+            checksum=storage_format.checksum(file_path) if storage_format.exists(file_path) else None,
+            journal_rows=journal_rows
+        )
+        self.catalog.replace_ids(file_path, user_id, activity_type, data['activity_id'].astype(str).tolist())
+
+    def _parse_partition_path(self, file_path: str) -> Tuple[str, str, str]:
+        """從 user_<id>/<type>/YYYYMM.<ext> 路徑取出 (user_id, activity_type, YYYYMM)"""
+        type_dir, filename = os.path.split(file_path)
+        user_dir, activity_type = os.path.split(type_dir)
+        user_id = os.path.basename(user_dir)[len("user_"):]
+        parsed = split_partition_name(filename)
+        return user_id, activity_type, parsed[0] if parsed else os.path.splitext(filename)[0]
+
+    def _date_range(self, data: pd.DataFrame) -> Tuple[Optional[str], Optional[str]]:
+        """資料中 date 欄位的最小/最大值（ISO 字串）"""
+        if 'date' not in data.columns:
+            return None, None
+        dates = as_datetime(data['date']).dropna()
+        if dates.empty:
+            return None, None
+        return dates.min().isoformat(), dates.max().isoformat()
+
+    def _journal_rows(self, file_path: str) -> int:
+        partition = self.catalog.get_partition(file_path)
+        return partition["journal_rows"] if partition else 0
+
+    def activity_exists(self, user_id: str, activity_id: str, activity_type: Optional[str] = None) -> bool:
+        """
+        檢查活動是否已保存（查詢目錄索引，不讀取分區檔案）
+        
+        Args:
+            user_id: 用戶ID
+            activity_id: 活動ID
+            activity_type: 活動類型，None 表示任何類型
+            
+        Returns:
+            bool: 是否存在
+        """
+        return self.catalog.find_activity(user_id, activity_id, activity_type) is not None
+
+    def get_storage_size(self, user_id: Optional[str] = None) -> int:
+        """
+        取得分區佔用的位元組數（由目錄統計，不走訪檔案）
+        
+        Args:
+            user_id: 用戶ID，None 表示所有用戶
+            
+        Returns:
+            int: 位元組數
+        """
+        return self.catalog.total_bytes(user_id)
+
+    def rebuild_catalog(self) -> int:
+        """
+        掃描 users 目錄重建分區目錄（首次啟用目錄或檔案被外部修改時使用）
+        
+        Returns:
+            int: 記錄的分區數量
+        """
+        self.catalog.clear()
+        recorded = 0
+        for dirpath, dirnames, filenames in self._walk_users():
+            for entry in sorted(dirnames + filenames):
+                parsed = split_partition_name(entry)
+                if parsed is None:
+                    continue
+                storage_format = parsed[1]
+                file_path = os.path.join(dirpath, entry)
+                with self._locks.shared(file_path):
+                    data = self._read_partition(file_path, storage_format)
+                    if data is None:
+                        continue
+                    journal_path = file_path + JOURNAL_SUFFIX
+                    journal_rows = len(pd.read_csv(journal_path, usecols=['activity_id'])) if os.path.exists(journal_path) else 0
+                    self._record_partition(file_path, data, storage_format, journal_rows)
+                recorded += 1
+            # 欄式分區本身是目錄，不需再往下走訪
+            dirnames[:] = [d for d in dirnames if not d.endswith(ColumnarFormat.extension)]
+        self.logger.info(f"Rebuilt partition catalog with {recorded} partitions")
+        return recorded
+
+    def merge_journal(self, file_path: str) -> bool:
+        """
+        將分區 journal 合併回月份檔案
+        
+        Args:
+            file_path: 分區檔案路徑 (get_activity_file_path 的回傳值)
+            
+        Returns:
+            bool: 是否成功合併
+        """
+        try:
+            with self._locks.exclusive(file_path):
+                if not os.path.exists(file_path + JOURNAL_SUFFIX):
+                    return True
+                data = self._read_partition(file_path)
+                self._write_partition(self.storage_format, file_path, data)
+                self._reset_journal(file_path, data)
+            self.logger.info(f"Merged journal into {file_path}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error merging journal for {file_path}: {str(e)}")
+            return False
+        finally:
+            self._pending_merges.discard(file_path)
+
+    def merge_all_journals(self) -> int:
+        """
+        合併所有待處理的 journal（供排程任務定期呼叫）
+        
+        Returns:
+            int: 成功合併的分區數量
+        """
+        merged = 0
+        for file_path in self.catalog.pending_journals():
+            if self.merge_journal(file_path):
+                merged += 1
+        return merged
+
+    def _schedule_merge(self, file_path: str) -> None:
+        """在背景執行緒合併 journal，同一分區不重複排程"""
+        with self._merge_guard:
+            if file_path in self._pending_merges:
+                return
+            self._pending_merges.add(file_path)
+            if self._merge_executor is None:
+                self._merge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal-merge")
+        self._merge_executor.submit(self.merge_journal, file_path)
+
+    def wait_for_merges(self) -> None:
+        """等待所有背景合併完成"""
+        with self._merge_guard:
+            executor, self._merge_executor = self._merge_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def convert_partitions(self, target_format: str) -> int:
+        """
+        將所有分區就地轉換為指定格式（保留 YYYYMM 分區命名），
+        轉換完成後此實例改用新格式讀寫
+        
+        Args:
+            target_format: 目標格式名稱 (csv/columnar)
+            
+        Returns:
+            int: 轉換的分區數量
+        """
+        target = get_storage_format(target_format)
+        converted = 0
+        for dirpath, dirnames, filenames in self._walk_users():
+            for entry in sorted(dirnames + filenames):
+                parsed = split_partition_name(entry)
+                if parsed is None:
+                    continue
+                stem, source = parsed
+                # 冷資料層的分區轉換為目標格式的冷資料層格式
+                destination = self._cold_format(target) if not source.cold_format and target.cold_format else target
+                source_path = os.path.join(dirpath, entry)
+                if source is destination or not source.exists(source_path):
+                    continue
+                target_path = os.path.join(dirpath, stem + destination.extension)
+                try:
+                    with self._locks.exclusive(source_path), self._locks.exclusive(target_path):
+                        data = self._read_partition(source_path, source)
+                        self._write_partition(destination, target_path, data)
+                        if os.path.exists(source_path + JOURNAL_SUFFIX):
+                            os.remove(source_path + JOURNAL_SUFFIX)
+                        source.remove(source_path)
+                        self.catalog.remove_partition(source_path)
+                        self._reset_journal(target_path, data, destination)
+                    converted += 1
+                except Exception as e:
+                    self.logger.error(f"Error converting partition {source_path}: {str(e)}")
+            # 欄式分區本身是目錄，不需再往下走訪
+            dirnames[:] = [d for d in dirnames if not d.endswith(ColumnarFormat.extension)]
+        
+        self.storage_format = target
+        self.logger.info(f"Converted {converted} partitions to {target.name}")
+        return converted
+
+    # ----------- 多根目錄 -----------
+    def rebalance(self, retired_roots: Optional[List[str]] = None, dry_run: bool = False) -> Dict[str, int]:
+        """
+        將不在雜湊環所屬根目錄上的用戶搬到正確的根目錄（新增根目錄後執行），
+        只有歸屬改變的用戶會被搬移
+        
+        Args:
+            retired_roots: 要清空的舊根目錄（已不在 roots 中），其上的用戶全部搬出
+            dry_run: 只統計需要搬移的用戶與大小，不實際搬移
+            
+        Returns:
+            Dict[str, int]: 掃描的用戶數、搬移的用戶數、分區數與位元組數
+        """
+        report = {"users_scanned": 0, "users_moved": 0, "partitions_moved": 0, "bytes_moved": 0}
+        sources = self.users_paths + [os.path.join(root, "users") for root in (retired_roots or [])]
+        for users_path in sources:
+            if not os.path.isdir(users_path):
+                continue
+            for user_dir in sorted(os.listdir(users_path)):
+                if not user_dir.startswith("user_"):
+                    continue
+                report["users_scanned"] += 1
+                target_users_path = self._users_path_for(user_dir[len("user_"):])
+                if os.path.normpath(target_users_path) == os.path.normpath(users_path):
+                    continue
+                moved = self._move_user(os.path.join(users_path, user_dir),
+                                        os.path.join(target_users_path, user_dir), dry_run)
+                report["users_moved"] += 1
+                report["partitions_moved"] += moved[0]
+                report["bytes_moved"] += moved[1]
+        self.logger.info(f"Rebalanced storage roots{' (dry run)' if dry_run else ''}: {report}")
+        return report
+
+    def _move_user(self, source_dir: str, target_dir: str, dry_run: bool) -> Tuple[int, int]:
+        """
+        逐一分區搬移用戶目錄；目標已有同月份分區時（搬移前已寫入新根目錄）合併兩者
+        
+        Returns:
+            Tuple[int, int]: (搬移的分區數, 位元組數)
+        """
+        partitions, moved_bytes = 0, 0
+        for dirpath, dirnames, filenames in os.walk(source_dir):
+            for entry in sorted(dirnames + filenames):
+                parsed = split_partition_name(entry)
+                if parsed is None:
+                    continue
+                storage_format = parsed[1]
+                source_path = os.path.join(dirpath, entry)
+                journal_path = source_path + JOURNAL_SUFFIX
+                size = storage_format.size(source_path) + (
+                    os.path.getsize(journal_path) if os.path.exists(journal_path) else 0)
+                partitions += 1
+                moved_bytes += size
+                if dry_run:
+                    continue
+                target_path = os.path.join(target_dir, os.path.relpath(source_path, source_dir))
+                os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                with self._locks.exclusive(source_path), self._locks.exclusive(target_path):
+                    if storage_format.exists(target_path) or os.path.exists(target_path + JOURNAL_SUFFIX):
+                        data = pd.concat([self._read_partition(target_path, storage_format),
+                                          self._read_partition(source_path, storage_format)], ignore_index=True)
+                        data = data.drop_duplicates(subset=['activity_id'])
+                        self._write_partition(storage_format, target_path, data)
+                        self._drop_partition(source_path, storage_format)
+                        self._reset_journal(target_path, data, storage_format)
+                    else:
+                        shutil.move(source_path, target_path)
+                        if os.path.exists(journal_path):
+                            shutil.move(journal_path, target_path + JOURNAL_SUFFIX)
+                        self.catalog.rename_partition(source_path, target_path)
+                        if self.cache is not None:
+                            self.cache.invalidate(source_path)
+            # 分區目錄（欄式格式）本身不需再往下走訪
+            dirnames[:] = [d for d in dirnames if split_partition_name(d) is None]
+        
+        if not dry_run:
+            # 移除已搬空的目錄
+            for dirpath, _, _ in sorted(os.walk(source_dir), key=lambda item: -len(item[0])):
+                if not os.listdir(dirpath):
+                    os.rmdir(dirpath)
+        return partitions, moved_bytes
+
+    # ----------- 壓縮與冷資料層 -----------
+    def _cold_path(self, file_path: str) -> Optional[str]:
+        """熱資料分區路徑對應的冷資料層路徑，目前格式沒有冷資料層時回傳 None"""
+        parsed = split_partition_name(os.path.basename(file_path))
+        cold = self._cold_format(parsed[1]) if parsed else None
+        if cold is None:
+            return None
+        return os.path.join(os.path.dirname(file_path), parsed[0] + cold.extension)
+
+    def _thaw_if_cold(self, file_path: str) -> None:
+        """
+        寫入前把同月份的冷資料分區解壓回熱資料層（呼叫端需持有 file_path 的獨佔鎖）
+        
+        鎖的取得順序固定為先熱後冷，與 compact_partitions 相同。
+        """
+        cold_path = self._cold_path(file_path)
+        if cold_path is None:
+            return
+        cold = format_for_path(cold_path)
+        with self._locks.exclusive(cold_path):
+            if not cold.exists(cold_path):
+                return
+            data = self._read_partition(cold_path, cold)
+            existing = self._read_partition(file_path)
+            if existing is not None:
+                data = pd.concat([existing, data], ignore_index=True).drop_duplicates(subset=['activity_id'])
+            self._write_partition(self.storage_format, file_path, data)
+            self._drop_partition(cold_path, cold)
+            self._reset_journal(file_path, data)
+        self.logger.info(f"Thawed cold partition {cold_path}")
+
+    def _drop_partition(self, file_path: str, storage_format: StorageFormat) -> None:
+        """刪除分區檔案、journal、目錄記錄與快取（呼叫端需持有該分區的獨佔鎖）"""
+        if os.path.exists(file_path + JOURNAL_SUFFIX):
+            os.remove(file_path + JOURNAL_SUFFIX)
+        storage_format.remove(file_path)
+        self.catalog.remove_partition(file_path)
+        if self.cache is not None:
+            self.cache.invalidate(file_path)
+
+    def compact_partitions(self, cold_after_days: Optional[int] = None,
+                           now: Optional[datetime] = None) -> Dict[str, Dict]:
+        """
+        壓縮所有分區：合併 journal、依日期排序並去除重複的 activity_id；
+        月份結束超過 cold_after_days 天的分區改寫為壓縮的冷資料層格式。
+        讀取路徑會依副檔名自動解壓縮，冷資料分區被寫入時會先解壓回熱資料層。
+        
+        Args:
+            cold_after_days: 移入冷資料層的天數門檻，None 表示使用建構時的設定
+            now: 計算分區年齡的基準時間，None 表示現在
+            
+        Returns:
+            Dict[str, Dict]: 依資料層 (hot/cold) 統計的分區數、壓縮前後大小、
+            回收的位元組數，以及壓縮前後讀取整個分區的耗時 (毫秒)
+        """
+        cold_after_days = self.cold_after_days if cold_after_days is None else cold_after_days
+        cutoff = pd.Timestamp(now or datetime.now()) - pd.Timedelta(days=cold_after_days)
+        report = {
+            tier: {"partitions": 0, "bytes_before": 0, "bytes_after": 0, "bytes_reclaimed": 0,
+                   "read_ms_before": 0.0, "read_ms_after": 0.0}
+            for tier in ("hot", "cold")
+        }
+        self.wait_for_merges()
+        
+        for partition in self.catalog.list_partitions():
+            file_path = partition["path"]
+            source = format_for_path(file_path)
+            hot = next((f for f in STORAGE_FORMATS.values()
+                        if f.cold_format and source in (f, self._cold_format(f))), None)
+            if hot is None:
+                continue
+            hot_path = os.path.join(os.path.dirname(file_path), partition["month"] + hot.extension)
+            cold_path = self._cold_path(hot_path)
+            month_end = pd.Timestamp(f"{partition['month']}01") + pd.offsets.MonthBegin(1)
+            tier = "cold" if month_end <= cutoff else "hot"
+            target_path = cold_path if tier == "cold" else hot_path
+            # 已在冷資料層且沒有 journal 的分區不需重新解壓縮
+            if file_path == cold_path and tier == "cold" and not partition["journal_rows"]:
+                continue
+            try:
+                # 鎖的取得順序固定為先熱後冷
+                with self._locks.exclusive(hot_path), self._locks.exclusive(cold_path):
+                    result = self._compact_partition(file_path, target_path)
+            except Exception as e:
+                self.logger.error(f"Error compacting partition {file_path}: {str(e)}")
+                continue
+            if result is None:
+                continue
+            report[tier]["partitions"] += 1
+            for name, value in result.items():
+                report[tier][name] += value
+        
+        for tier in report.values():
+            tier["bytes_reclaimed"] = tier["bytes_before"] - tier["bytes_after"]
+            tier["read_ms_before"] = round(tier["read_ms_before"], 3)
+            tier["read_ms_after"] = round(tier["read_ms_after"], 3)
+        self.logger.info(f"Compacted partitions: {report}")
+        return report
+
+    def _cold_format(self, storage_format: StorageFormat) -> Optional[StorageFormat]:
+        return get_storage_format(storage_format.cold_format) if storage_format.cold_format else None
+
+    def _compact_partition(self, file_path: str, target_path: str) -> Optional[Dict[str, float]]:
+        """
+        壓縮單一分區並寫到 target_path（熱或冷資料層，呼叫端需持有兩者的獨佔鎖）
+        
+        Returns:
+            Optional[Dict[str, float]]: 壓縮前後大小與讀取耗時；分區已是最佳狀態，
+            或就地重寫的熱資料分區沒有變小時回傳 None（保留原分區與 journal）
+        """
+        source = format_for_path(file_path)
+        target = format_for_path(target_path)
+        journal_path = file_path + JOURNAL_SUFFIX
+        has_journal = os.path.exists(journal_path)
+        bytes_before = source.size(file_path) + (os.path.getsize(journal_path) if has_journal else 0)
+        
+        started = time.perf_counter()
+        data = self._read_partition(file_path, source)
+        read_ms_before = (time.perf_counter() - started) * 1000
+        if data is None:
+            return None
+        if target_path != file_path and target.exists(target_path):
+            bytes_before += target.size(target_path)
+            data = pd.concat([data, self._read_partition(target_path, target)], ignore_index=True)
+        data = data.reset_index(drop=True)
+        
+        compacted = data.drop_duplicates(subset=['activity_id'])
+        if 'date' in compacted.columns:
+            order = as_datetime(compacted['date']).argsort(kind='stable')
+            compacted = compacted.iloc[order]
+        compacted = compacted.reset_index(drop=True)
+        # 已排序、無重複且沒有 journal 的熱資料分區不需重寫
+        if target_path == file_path and not has_journal and compacted['activity_id'].equals(data['activity_id']):
+            return None
+        
+        if target_path == file_path:
+            # 先寫到同目錄的暫存位置比較大小；欄式格式合併小 journal 時可能比原本的主檔加 CSV journal 更大
+            scratch_path = f"{file_path}.compact-{os.getpid()}-{threading.get_ident()}"
+            self._write_partition(target, scratch_path, compacted)
+            if target.size(scratch_path) >= bytes_before:
+                target.remove(scratch_path)
+                self.logger.info(f"Skipped compacting {file_path}: rewritten partition is not smaller")
+                return None
+            target.replace(scratch_path, file_path)
+        else:
+            self._write_partition(target, target_path, compacted)
+            self._drop_partition(file_path, source)
+        self._reset_journal(target_path, compacted, target)
+        
+        started = time.perf_counter()
+        self._read_partition(target_path, target)
+        read_ms_after = (time.perf_counter() - started) * 1000
+        return {
+            "bytes_before": bytes_before,
+            "bytes_after": target.size(target_path),
+            "read_ms_before": read_ms_before,
+            "read_ms_after": read_ms_after
+        }
+
     def backup_data(self, backup_type: str = "daily") -> bool:
         """
-        執行數據備份
+        執行增量數據備份
+        
+        快照只記錄每個檔案的內容雜湊，未變動的檔案沿用已保存的物件，
+        備份時間與空間只與上次備份後變動的資料量成正比。
         
         Args:
             backup_type: 備份類型 (daily/weekly)
@@ -93,31 +953,92 @@ class DataStorage:
         """
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_dir = os.path.join(self.backups_path, f"{backup_type}_{timestamp}")
-            
-            # 創建備份目錄
-            os.makedirs(backup_dir, exist_ok=True)
-            
-            # 複製用戶數據
-            shutil.copytree(self.users_path, os.path.join(backup_dir, "users"))
+            backup_name = f"{backup_type}_{timestamp}"
+            suffix = 1
+            while os.path.exists(os.path.join(self.backups_path, backup_name)):
+                backup_name = f"{backup_type}_{timestamp}_{suffix}"
+                suffix += 1
             
             # 記錄備份信息
-            backup_info = {
+            # 快照以「根目錄序號/相對於 users 目錄的路徑」記錄，讀取每個分區時持有其共享鎖
+            backup_info = self.snapshots.create(backup_name, self.users_paths, {
                 "timestamp": timestamp,
-                "type": backup_type,
-                "size": self._get_directory_size(backup_dir)
-            }
+                "type": backup_type
+            }, partition_of=self._partition_of, lock=self._locks.shared)
             
-            with open(os.path.join(backup_dir, "backup_info.json"), "w") as f:
-                json.dump(backup_info, f)
-            
-            self.logger.info(f"Successfully created {backup_type} backup at {backup_dir}")
+            self.logger.info(
+                f"Successfully created {backup_type} backup {backup_name} "
+                f"({backup_info['changed_files']} changed files, {backup_info['size']} new bytes)"
+            )
             return True
             
         except Exception as e:
             self.logger.error(f"Error creating backup: {str(e)}")
             return False
 
+    def list_backups(self) -> List[Dict]:
+        """
+        列出所有備份快照（依建立時間排序）
+        
+        Returns:
+            List[Dict]: 每個快照的 backup_info，含 name 欄位
+        """
+        return self.snapshots.list()
+
+    def restore_backup(self, backup_name: str) -> bool:
+        """
+        將 users 目錄還原為指定快照的內容，並重建分區目錄
+        
+        多個根目錄時，每位用戶的檔案依目前的雜湊環還原到所屬的根目錄。
+        
+        Args:
+            backup_name: 快照名稱 (list_backups 回傳的 name)
+            
+        Returns:
+            bool: 是否成功還原
+        """
+        try:
+            self.wait_for_merges()
+            restored = self.snapshots.restore(backup_name, self.users_paths, place=self._root_index_for_backup_path)
+            self.rebuild_catalog()
+            self.logger.info(f"Restored {restored} files from backup {backup_name}")
+            return True
+        except Exception as e:
+            self.logger.error(f"Error restoring backup {backup_name}: {str(e)}")
+            return False
+
+    def _partition_of(self, path: str) -> str:
+        """users 目錄下的檔案所屬的分區路徑（journal 與欄式分區目錄內的檔案都歸到分區本身）"""
+        for users_path in self.users_paths:
+            rel_path = os.path.relpath(path, users_path)
+            parts = rel_path.split(os.sep)
+            # user_<id>/<activity_type>/<分區>[/<欄位檔>]
+            if parts[0] != os.pardir and len(parts) >= 3:
+                partition = os.path.join(users_path, *parts[:3])
+                return partition[:-len(JOURNAL_SUFFIX)] if partition.endswith(JOURNAL_SUFFIX) else partition
+        return path
+
+    def _root_index_for_backup_path(self, rel_path: str) -> int:
+        """快照中的相對路徑 (user_<id>/...，不含根目錄序號) 應還原到第幾個根目錄"""
+        user_dir = rel_path.split(os.sep, 1)[0]
+        if not user_dir.startswith("user_"):
+            return 0
+        return self.users_paths.index(self._users_path_for(user_dir[len("user_"):]))
+
+    def delete_backup(self, backup_name: str) -> int:
+        """
+        刪除快照並回收不再被引用的物件
+        
+        Args:
+            backup_name: 快照名稱
+            
+        Returns:
+            int: 釋放的位元組數
+        """
+        freed = self.snapshots.delete(backup_name)
+        self.logger.info(f"Deleted backup {backup_name}, freed {freed} bytes")
+        return freed
+
     def validate_activity_data(self, data: pd.DataFrame) -> Dict[str, List[str]]:
         """
         驗證活動數據的完整性和有效性
@@ -128,70 +1049,51 @@ class DataStorage:
         Returns:
             Dict[str, List[str]]: 驗證結果，包含錯誤和警告信息
         """
-        validation_results = {
-            "errors": [],
-            "warnings": []
-        }
-        
-        # 檢查必要欄位
-        required_columns = [
-            "activity_id", "date", "activity_type", "duration", 
-            "distance", "avg_heart_rate", "max_heart_rate"
-        ]
-        
-        missing_columns = [col for col in required_columns if col not in data.columns]
-        if missing_columns:
-            validation_results["errors"].append(f"Missing required columns: {', '.join(missing_columns)}")
+        return self.validator.validate(data).to_messages()
+
+    def quarantine_invalid_rows(self, user_id: str, data: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
+        """
+        驗證數據並將違反 error 規則的列移到隔離區，其餘列可以照常保存
         
-        # 檢查數據類型
-        if "duration" in data.columns and not pd.to_numeric(data["duration"], errors="coerce").notnull().all():
-            validation_results["errors"].append("Duration contains invalid values")
+        Args:
+            user_id: 用戶ID
+            data: 活動數據DataFrame
             
-        if "distance" in data.columns and not pd.to_numeric(data["distance"], errors="coerce").notnull().all():
-            validation_results["errors"].append("Distance contains invalid values")
-        
-        # 檢查數值範圍
-        if "avg_heart_rate" in data.columns:
-            if (data["avg_heart_rate"] < 0).any() or (data["avg_heart_rate"] > 250).any():
-                validation_results["warnings"].append("Average heart rate contains values outside normal range")
-        
-        # 檢查日期格式
-        if "date" in data.columns:
-            try:
-                pd.to_datetime(data["date"])
-            except:
-                validation_results["errors"].append("Invalid date format")
-        
-        return validation_results
-
-    def _get_directory_size(self, path: str) -> int:
-        """獲取目錄大小（字節）"""
-        total_size = 0
-        for dirpath, dirnames, filenames in os.walk(path):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                total_size += os.path.getsize(fp)
-        return total_size
+        Returns:
+            Tuple[pd.DataFrame, int]: (通過驗證的列, 被隔離的筆數)
+        """
+        result = self.validator.validate(data)
+        if result.missing_columns:
+            raise ValueError(f"Missing required columns: {', '.join(result.missing_columns)}")
+        bad_rows = self.validator.quarantine_rows(data, result)
+        if not bad_rows.empty:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            quarantine_file = os.path.join(self.quarantine_path, f"user_{user_id}_{timestamp}.csv")
+            bad_rows.to_csv(quarantine_file, index=False)
+            self.logger.warning(f"Quarantined {len(bad_rows)} invalid rows for user {user_id} to {quarantine_file}")
+        return data[result.valid_mask], len(bad_rows)
 
     def cleanup_temp_files(self, max_age_days: int = 7) -> None:
         """
-        清理臨時文件
+        清理所有根目錄的臨時文件
         
         Args:
             max_age_days: 臨時文件最大保留天數
         """
         try:
             current_time = datetime.now()
-            for filename in os.listdir(self.temp_path):
-                file_path = os.path.join(self.temp_path, filename)
-                if not os.path.isfile(file_path):
-                    continue
-                    
-                file_age = current_time - datetime.fromtimestamp(os.path.getctime(file_path))
-                
-                if file_age.days >= max_age_days:  # 修改為 >= 以包含當天
-                    os.remove(file_path)
-                    self.logger.info(f"Cleaned up temp file: {filename}")
+            for temp_path in self.temp_paths:
+                # scandir 的項目已帶有 stat 資訊，不需對每個檔案再呼叫 isfile/getctime
+                with os.scandir(temp_path) as entries:
+                    for entry in entries:
+                        if not entry.is_file():
+                            continue
+                            
+                        file_age = current_time - datetime.fromtimestamp(entry.stat().st_ctime)
+                        
+                        if file_age.days >= max_age_days:  # 修改為 >= 以包含當天
+                            os.remove(entry.path)
+                            self.logger.info(f"Cleaned up temp file: {entry.name}")
                     
         except Exception as e:
             self.logger.error(f"Error cleaning up temp files: {str(e)}") 
\ No newline at end of file
@@ -0,0 +1,49 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List
+
+
+class HashRing:
+    """
+    一致性雜湊環
+
+    每個節點在環上放置 replicas 個虛擬節點，鍵對應到順時針方向的第一個虛擬節點。
+    新增或移除節點時只有約 1/N 的鍵會改變歸屬。
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 128):
+        self.replicas = replicas
+        self._ring: Dict[int, str] = {}
+        self._positions: List[int] = []
+        for node in nodes:
+            self.add_node(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        # md5 只用於分散鍵值，不涉及安全性；跨 process 與重新啟動都保持穩定
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self._ring.values()))
+
+    def add_node(self, node: str) -> None:
+        for i in range(self.replicas):
+            position = self._hash(f"{node}#{i}")
+            if position not in self._ring:
+                bisect.insort(self._positions, position)
+            self._ring[position] = node
+
+    def remove_node(self, node: str) -> None:
+        for i in range(self.replicas):
+            position = self._hash(f"{node}#{i}")
+            if self._ring.get(position) == node:
+                del self._ring[position]
+                self._positions.remove(position)
+
+    def get_node(self, key: str) -> str:
+        """鍵所屬的節點"""
+        if not self._positions:
+            raise ValueError("Hash ring has no nodes")
+        index = bisect.bisect(self._positions, self._hash(str(key))) % len(self._positions)
+        return self._ring[self._positions[index]]
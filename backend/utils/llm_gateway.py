@@ -0,0 +1,471 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Mapping, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.config import Config
+from backend.utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from backend.utils.activity_features import estimate_tokens
+from backend.utils.llm_telemetry import LLMTelemetry, current_labels, llm_telemetry, message_tokens
+
+logger = logging.getLogger(__name__)
+
+# 目前請求的截止時間（time.monotonic()），由入口（例如 Flask 的 before_request）設定後傳遞到所有 LLM 呼叫
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("llm_deadline", default=None)
+
+# 可重試的 HTTP 狀態碼
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """LLM 呼叫失敗"""
+
+
+class LLMTimeoutError(LLMError):
+    """超過截止時間或連線逾時"""
+
+
+class LLMDeadlineExceeded(LLMTimeoutError):
+    """呼叫端的截止時間已到（不代表上游異常）"""
+
+
+class LLMHTTPError(LLMError):
+    """上游回傳錯誤狀態碼"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"LLM upstream returned {status}: {message}")
+        self.status = status
+
+
+def set_deadline(seconds: Optional[float]) -> contextvars.Token:
+    """設定目前 context 剩餘的時間預算（秒），回傳供 reset_deadline 使用的 token"""
+    return _deadline.set(time.monotonic() + seconds if seconds is not None else None)
+
+
+def reset_deadline(token: contextvars.Token) -> None:
+    _deadline.reset(token)
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """在 with 區塊內的 LLM 呼叫都不超過 seconds 秒；巢狀時取較早的截止時間"""
+    outer = _deadline.get()
+    deadline = time.monotonic() + seconds if seconds is not None else None
+    if outer is not None and (deadline is None or outer < deadline):
+        deadline = outer
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """目前 context 距離截止時間的秒數，沒有截止時間時回傳 None"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def deadline_exceeded() -> bool:
+    """目前 context 的截止時間是否已過"""
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+class RetryBudget:
+    """
+    全域重試預算
+
+    最近 window 秒內的重試次數不得超過 min_retries + ratio × 請求數，
+    上游大規模故障時重試量因此有上限，不會把負載放大成重試風暴。
+    """
+
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: deque = deque()
+        self._retries: deque = deque()
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def _trim(self, now: float) -> None:
+        for events in (self._requests, self._retries):
+            while events and events[0] <= now - self.window:
+                events.popleft()
+
+    def record_request(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_acquire(self) -> bool:
+        """取得一次重試的額度；預算用盡時回傳 False"""
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                self.exhausted += 1
+                return False
+            self._retries.append(now)
+            return True
+
+
+class BaseLLMGateway:
+    """
+    LLMGateway 與 AsyncLLMGateway 共用的設定、重試策略、統計與 usage 計算
+
+    子類別只負責實際的 HTTP 傳輸（requests 或 httpx.AsyncClient）。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.openai.com/v1",
+                 timeout: float = 30.0, connect_timeout: float = 5.0, max_retries: int = 2,
+                 backoff_base: float = 0.25, backoff_cap: float = 4.0,
+                 retry_budget: Optional[RetryBudget] = None,
+                 breaker: Optional[CircuitBreaker] = None, telemetry: Optional[LLMTelemetry] = None,
+                 stream_usage: bool = True):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.retry_budget = retry_budget or RetryBudget()
+        self.breaker = breaker or CircuitBreaker()
+        self.telemetry = telemetry or llm_telemetry
+        # 串流時要求上游在最後一個 chunk 附上 usage（OpenAI 的 stream_options）
+        self.stream_usage = stream_usage
+
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "attempts": 0, "retries": 0, "failures": 0, "timeouts": 0}
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """請求數、實際送出次數、重試次數、失敗與逾時次數、重試預算耗盡次數與斷路器狀態"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats["retry_budget_exhausted"] = self.retry_budget.exhausted
+        stats["circuit"] = self.breaker.stats()
+        return stats
+
+    def _record(self, healthy: Optional[bool], elapsed: float) -> None:
+        """記錄一次呼叫的結果到斷路器；healthy 為 None（呼叫端的截止時間已到）時不記錄，只歸還許可"""
+        if healthy is None:
+            self.breaker.release()
+        else:
+            self.breaker.record(healthy, elapsed)
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _timeouts(self) -> tuple:
+        """(連線逾時, 讀取逾時)，不超過剩餘的截止時間"""
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            raise LLMDeadlineExceeded("LLM request deadline exceeded")
+        read = self.timeout if remaining is None else min(self.timeout, remaining)
+        return min(self.connect_timeout, read), read
+
+    @staticmethod
+    def _timeout_error(message: str) -> LLMTimeoutError:
+        """上游逾時對應的例外；逾時因截止時間縮短而發生（截止時間已過）時為 LLMDeadlineExceeded"""
+        if deadline_exceeded():
+            return LLMDeadlineExceeded(f"LLM request deadline exceeded ({message})")
+        return LLMTimeoutError(message)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _retry_delay(self, error: LLMError, retryable: bool, attempt: int,
+                     call: Optional[Dict[str, int]] = None) -> float:
+        """
+        決定是否重試失敗的嘗試
+
+        不可重試、超過 max_retries、剩餘時間不足以退避或重試預算用盡時拋出 error；
+        否則回傳退避秒數，並將重試次數累計到 call["retries"]
+        """
+        delay = self._backoff(attempt)
+        remaining = remaining_time()
+        if (not retryable or attempt >= self.max_retries
+                or (remaining is not None and remaining <= delay)
+                or not self.retry_budget.try_acquire()):
+            self._count("failures")
+            raise error
+        logger.warning(f"LLM request failed ({error}), retrying in {delay:.2f}s")
+        self._count("retries")
+        if call is not None:
+            call["retries"] += 1
+        return delay
+
+    def _stream_payload(self, model: str, messages: List[Dict[str, str]], **params: Any) -> Dict[str, Any]:
+        payload = {"model": model, "messages": messages, "stream": True, **params}
+        if self.stream_usage:
+            payload.setdefault("stream_options", {"include_usage": True})
+        return payload
+
+    @staticmethod
+    def _usage(data: Dict[str, Any], messages: List[Dict[str, str]], outcome: str,
+               completion: str = None) -> tuple:
+        """(prompt_tokens, completion_tokens)：優先使用上游回傳的 usage，否則估算；失敗的呼叫為 (0, 0)"""
+        if outcome != "success":
+            return 0, 0
+        usage = data.get("usage") or {}
+        if "prompt_tokens" in usage:
+            return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        if completion is None:
+            choices = data.get("choices") or [{}]
+            completion = (choices[0].get("message") or {}).get("content") or ""
+        return message_tokens(messages), estimate_tokens(completion)
+
+
+def parse_stream_line(line: str) -> tuple:
+    """
+    解析上游 SSE 串流的一行
+
+    Returns:
+        tuple: (是否結束, chunk)；非 data 行與空行的 chunk 為 None
+    """
+    if not line or not line.startswith("data:"):
+        return False, None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return True, None
+    return False, json.loads(data)
+
+
+class LLMGateway(BaseLLMGateway):
+    """
+    共用的 LLM 連線閘道（OpenAI 相容的 /chat/completions API）
+
+    - 以 requests.Session 連線池保持 keep-alive，所有端點與 AIAnalyzer 共用
+    - 每次呼叫的逾時不超過目前 context 的截止時間（見 request_deadline）
+    - 連線錯誤、逾時與 429/5xx 以 full jitter 指數退避重試，次數受 max_retries 與全域 RetryBudget 限制
+    - 上游失敗率或慢速比例過高時由 CircuitBreaker 開啟斷路，直接拋出 CircuitOpenError 而不等待逾時
+    - 每次呼叫的 token 數、延遲、第一個 token 時間與重試次數記錄到 LLMTelemetry
+    回應為 OpenAI 格式的 JSON dict。ASGI 模式的非同步版本見 backend/utils/async_llm_gateway.py。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.openai.com/v1",
+                 timeout: float = 30.0, connect_timeout: float = 5.0, max_retries: int = 2,
+                 backoff_base: float = 0.25, backoff_cap: float = 4.0,
+                 retry_budget: Optional[RetryBudget] = None, pool_size: int = 20,
+                 breaker: Optional[CircuitBreaker] = None, telemetry: Optional[LLMTelemetry] = None,
+                 stream_usage: bool = True):
+        super().__init__(api_key, base_url, timeout, connect_timeout, max_retries, backoff_base, backoff_cap,
+                         retry_budget, breaker, telemetry, stream_usage)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _post(self, payload: Dict[str, Any], stream: bool = False,
+              call: Optional[Dict[str, int]] = None) -> requests.Response:
+        """
+        經過斷路器送出請求；含重試在內的整體結果與耗時計入斷路器
+
+        只有上游的失敗（連線錯誤、5xx、上游逾時）算失敗；呼叫端的截止時間已到（LLMDeadlineExceeded）不計入。
+        串流請求取得回應後先不記錄成功，由 _stream 在串流結束後記錄結果。
+        """
+        self.breaker.acquire()
+        started = time.monotonic()
+        try:
+            response = self._send(payload, stream, call)
+        except LLMDeadlineExceeded:
+            # 呼叫端的截止時間已到，無法判斷上游是否健康
+            self.breaker.release()
+            raise
+        except LLMHTTPError as e:
+            # 用戶端錯誤（400 等）表示上游正常運作
+            self.breaker.record(e.status not in RETRYABLE_STATUS, time.monotonic() - started)
+            raise
+        except Exception:
+            self.breaker.record(False, time.monotonic() - started)
+            raise
+        if not stream:
+            self.breaker.record(True, time.monotonic() - started)
+        return response
+
+    def _send(self, payload: Dict[str, Any], stream: bool = False,
+              call: Optional[Dict[str, int]] = None) -> requests.Response:
+        """送出請求，依退避策略重試可重試的錯誤；重試次數累計到 call["retries"]"""
+        self._count("requests")
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            self._count("attempts")
+            try:
+                response = self.session.post(f"{self.base_url}/chat/completions", json=payload,
+                                             headers=self._headers(), timeout=self._timeouts(), stream=stream)
+                if response.status_code < 400:
+                    return response
+                error: LLMError = LLMHTTPError(response.status_code, response.text[:200])
+                retryable = response.status_code in RETRYABLE_STATUS
+                response.close()
+            except LLMTimeoutError:
+                self._count("timeouts")
+                self._count("failures")
+                raise
+            except requests.Timeout as e:
+                self._count("timeouts")
+                error, retryable = self._timeout_error(str(e)), True
+            except requests.RequestException as e:
+                error, retryable = LLMError(str(e)), True
+
+            delay = self._retry_delay(error, retryable, attempt, call)
+            attempt += 1
+            time.sleep(delay)
+
+    def chat(self, model: str, messages: List[Dict[str, str]], **params: Any) -> Dict[str, Any]:
+        """
+        呼叫 chat completion
+
+        Args:
+            model: 模型名稱
+            messages: 對話訊息
+            **params: 其他 API 參數（temperature、max_tokens 等）
+
+        Returns:
+            Dict[str, Any]: OpenAI 格式的回應 JSON
+        """
+        started = time.monotonic()
+        call = {"retries": 0}
+        outcome, data = "error", {}
+        try:
+            response = self._post({"model": model, "messages": messages, **params}, call=call)
+            try:
+                data = response.json()
+            finally:
+                response.close()
+            outcome = "success"
+            return data
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        finally:
+            prompt_tokens, completion_tokens = self._usage(data, messages, outcome)
+            self.telemetry.record_call(model, time.monotonic() - started, prompt_tokens, completion_tokens,
+                                       call["retries"], outcome)
+
+    def stream_chat(self, model: str, messages: List[Dict[str, str]], **params: Any) -> Iterator[Dict[str, Any]]:
+        """
+        以串流模式呼叫 chat completion，逐一產生 chunk JSON
+
+        只有建立連線前的失敗會重試；開始輸出後中斷或超過截止時間則拋出 LLMError。
+        上游附上 usage 的最後一個 chunk（沒有 choices）由閘道記錄後略過，不會產生給呼叫端。
+        遙測標籤取呼叫 stream_chat 當下的值，之後在其他 context 中讀取串流也不受影響。
+        """
+        payload = self._stream_payload(model, messages, **params)
+        return self._stream(model, messages, payload, current_labels(model))
+
+    def _stream(self, model: str, messages: List[Dict[str, str]], payload: Dict[str, Any],
+                labels: Dict[str, str]) -> Iterator[Dict[str, Any]]:
+        started = time.monotonic()
+        call = {"retries": 0}
+        outcome, ttft, usage, parts = "error", None, {}, []
+        try:
+            response = self._post(payload, stream=True, call=call)
+            # 串流總長度取決於輸出長度，是否過慢沿用收到回應標頭為止的耗時；
+            # healthy 為 None 表示呼叫端的截止時間已到，不計入斷路器
+            connected, healthy = time.monotonic() - started, False
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if deadline_exceeded():
+                        self._count("timeouts")
+                        healthy = None
+                        raise LLMDeadlineExceeded("LLM stream deadline exceeded")
+                    done, chunk = parse_stream_line(line)
+                    if done:
+                        break
+                    if chunk is None:
+                        continue
+                    if chunk.get("usage"):
+                        usage = chunk["usage"]
+                    if not chunk.get("choices"):
+                        continue
+                    content = chunk["choices"][0].get("delta", {}).get("content")
+                    if content:
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        parts.append(content)
+                    yield chunk
+                healthy = True
+            except requests.RequestException as e:
+                if deadline_exceeded():
+                    self._count("timeouts")
+                    healthy = None
+                    raise LLMDeadlineExceeded(f"LLM stream deadline exceeded ({e})") from e
+                raise LLMError(str(e)) from e
+            except GeneratorExit:
+                # 呼叫端提前停止讀取不代表上游異常；half_open 的探測呼叫也必須有結果
+                healthy = True
+                raise
+            finally:
+                self._record(healthy, connected)
+                response.close()
+            outcome = "success"
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        except GeneratorExit:
+            # 呼叫端提前停止讀取（例如客戶端中斷 SSE 連線）
+            outcome = "cancelled"
+            raise
+        finally:
+            prompt_tokens, completion_tokens = self._usage({"usage": usage}, messages, outcome, "".join(parts))
+            self.telemetry.record_call(model, time.monotonic() - started, prompt_tokens, completion_tokens,
+                                       call["retries"], outcome, ttft, labels=labels)
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_default_gateway: Optional[LLMGateway] = None
+_default_lock = threading.Lock()
+
+# get_gateway 讀取的設定，預設值見 config/config.py
+GATEWAY_SETTINGS = ('OPENAI_BASE_URL', 'LLM_TIMEOUT', 'LLM_MAX_RETRIES', 'LLM_POOL_SIZE',
+                    'LLM_BREAKER_FAILURE_RATE', 'LLM_BREAKER_SLOW_SECONDS', 'LLM_BREAKER_OPEN_SECONDS')
+
+
+def get_gateway(config: Optional[Mapping[str, Any]] = None) -> LLMGateway:
+    """
+    process 內共用的 LLMGateway
+
+    第一次呼叫時依 config（例如 create_app 的 app.config）建立，config 中沒有的設定取 config/config.py 的 Config；
+    之後的呼叫回傳同一個閘道。
+    """
+    global _default_gateway
+    with _default_lock:
+        if _default_gateway is None:
+            settings = {key: getattr(Config, key) for key in GATEWAY_SETTINGS}
+            settings.update({key: config[key] for key in GATEWAY_SETTINGS if config and key in config})
+            _default_gateway = LLMGateway(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=settings['OPENAI_BASE_URL'],
+                timeout=settings['LLM_TIMEOUT'],
+                max_retries=settings['LLM_MAX_RETRIES'],
+                pool_size=settings['LLM_POOL_SIZE'],
+                breaker=CircuitBreaker(
+                    failure_rate=settings['LLM_BREAKER_FAILURE_RATE'],
+                    slow_call_seconds=settings['LLM_BREAKER_SLOW_SECONDS'],
+                    open_seconds=settings['LLM_BREAKER_OPEN_SECONDS']
+                )
+            )
+        return _default_gateway
@@ -0,0 +1,180 @@
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+try:
+    from prometheus_client import Counter, Histogram
+except ImportError:  # prometheus_client 為選用依賴，未安裝時只保留 process 內統計
+    Counter = Histogram = None
+
+from backend.utils.activity_features import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 每次 LLM 呼叫的標籤：endpoint 由 Flask 請求或批次工作設定，insight_type 由呼叫端設定，model 由閘道填入
+LABELS = ("endpoint", "insight_type", "model")
+_labels: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar("llm_labels", default={})
+
+# 每 1K token 的美元價格 (prompt, completion)，以最長的前綴比對模型名稱
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4": (0.03, 0.06),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+TTFT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000)
+
+if Counter is not None:
+    LLM_REQUESTS = Counter('llm_requests_total', 'LLM 呼叫次數', LABELS + ('outcome',))
+    LLM_TOKENS = Counter('llm_tokens_total', 'LLM token 數', LABELS + ('kind',))
+    LLM_COST = Counter('llm_cost_usd_total', 'LLM 估算費用（美元）', LABELS)
+    LLM_RETRIES = Counter('llm_retries_total', 'LLM 重試次數', LABELS)
+    LLM_CACHE_HITS = Counter('llm_cache_hits_total', 'LLM 回應快取命中次數', LABELS)
+    LLM_LATENCY = Histogram('llm_request_duration_seconds', 'LLM 呼叫總耗時', LABELS, buckets=LATENCY_BUCKETS)
+    LLM_TTFT = Histogram('llm_time_to_first_token_seconds', 'LLM 串流第一個 token 的等待時間', LABELS,
+                         buckets=TTFT_BUCKETS)
+    LLM_COMPLETION_TOKENS = Histogram('llm_completion_tokens', '每次呼叫的 completion token 數', LABELS,
+                                      buckets=TOKEN_BUCKETS)
+
+
+def set_llm_labels(**labels: str) -> contextvars.Token:
+    """在目前 context 加上標籤，回傳供 reset_llm_labels 使用的 token"""
+    return _labels.set({**_labels.get(), **labels})
+
+
+def reset_llm_labels(token: contextvars.Token) -> None:
+    _labels.reset(token)
+
+
+@contextmanager
+def llm_labels(**labels: str):
+    """with 區塊內的 LLM 呼叫都帶上這些標籤（例如 insight_type）"""
+    token = set_llm_labels(**labels)
+    try:
+        yield
+    finally:
+        reset_llm_labels(token)
+
+
+def current_labels(model: str) -> Dict[str, str]:
+    labels = _labels.get()
+    return {"endpoint": labels.get("endpoint") or "unknown",
+            "insight_type": labels.get("insight_type") or "none",
+            "model": model}
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """依 MODEL_PRICES 估算費用（美元），未知模型回傳 None"""
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    if not matches:
+        return None
+    prompt_price, completion_price = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def message_tokens(messages: List[Dict[str, str]]) -> int:
+    """上游沒有回傳 usage 時估算提示的 token 數"""
+    return sum(estimate_tokens(str(message.get("content") or "")) for message in messages)
+
+
+class LLMTelemetry:
+    """
+    記錄每次 LLM 呼叫的 token 數、延遲、第一個 token 時間、重試次數與快取命中
+
+    指標以 (endpoint, insight_type, model) 為標籤匯出到 Prometheus，並保留 process 內的累計值供 stats() 查詢。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[tuple, Dict[str, float]] = {}
+
+    def _entry(self, labels: Dict[str, str]) -> Dict[str, float]:
+        key = tuple(labels[name] for name in LABELS)
+        entry = self._totals.get(key)
+        if entry is None:
+            entry = self._totals[key] = {"calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                         "cost_usd": 0.0, "retries": 0, "cache_hits": 0,
+                                         "latency_seconds": 0.0, "ttft_seconds": 0.0, "streams": 0}
+        return entry
+
+    def record_call(self, model: str, latency: float, prompt_tokens: int = 0, completion_tokens: int = 0,
+                    retries: int = 0, outcome: str = "success", ttft: Optional[float] = None,
+                    labels: Optional[Dict[str, str]] = None) -> None:
+        """
+        記錄一次送往上游的呼叫
+
+        Args:
+            model: 模型名稱
+            latency: 總耗時（秒，串流為最後一個 chunk 的時間）
+            prompt_tokens / completion_tokens: token 數（上游 usage 或估算值）
+            retries: 這次呼叫的重試次數
+            outcome: success / error / circuit_open / cancelled
+            ttft: 串流模式第一個 token 的等待時間（秒）
+            labels: 標籤，預設取目前 context 的值
+        """
+        labels = labels or current_labels(model)
+        cost = estimate_cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            entry = self._entry(labels)
+            entry["calls"] += 1
+            entry["errors"] += outcome != "success"
+            entry["prompt_tokens"] += prompt_tokens
+            entry["completion_tokens"] += completion_tokens
+            entry["cost_usd"] += cost or 0.0
+            entry["retries"] += retries
+            entry["latency_seconds"] += latency
+            if ttft is not None:
+                entry["ttft_seconds"] += ttft
+                entry["streams"] += 1
+        if Counter is not None:
+            LLM_REQUESTS.labels(outcome=outcome, **labels).inc()
+            LLM_LATENCY.labels(**labels).observe(latency)
+            if retries:
+                LLM_RETRIES.labels(**labels).inc(retries)
+            if ttft is not None:
+                LLM_TTFT.labels(**labels).observe(ttft)
+            if outcome == "success":
+                LLM_TOKENS.labels(kind="prompt", **labels).inc(prompt_tokens)
+                LLM_TOKENS.labels(kind="completion", **labels).inc(completion_tokens)
+                LLM_COMPLETION_TOKENS.labels(**labels).observe(completion_tokens)
+            if cost:
+                LLM_COST.labels(**labels).inc(cost)
+        ttft_text = f"{ttft:.3f}s" if ttft is not None else "-"
+        logger.info(f"LLM call endpoint={labels['endpoint']} insight_type={labels['insight_type']} "
+                    f"model={model} outcome={outcome} latency={latency:.3f}s ttft={ttft_text} "
+                    f"prompt_tokens={prompt_tokens} completion_tokens={completion_tokens} retries={retries}")
+
+    def record_cache_hit(self, model: str) -> None:
+        """記錄一次由回應快取直接回傳、沒有呼叫上游的請求"""
+        labels = current_labels(model)
+        with self._lock:
+            self._entry(labels)["cache_hits"] += 1
+        if Counter is not None:
+            LLM_CACHE_HITS.labels(**labels).inc()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """各 (endpoint, insight_type, model) 的累計值與平均延遲"""
+        with self._lock:
+            rows = [(key, dict(entry)) for key, entry in self._totals.items()]
+        result = []
+        for key, entry in sorted(rows):
+            entry.update(zip(LABELS, key))
+            entry["avg_latency_seconds"] = round(entry["latency_seconds"] / entry["calls"], 3) if entry["calls"] else 0.0
+            entry["avg_ttft_seconds"] = round(entry["ttft_seconds"] / entry["streams"], 3) if entry["streams"] else None
+            entry["cost_usd"] = round(entry["cost_usd"], 6)
+            result.append(entry)
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+
+
+# process 內共用的實例，LLMGateway 與 AIAnalyzer 都寫入這裡
+llm_telemetry = LLMTelemetry()
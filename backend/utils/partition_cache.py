@@ -0,0 +1,100 @@
+import threading
+import pandas as pd
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+try:
+    from prometheus_client import Counter, Gauge
+except ImportError:  # prometheus_client 為選用依賴，未安裝時只保留實例上的統計
+    Counter = Gauge = None
+
+# 由應用程式的 /metrics 端點匯出；快取在各個 worker process 內，指標也在記錄它的 process 中匯出
+if Counter is not None:
+    CACHE_HITS = Counter('partition_cache_hits_total', '分區快取命中次數')
+    CACHE_MISSES = Counter('partition_cache_misses_total', '分區快取未命中次數')
+    CACHE_EVICTIONS = Counter('partition_cache_evictions_total', '分區快取淘汰次數')
+    CACHE_BYTES = Gauge('partition_cache_bytes', '分區快取目前使用的記憶體', multiprocess_mode='livesum')
+
+
+class PartitionCache:
+    """
+    已解碼分區的 LRU 快取
+
+    以分區路徑（及讀取的欄位）為鍵，保存解碼後的 DataFrame 與取得時的版本標記；
+    版本標記改變（目錄版本或 mtime）時視為失效。總記憶體超過 max_bytes 時淘汰最久未使用的項目。
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, Tuple[Hashable, pd.DataFrame, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[pd.DataFrame]:
+        """取得快取項目，不存在或版本不符時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                if Counter is not None:
+                    CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if Counter is not None:
+                CACHE_HITS.inc()
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, data: pd.DataFrame) -> None:
+        """加入快取項目；單一項目超過容量上限時不快取"""
+        size = int(data.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, data, size)
+            self._add_bytes(size)
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+                if Counter is not None:
+                    CACHE_EVICTIONS.inc()
+
+    def invalidate(self, path: str) -> None:
+        """移除某個分區的所有快取項目"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._add_bytes(-self._bytes)
+
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中/淘汰次數與目前用量"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._add_bytes(-size)
+
+    def _add_bytes(self, delta: int) -> None:
+        self._bytes += delta
+        if Gauge is not None:
+            CACHE_BYTES.inc(delta)
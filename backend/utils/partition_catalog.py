@@ -0,0 +1,212 @@
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+# SQLite IN 查詢每批最多的參數數量
+_IN_BATCH_SIZE = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS partitions (
+    path TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    activity_type TEXT NOT NULL,
+    month TEXT NOT NULL,
+    format TEXT NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    journal_rows INTEGER NOT NULL DEFAULT 0,
+    min_date TEXT,
+    max_date TEXT,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    checksum TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_partitions_user ON partitions (user_id, activity_type, month);
+CREATE TABLE IF NOT EXISTS activity_index (
+    path TEXT NOT NULL,
+    activity_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    activity_type TEXT NOT NULL,
+    PRIMARY KEY (path, activity_id)
+);
+CREATE INDEX IF NOT EXISTS idx_activity_user ON activity_index (user_id, activity_id);
+"""
+
+
+class PartitionCatalog:
+    """
+    分區目錄
+
+    以 SQLite 記錄每個分區的筆數、日期範圍、大小與校驗碼，以及 activity_id 到分區的索引，
+    讓去重、存在檢查與容量統計不需要讀取或走訪分區檔案。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ----------- 分區統計 -----------
+    def upsert_partition(self, path: str, user_id: str, activity_type: str, month: str, format: str,
+                         rows: int, min_date: Optional[str], max_date: Optional[str], bytes: int,
+                         checksum: Optional[str], journal_rows: int = 0) -> None:
+        """分區重寫後更新其完整統計"""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO partitions (path, user_id, activity_type, month, format, rows, journal_rows,
+                                        min_date, max_date, bytes, checksum, version, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    format = excluded.format, rows = excluded.rows, journal_rows = excluded.journal_rows,
+                    min_date = excluded.min_date, max_date = excluded.max_date, bytes = excluded.bytes,
+                    checksum = excluded.checksum, version = partitions.version + 1,
+                    updated_at = excluded.updated_at
+                """,
+                (path, user_id, activity_type, month, format, rows, journal_rows,
+                 min_date, max_date, bytes, checksum, datetime.now().isoformat())
+            )
+
+    def record_append(self, path: str, user_id: str, activity_type: str, month: str, format: str,
+                      rows: int, min_date: Optional[str], max_date: Optional[str], bytes: int) -> None:
+        """附加寫入後累加分區統計（bytes 為新增的位元組數）"""
+        with self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO partitions (path, user_id, activity_type, month, format, rows, journal_rows,
+                                        min_date, max_date, bytes, version, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    rows = partitions.rows + excluded.rows,
+                    journal_rows = partitions.journal_rows + excluded.journal_rows,
+                    min_date = CASE WHEN partitions.min_date IS NULL OR excluded.min_date < partitions.min_date
+                                    THEN excluded.min_date ELSE partitions.min_date END,
+                    max_date = CASE WHEN partitions.max_date IS NULL OR excluded.max_date > partitions.max_date
+                                    THEN excluded.max_date ELSE partitions.max_date END,
+                    bytes = partitions.bytes + excluded.bytes,
+                    version = partitions.version + 1,
+                    updated_at = excluded.updated_at
+                """,
+                (path, user_id, activity_type, month, format, rows, rows,
+                 min_date, max_date, bytes, datetime.now().isoformat())
+            )
+
+    def get_partition(self, path: str) -> Optional[Dict]:
+        row = self._connect().execute("SELECT * FROM partitions WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row else None
+
+    def list_partitions(self, user_id: Optional[str] = None, activity_type: Optional[str] = None,
+                        start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+        """
+        列出符合條件的分區，依月份排序
+
+        start_date / end_date 為 ISO 日期字串，以分區的 min/max 日期判斷是否與 [start_date, end_date) 重疊；
+        沒有日期統計的分區一律保留。
+        """
+        query = "SELECT * FROM partitions WHERE 1 = 1"
+        params: List = []
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(str(user_id))
+        if activity_type is not None:
+            query += " AND activity_type = ?"
+            params.append(activity_type)
+        if start_date is not None:
+            query += " AND (max_date IS NULL OR max_date >= ?)"
+            params.append(start_date)
+        if end_date is not None:
+            query += " AND (min_date IS NULL OR min_date < ?)"
+            params.append(end_date)
+        query += " ORDER BY user_id, activity_type, month"
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def remove_partition(self, path: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM partitions WHERE path = ?", (path,))
+            conn.execute("DELETE FROM activity_index WHERE path = ?", (path,))
+
+    def rename_partition(self, old_path: str, new_path: str) -> None:
+        """分區檔案搬移後更新路徑（統計與 activity_id 索引保持不變）"""
+        with self._connect() as conn:
+            conn.execute("UPDATE partitions SET path = ? WHERE path = ?", (new_path, old_path))
+            conn.execute("UPDATE activity_index SET path = ? WHERE path = ?", (new_path, old_path))
+
+    def pending_journals(self) -> List[str]:
+        """有尚未合併 journal 的分區路徑"""
+        rows = self._connect().execute("SELECT path FROM partitions WHERE journal_rows > 0 ORDER BY path")
+        return [row["path"] for row in rows]
+
+    def total_bytes(self, user_id: Optional[str] = None) -> int:
+        """分區佔用的總位元組數"""
+        if user_id is None:
+            row = self._connect().execute("SELECT COALESCE(SUM(bytes), 0) AS total FROM partitions").fetchone()
+        else:
+            row = self._connect().execute(
+                "SELECT COALESCE(SUM(bytes), 0) AS total FROM partitions WHERE user_id = ?", (str(user_id),)
+            ).fetchone()
+        return row["total"]
+
+    # ----------- activity_id 索引 -----------
+    def existing_ids(self, path: str, activity_ids: Iterable[str]) -> Set[str]:
+        """回傳 activity_ids 中已存在於該分區的部分"""
+        ids = list(activity_ids)
+        found: Set[str] = set()
+        conn = self._connect()
+        for start in range(0, len(ids), _IN_BATCH_SIZE):
+            batch = ids[start:start + _IN_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT activity_id FROM activity_index WHERE path = ? AND activity_id IN ({placeholders})",
+                [path] + batch
+            )
+            found.update(row["activity_id"] for row in rows)
+        return found
+
+    def add_ids(self, path: str, user_id: str, activity_type: str, activity_ids: Iterable[str]) -> None:
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO activity_index (path, activity_id, user_id, activity_type) VALUES (?, ?, ?, ?)",
+                ((path, activity_id, str(user_id), activity_type) for activity_id in activity_ids)
+            )
+
+    def replace_ids(self, path: str, user_id: str, activity_type: str, activity_ids: Iterable[str]) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM activity_index WHERE path = ?", (path,))
+            conn.executemany(
+                "INSERT OR IGNORE INTO activity_index (path, activity_id, user_id, activity_type) VALUES (?, ?, ?, ?)",
+                ((path, activity_id, str(user_id), activity_type) for activity_id in activity_ids)
+            )
+
+    def find_activity(self, user_id: str, activity_id: str, activity_type: Optional[str] = None) -> Optional[str]:
+        """回傳包含該活動的分區路徑，不存在時回傳 None"""
+        query = "SELECT path FROM activity_index WHERE user_id = ? AND activity_id = ?"
+        params = [str(user_id), str(activity_id)]
+        if activity_type is not None:
+            query += " AND activity_type = ?"
+            params.append(activity_type)
+        row = self._connect().execute(query + " LIMIT 1", params).fetchone()
+        return row["path"] if row else None
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM partitions")
+            conn.execute("DELETE FROM activity_index")
+
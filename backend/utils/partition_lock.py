@@ -0,0 +1,65 @@
+import os
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows 沒有 fcntl，退回只在同一個 process 內互斥
+    fcntl = None
+
+
+class PartitionLocker:
+    """
+    分區層級的檔案鎖
+
+    每個分區對應 lock_dir 下一個獨立的鎖檔，以 flock 在多個 process（例如 gunicorn workers）
+    與同一 process 的多個執行緒之間互斥：寫入取得獨佔鎖，讀取取得共享鎖。
+    不同分區的寫入互不阻塞。
+
+    同一個執行緒不可在持有某分區的鎖時再次取得同一分區的鎖。
+    """
+
+    def __init__(self, lock_dir: str):
+        self.lock_dir = lock_dir
+        os.makedirs(lock_dir, exist_ok=True)
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_file(self, path: str) -> str:
+        # 以路徑雜湊命名，鎖檔不會混入 users 目錄或備份
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+        return os.path.join(self.lock_dir, f"{digest}.lock")
+
+    @contextmanager
+    def exclusive(self, path: str) -> Iterator[None]:
+        """取得分區的獨佔（寫入）鎖"""
+        with self._acquire(path, shared=False):
+            yield
+
+    @contextmanager
+    def shared(self, path: str) -> Iterator[None]:
+        """取得分區的共享（讀取）鎖"""
+        with self._acquire(path, shared=True):
+            yield
+
+    @contextmanager
+    def _acquire(self, path: str, shared: bool) -> Iterator[None]:
+        if fcntl is None:
+            with self._guard:
+                lock = self._thread_locks.setdefault(path, threading.Lock())
+            with lock:
+                yield
+            return
+
+        # 每次取得鎖都開啟新的檔案描述子，flock 因此也能在同一 process 的執行緒之間互斥
+        fd = os.open(self._lock_file(path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
@@ -0,0 +1,58 @@
+import time
+import threading
+from typing import Optional
+
+
+class RateLimiter:
+    """
+    執行緒安全的 token bucket 限流器
+
+    平均每分鐘不超過 per_minute 次，最多可連續 burst 次（預設 1，即平均分散）；acquire() 會等待到取得額度為止。
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[int] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        """立即取得一次額度；額度不足時回傳 False"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待取得一次額度
+
+        Args:
+            timeout: 最長等待秒數，None 表示不限
+
+        Returns:
+            bool: 是否取得額度（逾時為 False）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                # 預先計算補滿一次額度所需時間，避免忙等
+                delay = (1 - self._tokens) / self.rate
+            if deadline is not None and now + delay > deadline:
+                return False
+            with self._lock:
+                self.waited += delay
+            time.sleep(delay)
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# 提示模板改版時遞增，讓舊的快取項目自然失效
+CACHE_KEY_VERSION = 1
+
+
+def make_cache_key(model: str, insight_type: str, **inputs: Any) -> str:
+    """
+    以 (model, insight_type, 提示輸入) 的正規化 JSON 計算快取鍵
+
+    字典鍵排序後序列化，輸入內容相同時不論字典順序都得到相同的鍵。
+    """
+    payload = {"v": CACHE_KEY_VERSION, "model": model, "insight_type": insight_type, "inputs": inputs}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    """快取後端介面：值為 JSON 字串，ttl 為秒數"""
+    evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """process 內的 LRU 快取"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    本機 SQLite 檔案快取，重新啟動後仍保留，多個 worker process 可共用
+
+    每次命中更新最後存取時間，超過 max_entries 時淘汰最久未存取的項目。
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 10000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.evictions = 0
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_access ON responses (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            overflow = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (overflow,)
+                )
+                self.evictions += overflow
+
+    def delete(self, key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+class FlaskCacheBackend(CacheBackend):
+    """
+    使用 backend/extensions.py 中的 flask_caching cache（由 create_app 以 init_app 設定，需在 app context 中使用）
+
+    TTL 以 timeout 傳入；容量與淘汰由 flask_caching 設定的後端負責（例如 Redis 的 maxmemory-policy）。
+    flask_caching 無法只列出 prefix 下的鍵，clear() 不做任何事；要讓既有項目失效請遞增 CACHE_KEY_VERSION。
+    """
+
+    def __init__(self, cache=None, prefix: str = "llm:"):
+        if cache is None:
+            from backend.extensions import cache
+        self.cache = cache
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self.cache.get(self.prefix + key)
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        self.cache.set(self.prefix + key, value, timeout=ttl)
+
+    def delete(self, key: str) -> None:
+        self.cache.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        # cache.clear() 會清空整個共用的 flask_caching 儲存區（包含非 LLM 的項目），因此不呼叫
+        pass
+
+
+class ResponseCache:
+    """
+    LLM 回應快取
+
+    相同 (model, insight_type, 提示輸入) 的請求直接回傳先前的結構化回應，
+    並統計命中/未命中次數。含 error 的回應不快取。
+    """
+
+    def __init__(self, backend: Optional[CacheBackend] = None, ttl: int = 24 * 3600):
+        self.backend = backend or MemoryCacheBackend()
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        """取得快取的回應，不存在或已過期時回傳 None；count=False 時不計入命中統計（例如降級回應的查詢）"""
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            # 快取後端故障不影響主要流程，視為未命中
+            value = None
+            with self._lock:
+                self.errors += 1
+        if count:
+            with self._lock:
+                if value is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+        return json.loads(value) if value is not None else None
+
+    def set(self, key: str, response: Dict[str, Any], ttl: Optional[int] = None) -> None:
+        if "error" in response:
+            return
+        try:
+            self.backend.set(key, json.dumps(response, ensure_ascii=False), ttl or self.ttl)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中次數、命中率與後端淘汰次數"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.backend.evictions,
+                "errors": self.errors
+            }
+
+
+def create_response_cache(backend: str = "memory", ttl: int = 24 * 3600, max_entries: int = 1024,
+                          path: str = "data/llm_cache.sqlite") -> ResponseCache:
+    """
+    依名稱建立回應快取
+
+    Args:
+        backend: memory / sqlite / flask
+        ttl: 快取有效秒數
+        max_entries: memory / sqlite 後端的項目上限
+        path: sqlite 後端的資料庫檔案
+
+    Returns:
+        ResponseCache: 回應快取
+    """
+    if backend == "memory":
+        return ResponseCache(MemoryCacheBackend(max_entries), ttl)
+    if backend == "sqlite":
+        return ResponseCache(SQLiteCacheBackend(path, max_entries), ttl)
+    if backend == "flask":
+        return ResponseCache(FlaskCacheBackend(), ttl)
+    raise ValueError(f"Unsupported response cache backend: {backend}")
+
@@ -0,0 +1,102 @@
+import re
+from typing import Any, Dict, List
+
+# 關鍵字前加入的 emoji
+EMOJI_MAP = {
+    "進步": "🚀",
+    "建議": "💡",
+    "注意": "⚠️",
+    "目標": "🎯",
+    "恢復": "🔄",
+    "訓練": "💪",
+    "分析": "📊",
+    "總結": "📝"
+}
+_EMOJI_REPLACEMENTS = {keyword: f"{emoji} {keyword}" for keyword, emoji in EMOJI_MAP.items()}
+# 所有關鍵字的單一 regex，一次掃描完成 emoji 取代
+_EMOJI_PATTERN = re.compile("|".join(map(re.escape, EMOJI_MAP)))
+
+
+def _add_emoji(match: re.Match) -> str:
+    return _EMOJI_REPLACEMENTS[match[0]]
+
+
+class ResponseFormatter:
+    """
+    逐段接收 LLM 輸出，同時完成 Markdown 轉換、emoji 與建議擷取
+
+    每行在完成時處理一次；所有 feed() 與 finish() 回傳值串接後即為完整的格式化內容。
+    """
+
+    def __init__(self, use_markdown: bool = True, use_emoji: bool = True):
+        self.use_markdown = use_markdown
+        self.use_emoji = use_emoji
+        # 尚未結束的行的各段輸出；已完成的行的原始與格式化內容
+        self._pending: List[str] = []
+        self._raw_blocks: List[str] = []
+        self._blocks: List[str] = []
+        self.suggestions: List[str] = []
+        self._finished = False
+
+    def _format(self, block: str) -> str:
+        """格式化已完成的行（以換行分隔），單行時不拆分"""
+        self._raw_blocks.append(block)
+        if "\n" in block:
+            lines = block.split("\n")
+            self.suggestions.extend(filter(None, [line.strip("- ") for line in lines]))
+            if self.use_markdown:
+                block = "\n".join([f"* {line[2:]}" if line[:2] == "- " else line for line in map(str.strip, lines)])
+        else:
+            suggestion = block.strip("- ")
+            if suggestion:
+                self.suggestions.append(suggestion)
+            if self.use_markdown:
+                block = block.strip()
+                if block[:2] == "- ":
+                    block = "* " + block[2:]
+        if self.use_emoji:
+            block = _EMOJI_PATTERN.sub(_add_emoji, block)
+        self._blocks.append(block)
+        return block
+
+    def feed(self, chunk: str) -> str:
+        """
+        加入一段輸出
+
+        Returns:
+            str: 這段輸出完成的行格式化後的內容（含換行）；沒有完成的行時為空字串
+        """
+        if "\n" not in chunk:
+            self._pending.append(chunk)
+            return ""
+        head, _, tail = chunk.rpartition("\n")
+        self._pending.append(head)
+        block = "".join(self._pending)
+        self._pending = [tail]
+        return self._format(block) + "\n"
+
+    def finish(self) -> str:
+        """處理最後一行（可能為空），回傳其格式化內容；重複呼叫回傳空字串"""
+        if self._finished:
+            return ""
+        self._finished = True
+        line = "".join(self._pending)
+        self._pending = []
+        return self._format(line)
+
+    def result(self) -> Dict[str, Any]:
+        """結構化回應：原始內容、格式化內容與建議列表"""
+        self.finish()
+        raw = "\n".join(self._raw_blocks)
+        return {
+            "raw": raw,
+            "formatted": "\n".join(self._blocks) if raw else "",
+            "suggestions": list(self.suggestions)
+        }
+
+
+def format_structured(raw_content: str, use_markdown: bool = True, use_emoji: bool = True) -> Dict[str, Any]:
+    """完整回應的結構化結果（等同一次 feed 全部內容）"""
+    formatter = ResponseFormatter(use_markdown, use_emoji)
+    formatter.feed(raw_content)
+    return formatter.result()
@@ -0,0 +1,179 @@
+import json
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, List
+
+from backend.utils.llm_gateway import LLMDeadlineExceeded, deadline_exceeded, remaining_time
+
+
+def prompt_key(model: str, messages: List[Dict[str, str]], **params: Any) -> str:
+    """
+    正規化提示後計算合併鍵
+
+    訊息內容的空白（縮排、換行）統一為單一空格，只差在排版的相同提示視為同一個請求。
+    """
+    normalized = [{"role": m["role"], "content": " ".join(str(m["content"]).split())} for m in messages]
+    payload = {"model": model, "messages": normalized, "params": params}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """進行中的一次上游呼叫"""
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合併進行中的相同請求
+
+    同一個 key 同時只有一個執行緒（leader）真正呼叫上游，其他執行緒等待並共用其結果或例外；
+    呼叫結束後即移除，不保留結果（長期保留由 ResponseCache 負責）。
+    leader 因自己較早的截止時間逾時（LLMDeadlineExceeded）時，仍有時間的等待者重新呼叫，不受其限制。
+    只在同一個 process 內生效，例如 gunicorn 的 gthread worker 中的多個執行緒。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        執行 fn(*args, **kwargs)；同一個 key 已有呼叫進行中時等待並回傳該呼叫的結果
+
+        Args:
+            key: 合併鍵（例如 prompt_key）
+            fn: 實際的上游呼叫
+
+        Returns:
+            Any: fn 的回傳值；fn 拋出例外時所有等待者都會收到同一個例外
+
+        Raises:
+            LLMDeadlineExceeded: 等待其他執行緒的呼叫時超過目前 context 的截止時間
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+                    self.executed += 1
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                break
+            # leader 的截止時間可能較晚，等待者以自己的剩餘時間為上限
+            remaining = remaining_time()
+            if not call.event.wait(None if remaining is None else max(0.0, remaining)):
+                raise LLMDeadlineExceeded("LLM request deadline exceeded while waiting for an identical call")
+            if isinstance(call.error, LLMDeadlineExceeded) and not deadline_exceeded():
+                # leader 的截止時間較早而逾時，自己仍有時間時重新呼叫（或加入另一個進行中的呼叫）
+                continue
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, int]:
+        """實際上游呼叫數、被合併的呼叫數與目前進行中的呼叫數"""
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight 的 asyncio 版本（ASGI 模式使用）
+
+    同一個 key 的上游呼叫以獨立的 task 執行，所有呼叫端以 asyncio.shield 等待；
+    其中一個客戶端中斷連線只會取消它自己的等待，不會取消其他呼叫端共用的上游呼叫。
+    """
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any) -> Any:
+        """
+        執行 await fn(*args, **kwargs)；同一個 key 已有呼叫進行中時等待並回傳該呼叫的結果
+
+        Args:
+            key: 合併鍵（例如 prompt_key）
+            fn: 實際的上游呼叫（coroutine function）
+
+        Returns:
+            Any: fn 的回傳值；fn 拋出例外時所有等待者都會收到同一個例外
+
+        Raises:
+            LLMDeadlineExceeded: 超過目前 context 的截止時間；共用的上游呼叫仍繼續供其他呼叫端使用
+        """
+        while True:
+            task = self._tasks.get(key)
+            if task is None:
+                # task 複製目前的 context，截止時間與遙測標籤沿用 leader 的值
+                task = self._tasks[key] = asyncio.ensure_future(fn(*args, **kwargs))
+                task.add_done_callback(lambda done: self._finish(key, done))
+                self.executed += 1
+            else:
+                self.coalesced += 1
+            remaining = remaining_time()
+            try:
+                if remaining is None:
+                    return await asyncio.shield(task)
+                return await asyncio.wait_for(asyncio.shield(task), max(0.0, remaining))
+            except asyncio.TimeoutError:
+                if not task.done():
+                    raise LLMDeadlineExceeded("LLM request deadline exceeded while waiting for an identical call") from None
+                # 等待逾時的同時上游呼叫也已結束，以其結果為準
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            except LLMDeadlineExceeded as e:
+                error = e
+            if not isinstance(error, LLMDeadlineExceeded) or deadline_exceeded():
+                raise error
+            # leader 的截止時間較早而逾時，自己仍有時間時重新呼叫（或加入另一個進行中的呼叫）
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            # 所有等待者都已離開時例外無人讀取，在此標記為已處理
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> Dict[str, int]:
+        """實際上游呼叫數、被合併的呼叫數與目前進行中的呼叫數"""
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._tasks)}
+
+
+# process 內共用的實例：app.py 的端點與所有 AIAnalyzer 共用，跨請求執行緒合併相同的 LLM 呼叫
+llm_single_flight = SingleFlight()
+
+# ASGI 模式下 LLM 端點共用的實例，在事件迴圈上合併相同的 LLM 呼叫
+llm_async_single_flight = AsyncSingleFlight()
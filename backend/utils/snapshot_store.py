@@ -0,0 +1,242 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Callable, ContextManager, Dict, List, Optional, Tuple, Union
+
+MANIFEST_FILE = "manifest.json"
+INFO_FILE = "backup_info.json"
+
+
+class SnapshotStore:
+    """
+    內容定址的增量備份
+
+    每個快照只是一份 manifest（相對路徑 -> SHA-256、大小、mtime），檔案內容以雜湊值
+    存放在共用的 objects/ 目錄。與上一個快照相比大小與 mtime 都沒變的檔案直接沿用
+    原本的雜湊，不重新讀取；內容已存在的物件也不重複保存，因此備份的時間與空間只與
+    變動的資料量成正比。
+
+    備份多個目錄時，manifest 的鍵為「目錄序號/相對路徑」，不同目錄下相同的相對路徑不會互相覆蓋。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_path = os.path.join(root, "objects")
+        os.makedirs(self.objects_path, exist_ok=True)
+
+    def create(self, name: str, source_dir: Union[str, List[str]], info: Optional[Dict] = None,
+               partition_of: Optional[Callable[[str], str]] = None,
+               lock: Optional[Callable[[str], ContextManager]] = None) -> Dict:
+        """
+        建立快照
+
+        Args:
+            name: 快照名稱（目錄名稱）
+            source_dir: 要備份的目錄；多個目錄時檔案以「目錄序號/相對路徑」記錄
+            info: 額外寫入 backup_info.json 的資訊
+            partition_of: 回傳檔案所屬的分區路徑；同一分區的檔案在同一次 lock 內讀取
+            lock: 讀取分區內容期間持有的鎖（參數為分區路徑）
+
+        Returns:
+            Dict: 快照資訊（含檔案數、總大小、新增物件大小）
+        """
+        previous = self._latest_manifest()
+        manifest: Dict[str, Dict] = {}
+        stored_bytes = 0
+        hashed_files = 0
+
+        multiple = not isinstance(source_dir, str)
+        source_dirs = source_dir if multiple else [source_dir]
+        partitions: Dict[str, List[Tuple[int, str]]] = {}
+        for index, root, rel_path, _ in self._scan_all(source_dirs):
+            path = os.path.join(root, rel_path)
+            partitions.setdefault(partition_of(path) if partition_of else path, []).append((index, rel_path))
+
+        for partition, files in partitions.items():
+            with lock(partition) if lock else nullcontext():
+                # 取得鎖之後才讀取大小與內容；掃描後被合併或重寫的分區以鎖內看到的檔案為準
+                if os.path.isdir(partition):
+                    index = files[0][0]
+                    root = source_dirs[index]
+                    files = [(i, rel_path) for i, rel_path in files
+                             if not os.path.join(source_dirs[i], rel_path).startswith(partition + os.sep)]
+                    files += [(index, os.path.relpath(path, root)) for path in self._files_under(partition)]
+                for index, rel_path in files:
+                    path = os.path.join(source_dirs[index], rel_path)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    key = os.path.join(str(index), rel_path) if multiple else rel_path
+                    entry = previous.get(key)
+                    if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+                        digest, size, added = self._ingest(path)
+                        hashed_files += 1
+                        stored_bytes += added
+                        entry = {"sha256": digest, "size": size, "mtime_ns": stat.st_mtime_ns}
+                    manifest[key] = entry
+
+        snapshot_dir = os.path.join(self.root, name)
+        os.makedirs(snapshot_dir, exist_ok=True)
+        with open(os.path.join(snapshot_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        backup_info = dict(info or {})
+        backup_info.update({
+            "created_at": datetime.now().isoformat(),
+            "files": len(manifest),
+            "changed_files": hashed_files,
+            "total_size": sum(entry["size"] for entry in manifest.values()),
+            "size": stored_bytes
+        })
+        with open(os.path.join(snapshot_dir, INFO_FILE), "w", encoding="utf-8") as f:
+            json.dump(backup_info, f)
+        return backup_info
+
+    def restore(self, name: str, target_dir: Union[str, List[str]],
+                place: Optional[Callable[[str], int]] = None) -> int:
+        """
+        將快照還原到 target_dir（目錄會被整個取代）
+
+        Args:
+            name: 快照名稱
+            target_dir: 還原的目錄；可為多個目錄
+            place: 多個目錄時，依相對路徑回傳檔案應還原到第幾個目錄；預設還原到備份時所在的目錄
+
+        Returns:
+            int: 還原的檔案數量
+        """
+        manifest = self._read_manifest(name)
+        target_dirs = [target_dir] if isinstance(target_dir, str) else target_dir
+        tmp_dirs = [f"{target}.restore-{os.getpid()}" for target in target_dirs]
+        for tmp_dir in tmp_dirs:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir)
+            os.makedirs(tmp_dir)
+
+        destinations: Dict[str, Tuple[bool, Dict]] = {}
+        for key, entry in manifest.items():
+            source_index, rel_path = self._split_key(key) if not isinstance(target_dir, str) else (0, key)
+            index = place(rel_path) if place else source_index
+            dest = os.path.join(tmp_dirs[index], rel_path)
+            # 同一路徑在多個目錄都有備份時（例如重新平衡到一半），以原本就在目標目錄的版本為準
+            from_target = source_index == index
+            if dest not in destinations or (from_target and not destinations[dest][0]):
+                destinations[dest] = (from_target, entry)
+        for dest, (_, entry) in destinations.items():
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(self._object_path(entry["sha256"]), dest)
+            # 還原 mtime，下一次備份才能沿用雜湊
+            os.utime(dest, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+
+        for target, tmp_dir in zip(target_dirs, tmp_dirs):
+            old_dir = f"{target}.old-{os.getpid()}"
+            if os.path.exists(target):
+                os.rename(target, old_dir)
+            os.rename(tmp_dir, target)
+            if os.path.exists(old_dir):
+                shutil.rmtree(old_dir)
+        return len(destinations)
+
+    def list(self) -> List[Dict]:
+        """依建立時間列出所有快照"""
+        snapshots = []
+        for name in os.listdir(self.root):
+            info_path = os.path.join(self.root, name, INFO_FILE)
+            if not os.path.exists(os.path.join(self.root, name, MANIFEST_FILE)):
+                continue
+            with open(info_path, "r", encoding="utf-8") as f:
+                info = json.load(f)
+            info["name"] = name
+            snapshots.append(info)
+        return sorted(snapshots, key=lambda info: info["created_at"])
+
+    def delete(self, name: str) -> int:
+        """
+        刪除快照並回收不再被任何快照引用的物件
+
+        Returns:
+            int: 釋放的位元組數
+        """
+        shutil.rmtree(os.path.join(self.root, name))
+        referenced = set()
+        for snapshot in self.list():
+            referenced.update(entry["sha256"] for entry in self._read_manifest(snapshot["name"]).values())
+
+        freed = 0
+        for dirpath, dirnames, filenames in os.walk(self.objects_path):
+            for digest in filenames:
+                # 略過進行中的暫存檔
+                if not digest.startswith(".") and digest not in referenced:
+                    object_path = os.path.join(dirpath, digest)
+                    freed += os.path.getsize(object_path)
+                    os.remove(object_path)
+        return freed
+
+    def _scan(self, source_dir: str):
+        """遞迴列出 (相對路徑, stat)"""
+        stack = [source_dir]
+        while stack:
+            current = stack.pop()
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield os.path.relpath(entry.path, source_dir), entry.stat()
+
+    def _scan_all(self, source_dirs: List[str]):
+        """走訪多個目錄，列出 (目錄序號, 目錄, 相對路徑, stat)"""
+        for index, root in enumerate(source_dirs):
+            if os.path.isdir(root):
+                for rel_path, stat in self._scan(root):
+                    yield index, root, rel_path, stat
+
+    def _files_under(self, directory: str) -> List[str]:
+        """目錄下所有檔案的完整路徑"""
+        return [os.path.join(directory, rel_path) for rel_path, _ in self._scan(directory)]
+
+    @staticmethod
+    def _split_key(key: str) -> Tuple[int, str]:
+        """manifest 鍵拆成 (目錄序號, 相對路徑)；沒有目錄序號的舊快照視為第一個目錄"""
+        head, _, rest = key.partition(os.sep)
+        return (int(head), rest) if head.isdigit() and rest else (0, key)
+
+    def _latest_manifest(self) -> Dict[str, Dict]:
+        snapshots = self.list()
+        return self._read_manifest(snapshots[-1]["name"]) if snapshots else {}
+
+    def _read_manifest(self, name: str) -> Dict[str, Dict]:
+        with open(os.path.join(self.root, name, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_path, digest[:2], digest)
+
+    def _ingest(self, file_path: str):
+        """
+        一次讀取同時計算雜湊並複製到物件庫，內容已存在時丟棄複本
+
+        Returns:
+            (雜湊值, 檔案大小, 新增的位元組數)
+        """
+        digest = hashlib.sha256()
+        tmp_path = os.path.join(self.objects_path, f".ingest-{os.getpid()}-{threading.get_ident()}")
+        size = 0
+        with open(file_path, "rb") as src, open(tmp_path, "wb") as dst:
+            for block in iter(lambda: src.read(1024 * 1024), b""):
+                digest.update(block)
+                dst.write(block)
+                size += len(block)
+
+        object_path = self._object_path(digest.hexdigest())
+        if os.path.exists(object_path):
+            os.remove(tmp_path)
+            return digest.hexdigest(), size, 0
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        os.replace(tmp_path, object_path)
+        return digest.hexdigest(), size, size
@@ -0,0 +1,29 @@
+import json
+from typing import Any, Iterable, Iterator, Tuple
+
+# SSE 回應標頭：停用快取與反向代理緩衝，讓每個事件立即送達瀏覽器
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(event: str, data: Any) -> str:
+    """
+    將一個事件編碼為 Server-Sent Events 格式
+
+    Args:
+        event: 事件名稱（token / done / error）
+        data: 事件內容，以 JSON 編碼成單行
+
+    Returns:
+        str: 以空行結尾的 SSE 訊息
+    """
+    payload = json.dumps(data, ensure_ascii=False, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def sse_stream(events: Iterable[Tuple[str, Any]]) -> Iterator[str]:
+    """將 (事件名稱, 內容) 序列轉為 SSE 訊息"""
+    for event, data in events:
+        yield format_sse(event, data)
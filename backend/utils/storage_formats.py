@@ -0,0 +1,323 @@
+import os
+import json
+import hashlib
+import threading
+import shutil
+import numpy as np
+import pandas as pd
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 欄式格式的欄位描述檔名稱
+COLUMNAR_SCHEMA_FILE = "_schema.json"
+
+
+def _tmp_path(path: str) -> str:
+    """與目標同目錄的暫存路徑（同一檔案系統才能原子改名）"""
+    return f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+
+
+class StorageFormat:
+    """分區檔案格式的基底類別"""
+    name = ""
+    extension = ""
+
+    def read(self, path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def iter_chunks(self, path: str, chunk_size: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        """分批讀取分區，每批最多 chunk_size 筆"""
+        data = self.read(path, columns)
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start:start + chunk_size]
+
+    def write(self, path: str, data: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def remove(self, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+
+    def replace(self, src: str, path: str) -> None:
+        """以同目錄下已寫好的 src 原子替換分區"""
+        os.replace(src, path)
+
+    def size(self, path: str) -> int:
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def checksum(self, path: str) -> str:
+        """分區內容的 SHA-256"""
+        digest = hashlib.sha256()
+        for file_path in self._files(path):
+            with open(file_path, "rb") as f:
+                for block in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(block)
+        return digest.hexdigest()
+
+    def _files(self, path: str) -> List[str]:
+        return [path]
+
+
+class CsvFormat(StorageFormat):
+    """文字 CSV 格式（原有格式）"""
+    name = "csv"
+    extension = ".csv"
+    cold_format = "csv.gz"
+    compression: Optional[str] = None
+
+    def read(self, path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        return pd.read_csv(path, usecols=columns, compression=self.compression)
+
+    def iter_chunks(self, path: str, chunk_size: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        with pd.read_csv(path, usecols=columns, chunksize=chunk_size, compression=self.compression) as reader:
+            yield from reader
+
+    def write(self, path: str, data: pd.DataFrame) -> None:
+        # 先寫入暫存檔再以 os.replace 原子替換，讀取端不會看到寫到一半的檔案
+        tmp_path = _tmp_path(path)
+        try:
+            data.to_csv(tmp_path, index=False, compression=self.compression)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+class CompressedCsvFormat(CsvFormat):
+    """冷資料層：gzip 壓縮的 CSV"""
+    name = "csv.gz"
+    extension = ".csv.gz"
+    cold_format = None
+    compression = "gzip"
+
+
+class ColumnarFormat(StorageFormat):
+    """
+    二進位欄式格式
+
+    每個分區是一個目錄，每欄一個具型別的 .npy 陣列，讀取時以 memory-map 開啟，
+    不需要解析文字。重複值多的字串欄位以字典編碼保存，其餘字串欄位以固定寬度
+    unicode 陣列保存，缺值另存遮罩。
+    """
+    name = "columnar"
+    extension = ".col"
+    cold_format = "colz"
+
+    def read(self, path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        wanted, arrays = self._open_columns(path, columns)
+        return self._decode(wanted, arrays, slice(None))
+
+    def iter_chunks(self, path: str, chunk_size: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+        # memory-map 只在切片被解碼時才載入對應頁面
+        wanted, arrays = self._open_columns(path, columns)
+        rows = len(arrays[0][0]) if arrays else 0
+        for start in range(0, rows, chunk_size):
+            yield self._decode(wanted, arrays, slice(start, start + chunk_size), start)
+
+    def _open_columns(self, path: str, columns: Optional[List[str]]):
+        schema = self._read_schema(path)
+        wanted = schema["columns"]
+        if columns is not None:
+            wanted = [c for c in wanted if c["name"] in columns]
+        arrays = []
+        for column in wanted:
+            values = np.load(os.path.join(path, column["file"]), mmap_mode='r')
+            mask = np.load(os.path.join(path, column["mask"]), mmap_mode='r') if column.get("mask") else None
+            arrays.append((values, mask))
+        return wanted, arrays
+
+    def _decode(self, wanted: List[Dict], arrays: List, rows: slice, offset: int = 0) -> pd.DataFrame:
+        data = {}
+        index = None
+        for column, (values, mask) in zip(wanted, arrays):
+            values = values[rows]
+            if index is None:
+                index = pd.RangeIndex(offset, offset + len(values))
+            kind = column["kind"]
+            if kind == "string" and "dictionary" in column:
+                dictionary = np.asarray(column["dictionary"] + [np.nan], dtype=object)
+                series = pd.Series(dictionary[values], index=index, copy=False)
+            elif kind == "string":
+                series = pd.Series(values.astype(object), index=index, copy=False)
+                if mask is not None:
+                    series[np.asarray(mask[rows])] = np.nan
+            elif kind == "category":
+                series = pd.Series(pd.Categorical.from_codes(values, categories=column["categories"]), index=index)
+            elif kind == "nullable":
+                mask = np.asarray(mask[rows]) if mask is not None else np.zeros(len(values), dtype=bool)
+                series = pd.Series(pd.arrays.IntegerArray(np.asarray(values), mask), index=index, copy=False)
+            else:
+                series = pd.Series(values, index=index, copy=False)
+            data[column["name"]] = series
+        return pd.DataFrame(data, index=index, copy=False)
+
+    def write(self, path: str, data: pd.DataFrame) -> None:
+        tmp_path = _tmp_path(path)
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        schema, arrays = self._encode(data)
+        for file_name, values in arrays.items():
+            np.save(os.path.join(tmp_path, file_name), values)
+        with open(os.path.join(tmp_path, COLUMNAR_SCHEMA_FILE), "w", encoding="utf-8") as f:
+            json.dump(schema, f)
+
+        self.replace(tmp_path, path)
+
+    def replace(self, src: str, path: str) -> None:
+        # 以目錄改名替換舊分區（兩次改名之間由呼叫端持有的分區獨佔鎖保護）
+        old_path = f"{path}.old-{os.getpid()}-{threading.get_ident()}"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(src, path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+
+    def _encode(self, data: pd.DataFrame):
+        """將 DataFrame 編碼為 (schema, 檔名 -> 陣列)"""
+        schema_columns = []
+        arrays = {}
+        for i, name in enumerate(data.columns):
+            column = data[name]
+            entry = {"name": str(name), "file": f"c{i}.npy"}
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                entry["kind"] = "category"
+                entry["categories"] = [str(c) for c in column.cat.categories]
+                values = column.cat.codes.to_numpy()
+            elif isinstance(column.dtype, pd.api.extensions.ExtensionDtype) and column.dtype.kind in "iu":
+                # 可為空的整數（Int16 等）：數值與缺值遮罩分開保存
+                entry["kind"] = "nullable"
+                mask = column.isna().to_numpy()
+                values = column.to_numpy(dtype=column.dtype.numpy_dtype, na_value=0)
+                if mask.any():
+                    entry["mask"] = f"c{i}.mask.npy"
+                    arrays[entry["mask"]] = mask
+            elif column.dtype.kind in "biufcmM":
+                entry["kind"] = "numeric"
+                values = column.to_numpy()
+            elif column.nunique() <= len(column) // 2:
+                # 重複值多的字串欄（如日期、活動類型）以字典編碼保存
+                entry["kind"] = "string"
+                codes, uniques = pd.factorize(column)
+                entry["dictionary"] = [str(u) for u in uniques]
+                values = np.where(codes < 0, len(uniques), codes).astype(np.int32)
+            else:
+                entry["kind"] = "string"
+                mask = column.isna().to_numpy()
+                values = np.asarray(column.where(~mask, "").astype(str).to_numpy(), dtype=str)
+                if mask.any():
+                    entry["mask"] = f"c{i}.mask.npy"
+                    arrays[entry["mask"]] = mask
+            arrays[entry["file"]] = values
+            schema_columns.append(entry)
+        return {"rows": len(data), "columns": schema_columns}, arrays
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(os.path.join(path, COLUMNAR_SCHEMA_FILE))
+
+    def remove(self, path: str) -> None:
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+
+    def size(self, path: str) -> int:
+        if not os.path.isdir(path):
+            return 0
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+    def _files(self, path: str) -> List[str]:
+        return [os.path.join(path, f) for f in sorted(os.listdir(path))]
+
+    def _read_schema(self, path: str) -> Dict:
+        with open(os.path.join(path, COLUMNAR_SCHEMA_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+class CompressedColumnarFormat(ColumnarFormat):
+    """
+    冷資料層：壓縮的欄式格式
+
+    所有欄位陣列與欄位描述存在單一 np.savez_compressed 檔案中，
+    讀取時需要解壓縮（無法 memory-map），但仍不需解析文字。
+    """
+    name = "colz"
+    extension = ".colz"
+    cold_format = None
+
+    def write(self, path: str, data: pd.DataFrame) -> None:
+        schema, arrays = self._encode(data)
+        arrays = {file_name[:-len(".npy")]: values for file_name, values in arrays.items()}
+        arrays[COLUMNAR_SCHEMA_FILE] = np.array(json.dumps(schema))
+        tmp_path = _tmp_path(path)
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _open_columns(self, path: str, columns: Optional[List[str]]):
+        with np.load(path) as archive:
+            schema = json.loads(str(archive[COLUMNAR_SCHEMA_FILE]))
+            wanted = schema["columns"]
+            if columns is not None:
+                wanted = [c for c in wanted if c["name"] in columns]
+            arrays = []
+            for column in wanted:
+                values = archive[column["file"][:-len(".npy")]]
+                mask = archive[column["mask"][:-len(".npy")]] if column.get("mask") else None
+                arrays.append((values, mask))
+        return wanted, arrays
+
+    def exists(self, path: str) -> bool:
+        return os.path.isfile(path)
+
+    def remove(self, path: str) -> None:
+        if os.path.exists(path):
+            os.remove(path)
+
+    def size(self, path: str) -> int:
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _files(self, path: str) -> List[str]:
+        return [path]
+
+
+STORAGE_FORMATS: Dict[str, StorageFormat] = {
+    CsvFormat.name: CsvFormat(),
+    CompressedCsvFormat.name: CompressedCsvFormat(),
+    ColumnarFormat.name: ColumnarFormat(),
+    CompressedColumnarFormat.name: CompressedColumnarFormat(),
+}
+
+
+def get_storage_format(name: str) -> StorageFormat:
+    """依名稱取得分區格式"""
+    try:
+        return STORAGE_FORMATS[name]
+    except KeyError:
+        raise ValueError(f"Unsupported storage format: {name}")
+
+
+def split_partition_name(name: str) -> Optional[Tuple[str, StorageFormat]]:
+    """
+    解析分區檔名 (YYYYMM + 副檔名)
+
+    Returns:
+        (YYYYMM, 格式)，不是分區檔案時回傳 None
+    """
+    for storage_format in STORAGE_FORMATS.values():
+        if name.endswith(storage_format.extension):
+            month = name[:-len(storage_format.extension)]
+            if len(month) == 6 and month.isdigit():
+                return month, storage_format
+    return None
+
+
+def format_for_path(path: str) -> Optional[StorageFormat]:
+    """依分區路徑的副檔名判斷格式"""
+    parsed = split_partition_name(os.path.basename(path))
+    return parsed[1] if parsed else None
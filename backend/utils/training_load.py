@@ -0,0 +1,187 @@
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from backend.utils.activity_schema import as_datetime
+
+# Activity 模型欄位 -> DataStorage 欄位
+_MODEL_FIELDS = {
+    "date": "date",
+    "type": "activity_type",
+    "duration": "duration",
+    "distance": "distance",
+    "heart_rate_avg": "avg_heart_rate",
+    "heart_rate_max": "max_heart_rate",
+}
+_COLUMNS = ["date", "activity_type", "duration", "distance", "avg_heart_rate", "max_heart_rate"]
+
+
+def activities_to_frame(activities: Union[pd.DataFrame, Iterable[Any]]) -> pd.DataFrame:
+    """
+    將 DataStorage 的 DataFrame、活動 dict 或 Activity 模型物件統一為相同欄位的 DataFrame
+
+    Args:
+        activities: 活動資料；Activity 物件與 dict 可使用模型欄位名稱（type、heart_rate_avg 等）
+
+    Returns:
+        pd.DataFrame: 欄位為 date / activity_type / duration / distance / avg_heart_rate / max_heart_rate
+    """
+    if isinstance(activities, pd.DataFrame):
+        data = activities
+    else:
+        records = []
+        for activity in activities:
+            record = dict(activity) if isinstance(activity, dict) else {
+                field: getattr(activity, field, None) for field in _MODEL_FIELDS}
+            records.append({_MODEL_FIELDS.get(k, k): v for k, v in record.items()})
+        data = pd.DataFrame(records)
+    frame = pd.DataFrame(index=data.index)
+    for column in _COLUMNS:
+        frame[column] = data[column] if column in data else np.nan
+    frame["date"] = as_datetime(frame["date"])
+    for column in ("duration", "distance", "avg_heart_rate", "max_heart_rate"):
+        frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(float)
+    return frame.dropna(subset=["date"])
+
+
+def _ewma(loads: np.ndarray, days: int) -> float:
+    """時間常數為 days 天、初始值為 0 的指數加權平均在最後一天的值"""
+    alpha = 1 - np.exp(-1 / days)
+    weights = (1 - alpha) ** np.arange(len(loads) - 1, -1, -1)
+    return float(alpha * weights @ loads)
+
+
+class TrainingLoadEngine:
+    """
+    本機訓練負荷計算
+
+    每次活動的負荷以 Banister TRIMP（時間 × 心率儲備加權）計算，沒有心率時以時間（分鐘）計；
+    每日負荷以指數加權平均得到急性負荷 (ATL, 7 天) 與慢性負荷 (CTL, 42 天)，
+    並計算訓練壓力平衡 (TSB = CTL - ATL)、急慢性負荷比 (ACWR)、Foster 單調性與壓力。
+    結果只取決於輸入資料，不需呼叫 LLM。
+    """
+
+    def __init__(self, resting_hr: float = 60, max_hr: float = 190, acute_days: int = 7, chronic_days: int = 42):
+        self.resting_hr = resting_hr
+        self.max_hr = max_hr
+        self.acute_days = acute_days
+        self.chronic_days = chronic_days
+
+    @classmethod
+    def for_profile(cls, user_profile: Optional[Dict[str, Any]] = None) -> "TrainingLoadEngine":
+        """依用戶資料的靜止心率、最大心率（或年齡推估）建立"""
+        profile = user_profile or {}
+        max_hr = profile.get("max_heart_rate")
+        if not max_hr and profile.get("age"):
+            max_hr = 220 - int(profile["age"])
+        return cls(resting_hr=profile.get("resting_heart_rate") or 60, max_hr=max_hr or 190)
+
+    def activity_loads(self, frame: pd.DataFrame) -> np.ndarray:
+        """每次活動的負荷（TRIMP；缺心率時為分鐘數）"""
+        minutes = np.nan_to_num(frame["duration"].to_numpy(dtype=float) / 60)
+        reserve = (frame["avg_heart_rate"].to_numpy(dtype=float) - self.resting_hr) / (self.max_hr - self.resting_hr)
+        reserve = np.clip(reserve, 0, 1)
+        trimp = minutes * reserve * 0.64 * np.exp(1.92 * reserve)
+        return np.where(np.isnan(reserve), minutes, trimp)
+
+    def daily_loads(self, frame: pd.DataFrame, end: Optional[pd.Timestamp] = None) -> pd.Series:
+        """從第一筆活動到 end 每天的總負荷（休息日為 0）"""
+        days = frame["date"].dt.normalize()
+        end = pd.Timestamp(end).normalize() if end is not None else days.max()
+        start = days.min()
+        offsets = ((days - start).dt.days).to_numpy()
+        length = (end - start).days + 1
+        keep = offsets < length
+        loads = np.bincount(offsets[keep], weights=self.activity_loads(frame)[keep], minlength=length)
+        return pd.Series(loads, index=pd.date_range(start, periods=length, freq="D"))
+
+    def compute(self, activities: Union[pd.DataFrame, Iterable[Any]],
+                end: Optional[pd.Timestamp] = None) -> Optional[Dict[str, Any]]:
+        """
+        計算截至 end（預設為最後一筆活動當天）的訓練負荷指標
+
+        Returns:
+            Optional[Dict[str, Any]]: acute_load / chronic_load / training_stress_balance / acwr /
+            monotony / strain / weekly_load 與狀態標籤；沒有活動時回傳 None
+        """
+        frame = activities_to_frame(activities)
+        if frame.empty:
+            return None
+        daily = self.daily_loads(frame, end)
+        loads = daily.to_numpy()
+        atl = _ewma(loads, self.acute_days)
+        ctl = _ewma(loads, self.chronic_days)
+        week = loads[-7:]
+        week = np.concatenate([np.zeros(7 - len(week)), week])
+        std = week.std()
+        # 每天負荷相同時標準差為 0（浮點誤差內），單調性無定義
+        monotony = week.mean() / std if std > 1e-6 else None
+        weekly_load = float(week.sum())
+        metrics = {
+            "date": daily.index[-1].strftime("%Y-%m-%d"),
+            "load_method": "trimp" if frame["avg_heart_rate"].notna().any() else "duration",
+            "acute_load": round(float(atl), 1),
+            "chronic_load": round(float(ctl), 1),
+            "training_stress_balance": round(float(ctl - atl), 1),
+            "acwr": round(float(atl / ctl), 2) if ctl > 0 else None,
+            "monotony": round(float(monotony), 2) if monotony is not None else None,
+            "strain": round(weekly_load * monotony, 1) if monotony is not None else None,
+            "weekly_load": round(weekly_load, 1),
+        }
+        metrics["status"] = self.status(metrics)
+        return metrics
+
+    def from_storage(self, storage, user_id: str, activity_type: Optional[str] = None,
+                     end: Optional[pd.Timestamp] = None, days: int = 120) -> Optional[Dict[str, Any]]:
+        """
+        從 DataStorage 讀取最近 days 天的活動計算指標（慢性負荷需要約 6 週以上的資料）
+        """
+        end_ts = pd.Timestamp(end) if end is not None else pd.Timestamp.now().normalize()
+        start_ts = end_ts - pd.Timedelta(days=days)
+        types = [activity_type] if activity_type else storage.list_activity_types(user_id)
+        frames = [storage.load_activities(user_id, t, start_ts, end_ts) for t in types]
+        frames = [frame for frame in frames if frame is not None and not frame.empty]
+        if not frames:
+            return None
+        return self.compute(pd.concat(frames, ignore_index=True), end=end_ts)
+
+    @staticmethod
+    def status(metrics: Dict[str, Any]) -> str:
+        """依 TSB 判斷目前狀態：fresh / optimal / fatigued / overreaching"""
+        tsb = metrics["training_stress_balance"]
+        if tsb > 5:
+            return "fresh"
+        if tsb >= -10:
+            return "optimal"
+        if tsb >= -30:
+            return "fatigued"
+        return "overreaching"
+
+    @staticmethod
+    def interpret(metrics: Dict[str, Any]) -> List[str]:
+        """將指標轉為條列式說明（不經 LLM）"""
+        labels = {
+            "fresh": "體能恢復良好，可安排品質課表或比賽",
+            "optimal": "訓練與恢復平衡，維持目前的訓練量",
+            "fatigued": "疲勞累積中，建議安排輕鬆跑或休息日",
+            "overreaching": "疲勞過高，有過度訓練風險，建議減量數天",
+        }
+        lines = [
+            f"- 急性負荷 (ATL) {metrics['acute_load']}，慢性負荷 (CTL) {metrics['chronic_load']}",
+            f"- 訓練壓力平衡 (TSB) {metrics['training_stress_balance']}：{labels[metrics['status']]}",
+            f"- 近 7 天總負荷 {metrics['weekly_load']}",
+        ]
+        acwr = metrics.get("acwr")
+        if acwr is not None:
+            if acwr > 1.5:
+                lines.append(f"- 急慢性負荷比 {acwr}，負荷增加過快，受傷風險升高")
+            elif acwr < 0.8:
+                lines.append(f"- 急慢性負荷比 {acwr}，近期負荷偏低，體能可能下降")
+            else:
+                lines.append(f"- 急慢性負荷比 {acwr}，位於建議範圍 (0.8 ~ 1.5)")
+        monotony = metrics.get("monotony")
+        if monotony is not None:
+            note = "，訓練強度變化不足，建議安排輕重交替" if monotony > 2 else ""
+            lines.append(f"- 訓練單調性 {monotony}，訓練壓力 {metrics['strain']}{note}")
+        return lines
@@ -26,7 +26,34 @@ class Config:
     CACHE_TYPE = 'redis'
     CACHE_REDIS_URL = REDIS_URL
     CACHE_DEFAULT_TIMEOUT = 300
-    
+
+    # LLM 回應快取設定（backend: memory / sqlite / flask）
+    LLM_CACHE_BACKEND = os.getenv('LLM_CACHE_BACKEND', 'memory')
+    LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', 24 * 3600))
+    LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', 1024))
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'data/llm_cache.sqlite')
+
+    # LLM 閘道設定（連線池、逾時與重試）
+    OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1')
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 30))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+    LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', 20))
+    LLM_REQUEST_DEADLINE = float(os.getenv('LLM_REQUEST_DEADLINE', 30))
+    # 客戶端以 X-Request-Timeout 要求的時間預算下限（秒）
+    LLM_MIN_REQUEST_DEADLINE = float(os.getenv('LLM_MIN_REQUEST_DEADLINE', 1))
+    LLM_BREAKER_FAILURE_RATE = float(os.getenv('LLM_BREAKER_FAILURE_RATE', 0.5))
+    LLM_BREAKER_SLOW_SECONDS = float(os.getenv('LLM_BREAKER_SLOW_SECONDS', 10))
+    LLM_BREAKER_OPEN_SECONDS = float(os.getenv('LLM_BREAKER_OPEN_SECONDS', 30))
+
+    # ASGI 模式設定（非同步 LLM 閘道的連線上限、執行 Flask 端點的執行緒數）
+    LLM_ASYNC_MAX_CONNECTIONS = int(os.getenv('LLM_ASYNC_MAX_CONNECTIONS', 1000))
+    ASGI_SYNC_THREADS = int(os.getenv('ASGI_SYNC_THREADS', 16))
+
+    # 洞察預先產生設定（並行用戶數、每分鐘 LLM 呼叫上限、活躍用戶判斷天數）
+    INSIGHT_WORKERS = int(os.getenv('INSIGHT_WORKERS', 4))
+    INSIGHT_REQUESTS_PER_MINUTE = float(os.getenv('INSIGHT_REQUESTS_PER_MINUTE', 60))
+    INSIGHT_ACTIVE_DAYS = int(os.getenv('INSIGHT_ACTIVE_DAYS', 30))
+
     # 日誌設定
     LOG_LEVEL = 'INFO'
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -0,0 +1,13 @@
+"""
+gunicorn 設定（scripts/deploy.sh 以 -c config/gunicorn.conf.py 載入）
+
+設定 PROMETHEUS_MULTIPROC_DIR 時各 worker 把 Prometheus 指標寫入該目錄，由 /metrics 彙總；
+worker 結束時標記為已停止，其 livesum 類的 gauge（例如 partition_cache_bytes）不再計入。
+"""
+import os
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,61 @@
+"""add user insight columns to activity_analysis
+
+Revision ID: 3f2a9c41d7e5
+Revises: a1c4e8b20f63
+Create Date: 2026-10-18 09:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f2a9c41d7e5'
+down_revision = 'a1c4e8b20f63'
+branch_labels = None
+depends_on = None
+
+# 用戶層級洞察使用的欄位（見 backend/models/activity.py 的 ActivityAnalysis）
+INSIGHT_COLUMNS = [
+    ('user_id', sa.Integer()),
+    ('insight_type', sa.String(length=50)),
+    ('raw_analysis', sa.Text()),
+    ('activities_updated_at', sa.DateTime()),
+    ('activity_count', sa.Integer()),
+]
+
+
+def upgrade():
+    # scripts/init_db.py 以 create_all 建立的新資料庫已有這些欄位，只補上既有資料表缺少的部分
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('activity_analysis')}
+    indexes = {index['name'] for index in inspector.get_indexes('activity_analysis')}
+    with op.batch_alter_table('activity_analysis') as batch_op:
+        for name, type_ in INSIGHT_COLUMNS:
+            if name not in columns:
+                batch_op.add_column(sa.Column(name, type_, nullable=True))
+        if 'user_id' not in columns:
+            batch_op.create_foreign_key('fk_activity_analysis_user_id_users', 'users', ['user_id'], ['id'])
+        if 'ix_activity_analysis_user_insight' not in indexes:
+            batch_op.create_index('ix_activity_analysis_user_insight', ['user_id', 'insight_type'])
+
+    if 'ix_activity_user_id' not in {index['name'] for index in inspector.get_indexes('activity')}:
+        op.create_index('ix_activity_user_id', 'activity', ['user_id'])
+
+
+def downgrade():
+    # 與 upgrade 相同，只移除實際存在的索引、外鍵與欄位
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_activity_user_id' in {index['name'] for index in inspector.get_indexes('activity')}:
+        op.drop_index('ix_activity_user_id', table_name='activity')
+    columns = {column['name'] for column in inspector.get_columns('activity_analysis')}
+    indexes = {index['name'] for index in inspector.get_indexes('activity_analysis')}
+    foreign_keys = {key['name'] for key in inspector.get_foreign_keys('activity_analysis')}
+    with op.batch_alter_table('activity_analysis') as batch_op:
+        if 'ix_activity_analysis_user_insight' in indexes:
+            batch_op.drop_index('ix_activity_analysis_user_insight')
+        if 'fk_activity_analysis_user_id_users' in foreign_keys:
+            batch_op.drop_constraint('fk_activity_analysis_user_id_users', type_='foreignkey')
+        for name, _ in reversed(INSIGHT_COLUMNS):
+            if name in columns:
+                batch_op.drop_column(name)
@@ -0,0 +1,86 @@
+"""create users, activity and activity_analysis tables
+
+Revision ID: a1c4e8b20f63
+Revises:
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c4e8b20f63'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _tables():
+    """加入洞察欄位（3f2a9c41d7e5）之前的資料表定義，依建立順序排列"""
+    return [
+        ('users', lambda: op.create_table(
+            'users',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('username', sa.String(length=80), nullable=False),
+            sa.Column('email', sa.String(length=120), nullable=False),
+            sa.Column('password_hash', sa.String(length=128), nullable=True),
+            sa.Column('is_admin', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('username'),
+            sa.UniqueConstraint('email'))),
+        ('user_preferences', lambda: op.create_table(
+            'user_preferences',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('language', sa.String(length=10), nullable=True),
+            sa.Column('theme', sa.String(length=20), nullable=True),
+            sa.Column('notifications_enabled', sa.Boolean(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'))),
+        ('activity', lambda: op.create_table(
+            'activity',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('title', sa.String(length=100), nullable=False),
+            sa.Column('type', sa.String(length=50), nullable=False),
+            sa.Column('date', sa.DateTime(), nullable=False),
+            sa.Column('duration', sa.Integer(), nullable=True),
+            sa.Column('distance', sa.Float(), nullable=True),
+            sa.Column('calories', sa.Integer(), nullable=True),
+            sa.Column('heart_rate_avg', sa.Integer(), nullable=True),
+            sa.Column('heart_rate_max', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+            sa.PrimaryKeyConstraint('id'))),
+        ('activity_analysis', lambda: op.create_table(
+            'activity_analysis',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('activity_id', sa.Integer(), nullable=False),
+            sa.Column('formatted_analysis', sa.Text(), nullable=True),
+            sa.Column('suggestions', sa.JSON(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(['activity_id'], ['activity.id']),
+            sa.PrimaryKeyConstraint('id'))),
+    ]
+
+
+def upgrade():
+    # 以 scripts/init_db.py（create_all）建立過的資料庫已有這些資料表，只建立缺少的
+    inspector = sa.inspect(op.get_bind())
+    for name, create in _tables():
+        if not inspector.has_table(name):
+            create()
+
+
+def downgrade():
+    inspector = sa.inspect(op.get_bind())
+    for name, _ in reversed(_tables()):
+        if inspector.has_table(name):
+            op.drop_table(name)
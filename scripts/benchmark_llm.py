@@ -0,0 +1,98 @@
+import os
+import sys
+import time
+import argparse
+
+# 添加專案根目錄到 Python 路徑
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from backend.utils.activity_features import prompt_size, render_features, summarize_for_prompt
+from backend.utils.response_formatter import EMOJI_MAP, ResponseFormatter, format_structured
+from scripts.benchmark_storage import make_activities
+
+
+def bench_prompt(history_sizes, max_tokens: int = 600) -> None:
+    """比較直接把活動歷史嵌入提示與濃縮成特徵區塊後的提示大小；特徵區塊大小不隨歷史長度成長"""
+    print(f"{'history_rows':>13} {'raw_tokens':>12} {'feature_tokens':>15} {'summarize_ms':>13}")
+    for size in history_sizes:
+        history = make_activities(size)
+        raw = prompt_size(str(history.to_dict('records')))
+        t0 = time.perf_counter()
+        features = summarize_for_prompt(history, max_tokens)
+        elapsed = (time.perf_counter() - t0) * 1000
+        compact = prompt_size(render_features(features))
+        print(f"{size:>13} {raw['tokens']:>12} {compact['tokens']:>15} {elapsed:>13.2f}")
+
+
+def _format_by_passes(raw: str) -> dict:
+    """舊的格式化方式：Markdown 與建議各拆一次行，每個 emoji 關鍵字各做一次整段取代"""
+    lines = []
+    for line in raw.split("\n"):
+        line = line.strip()
+        lines.append(f"* {line[2:]}" if line.startswith("- ") else line)
+    formatted = "\n".join(lines)
+    for keyword, emoji in EMOJI_MAP.items():
+        formatted = formatted.replace(keyword, f"{emoji} {keyword}")
+    suggestions = [line.strip("- ") for line in raw.split("\n") if line.strip("- ")]
+    return {"raw": raw, "formatted": formatted, "suggestions": suggestions}
+
+
+def bench_format(line_counts, chunk_size: int = 4, repeat: int = 20) -> None:
+    """比較舊格式化方式與 ResponseFormatter 的整段、串流（每段 chunk_size 字）總耗時，及最後一段到達後產生結果的耗時"""
+    sample = ["- 建議本週增加一次長距離慢跑，注意心率維持在有氧區間",
+              "近期配速穩定進步，訓練量適中", "- 恢復日可安排伸展與輕鬆騎車", "總結：維持目前的目標進度"]
+    print(f"{'lines':>7} {'chars':>8} {'passes_ms':>10} {'single_ms':>10} {'collect_ms':>11} {'stream_ms':>10} "
+          f"{'collect_tail_ms':>16} {'stream_tail_ms':>15}")
+    for count in line_counts:
+        raw = "\n".join(sample[i % len(sample)] for i in range(count))
+        chunks = [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)]
+        assert format_structured(raw) == _format_by_passes(raw)
+
+        def timed(fn):
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            return (time.perf_counter() - t0) * 1000 / repeat
+
+        tails = {"collect": 0.0, "stream": 0.0}
+
+        def collect():
+            parts = []
+            for chunk in chunks:
+                parts.append(chunk)
+            t0 = time.perf_counter()
+            result = _format_by_passes("".join(parts))
+            tails["collect"] += time.perf_counter() - t0
+            return result
+
+        def stream():
+            formatter = ResponseFormatter()
+            for chunk in chunks:
+                formatter.feed(chunk)
+            t0 = time.perf_counter()
+            result = formatter.result()
+            tails["stream"] += time.perf_counter() - t0
+            return result
+
+        passes = timed(lambda: _format_by_passes(raw))
+        single = timed(lambda: format_structured(raw))
+        collected, streamed = timed(collect), timed(stream)
+        print(f"{count:>7} {len(raw):>8} {passes:>10.3f} {single:>10.3f} {collected:>11.3f} {streamed:>10.3f} "
+              f"{tails['collect'] * 1000 / repeat:>16.3f} {tails['stream'] * 1000 / repeat:>15.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM 提示與回應處理的基準測試")
+    parser.add_argument("bench", nargs="?", choices=["prompt", "format"], default="prompt", help="要執行的基準測試")
+    parser.add_argument("--sizes", type=int, nargs="+", help="prompt 為活動歷史筆數（預設 1000 10000 100000），format 為回應行數（預設 10 100 1000）")
+    args = parser.parse_args()
+
+    if args.bench == "prompt":
+        bench_prompt(args.sizes or [1000, 10000, 100000])
+    elif args.bench == "format":
+        bench_format(args.sizes or [10, 100, 1000])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+# 添加專案根目錄到 Python 路徑
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import numpy as np
+import pandas as pd
+from backend.utils.data_storage import DataStorage
+from backend.utils.activity_aggregation import PARALLEL_MIN_PARTITIONS, available_cpus
+from backend.utils.activity_schema import memory_usage
+
+
+def make_activities(n: int, start: int = 0, seed: int = 0) -> pd.DataFrame:
+    """產生 n 筆測試用活動資料"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, n), unit='D')
+    return pd.DataFrame({
+        'activity_id': [f"act{i}" for i in range(start, start + n)],
+        'date': dates.strftime('%Y-%m-%d'),
+        'activity_type': 'running',
+        'duration': rng.integers(600, 7200, n),
+        'distance': rng.uniform(1000, 42195, n).round(1),
+        'avg_heart_rate': rng.integers(110, 175, n),
+        'max_heart_rate': rng.integers(160, 200, n)
+    })
+
+
+def bench_ingest(partition_sizes, batch_size: int = 100, batches: int = 5) -> None:
+    """
+    比較 rewrite 與 append 兩種寫入模式在不同分區大小下的單批寫入時間
+
+    append 模式的耗時應只與批次大小相關，不隨分區大小成長。
+    """
+    print(f"{'partition_rows':>15} {'rewrite_ms':>12} {'append_ms':>12}")
+    for size in partition_sizes:
+        timings = {}
+        for mode in ("rewrite", "append"):
+            base_path = tempfile.mkdtemp(prefix="bench_storage_")
+            try:
+                storage = DataStorage(base_path=base_path, write_mode=mode,
+                                      journal_merge_threshold=size + batch_size * batches + 1)
+                storage.save_activity_data("bench", "running", make_activities(size), mode="rewrite")
+                # 第一次附加會建立索引，不列入計時
+                storage.save_activity_data("bench", "running", make_activities(1, start=size))
+                start = size + 1
+                elapsed = 0.0
+                for i in range(batches):
+                    batch = make_activities(batch_size, start=start, seed=i + 1)
+                    start += batch_size
+                    t0 = time.perf_counter()
+                    storage.save_activity_data("bench", "running", batch)
+                    elapsed += time.perf_counter() - t0
+                timings[mode] = elapsed / batches * 1000
+            finally:
+                shutil.rmtree(base_path, ignore_errors=True)
+        print(f"{size:>15} {timings['rewrite']:>12.2f} {timings['append']:>12.2f}")
+
+
+def bench_read(rows_per_month: int = 2000, months: int = 12, repeat: int = 5) -> None:
+    """比較 CSV 與欄式格式讀取一整年分區的時間"""
+    base_path = tempfile.mkdtemp(prefix="bench_storage_")
+    try:
+        storage = DataStorage(base_path=base_path)
+        paths = []
+        for month in range(1, months + 1):
+            path = storage.get_activity_file_path("bench", "running", pd.Timestamp(2024, month, 1))
+            make_activities(rows_per_month, start=month * rows_per_month, seed=month).to_csv(path, index=False)
+            paths.append(path)
+
+        print(f"{'format':>10} {'read_ms':>10} {'bytes':>12}")
+        for fmt in ("csv", "columnar"):
+            if fmt != storage.storage_format.name:
+                storage.convert_partitions(fmt)
+                paths = [os.path.splitext(p)[0] + storage.storage_format.extension for p in paths]
+            t0 = time.perf_counter()
+            for _ in range(repeat):
+                year = pd.concat([storage._read_partition(p) for p in paths], ignore_index=True)
+            elapsed = (time.perf_counter() - t0) / repeat * 1000
+            size = sum(storage.storage_format.size(p) for p in paths)
+            print(f"{fmt:>10} {elapsed:>10.2f} {size:>12}")
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+
+
+def bench_compact(rows_per_month: int = 2000, months: int = 12) -> None:
+    """
+    以含重複資料的 journal 建立一年分區後執行壓縮，列出各資料層回收的空間與讀取耗時變化
+
+    一半的月份超過冷資料門檻，會改寫為壓縮格式。熱資料分區就地重寫後沒有變小時保持原狀，
+    不計入 partitions（欄式格式合併 CSV journal 通常如此，journal 留給一般的背景合併處理）。
+    """
+    for fmt in ("csv", "columnar"):
+        base_path = tempfile.mkdtemp(prefix="bench_storage_")
+        try:
+            storage = DataStorage(base_path=base_path, storage_format=fmt)
+            for month in range(1, months + 1):
+                date = pd.Timestamp(2024, month, 1)
+                data = make_activities(rows_per_month, start=month * rows_per_month, seed=month)
+                data['date'] = (date + pd.to_timedelta(np.arange(rows_per_month) % 28, unit='D')).strftime('%Y-%m-%d')
+                storage.save_partition_data("bench", "running", date, data)
+                # 重新匯入的重疊資料與新資料一起進入 journal
+                path = storage.get_activity_file_path("bench", "running", date)
+                storage._append_to_journal(path, data.iloc[: rows_per_month // 10])
+                storage._append_to_journal(path, make_activities(rows_per_month // 10, start=10 ** 7 + month * rows_per_month))
+
+            now = pd.Timestamp(2024, months, 28) + pd.Timedelta(days=1)
+            report = storage.compact_partitions(cold_after_days=(months // 2) * 30, now=now)
+            print(f"[{fmt}]")
+            print(f"{'tier':>6} {'partitions':>10} {'bytes_before':>13} {'bytes_after':>12} "
+                  f"{'reclaimed':>10} {'read_ms_before':>15} {'read_ms_after':>14}")
+            for tier, stats in report.items():
+                print(f"{tier:>6} {stats['partitions']:>10} {stats['bytes_before']:>13} {stats['bytes_after']:>12} "
+                      f"{stats['bytes_reclaimed']:>10} {stats['read_ms_before']:>15.2f} {stats['read_ms_after']:>14.2f}")
+        finally:
+            shutil.rmtree(base_path, ignore_errors=True)
+
+
+def bench_memory(users: int = 50, rows_per_user: int = 2000) -> None:
+    """比較 pd.read_csv 預設型別與 DataStorage 宣告型別讀取多位用戶資料的記憶體用量"""
+    base_path = tempfile.mkdtemp(prefix="bench_storage_")
+    try:
+        storage = DataStorage(base_path=base_path, cache_max_bytes=0)
+        paths = []
+        for user in range(users):
+            data = make_activities(rows_per_user, start=user * rows_per_user, seed=user)
+            storage.save_partition_data(f"u{user}", "running", pd.Timestamp(2024, 1, 1), data)
+            paths.append(storage.get_activity_file_path(f"u{user}", "running", pd.Timestamp(2024, 1, 1)))
+
+        t0 = time.perf_counter()
+        default = pd.concat([pd.read_csv(p) for p in paths], ignore_index=True)
+        default_ms = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        compact = pd.concat([storage.load_activities(f"u{user}", "running") for user in range(users)],
+                            ignore_index=True)
+        compact_ms = (time.perf_counter() - t0) * 1000
+
+        print(f"{'loader':>14} {'rows':>8} {'bytes':>12} {'read_ms':>10}")
+        print(f"{'read_csv':>14} {len(default):>8} {memory_usage(default):>12} {default_ms:>10.2f}")
+        print(f"{'DataStorage':>14} {len(compact):>8} {memory_usage(compact):>12} {compact_ms:>10.2f}")
+        print()
+        print(f"{'column':>16} {'read_csv_dtype':>16} {'bytes':>10} {'schema_dtype':>16} {'bytes':>10}")
+        for column in default.columns:
+            print(f"{column:>16} {str(default[column].dtype):>16} "
+                  f"{default[column].memory_usage(deep=True, index=False):>10} "
+                  f"{str(compact[column].dtype):>16} {compact[column].memory_usage(deep=True, index=False):>10}")
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+
+
+def bench_aggregate(users: int = 20, rows_per_user: int = 50000, workers=(1, 2, 4)) -> None:
+    """
+    比較在單一 process 載入全部原始資料後 groupby，與各分區部分彙總的週彙總耗時
+
+    speedup 相對於 x1；worker 數超過可用 CPU 數時只會互相搶 CPU，不會更快。
+    """
+    base_path = tempfile.mkdtemp(prefix="bench_storage_")
+    try:
+        storage = DataStorage(base_path=base_path, cache_max_bytes=0)
+        user_ids = [f"u{user}" for user in range(users)]
+        for user, user_id in enumerate(user_ids):
+            data = make_activities(rows_per_user, start=user * rows_per_user, seed=user)
+            months = pd.to_datetime(data['date']).dt.month
+            for month, group in data.groupby(months):
+                storage.save_partition_data(user_id, "running", pd.Timestamp(2024, month, 1), group)
+
+        print(f"available_cpus={available_cpus()} partitions={len(storage.catalog.list_partitions())} "
+              f"parallel_min_partitions={PARALLEL_MIN_PARTITIONS}")
+        print(f"{'method':>16} {'seconds':>10} {'speedup':>8}")
+        t0 = time.perf_counter()
+        frames = [storage.load_activities(user_id, "running").assign(user_id=user_id) for user_id in user_ids]
+        raw = pd.concat(frames, ignore_index=True)
+        week = raw['date'].dt.normalize() - pd.to_timedelta(raw['date'].dt.weekday, unit='D')
+        raw.groupby(['user_id', week]).agg(distance=('distance', 'sum'), duration=('duration', 'sum'),
+                                          avg_heart_rate=('avg_heart_rate', 'mean'))
+        print(f"{'load+groupby':>16} {time.perf_counter() - t0:>10.3f} {'':>8}")
+        baseline = None
+        for count in workers:
+            t0 = time.perf_counter()
+            storage.aggregate(user_ids, ["distance", "duration", "avg_heart_rate"], group_by="week", workers=count)
+            elapsed = time.perf_counter() - t0
+            baseline = baseline or elapsed
+            print(f"{f'aggregate x{count}':>16} {elapsed:>10.3f} {baseline / elapsed:>8.2f}")
+    finally:
+        shutil.rmtree(base_path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DataStorage 效能基準測試")
+    parser.add_argument("bench", nargs="?", choices=["ingest", "read", "compact", "memory", "aggregate"], default="ingest",
+                        help="要執行的基準測試")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="既有分區筆數")
+    parser.add_argument("--batch-size", type=int, default=100, help="每批寫入筆數")
+    parser.add_argument("--batches", type=int, default=5, help="每種大小重複的批次數")
+    args = parser.parse_args()
+
+    if args.bench == "ingest":
+        bench_ingest(args.sizes, args.batch_size, args.batches)
+    elif args.bench == "read":
+        bench_read()
+    elif args.bench == "compact":
+        bench_compact()
+    elif args.bench == "memory":
+        bench_memory()
+    elif args.bench == "aggregate":
+        bench_aggregate()
+
+
+if __name__ == '__main__':
+    main()
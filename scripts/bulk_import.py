@@ -0,0 +1,47 @@
+import os
+import sys
+import json
+import argparse
+import logging
+
+# 添加專案根目錄到 Python 路徑
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from backend.utils.data_storage import DataStorage
+from backend.utils.bulk_import import BulkImporter
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批次匯入歷史活動資料")
+    parser.add_argument("source_dir", help="匯出檔所在目錄 (CSV/JSON)")
+    parser.add_argument("--base-path", default="data", help="DataStorage 資料根目錄")
+    parser.add_argument("--roots", nargs="+", help="存放用戶分區的所有儲存根目錄（與應用程式設定相同），未指定時只使用 base-path")
+    parser.add_argument("--user-id", help="匯出檔沒有 user_id 欄位時使用的用戶ID")
+    parser.add_argument("--workers", type=int, help="平行處理的 process 數量（預設為 CPU 數）")
+    parser.add_argument("--format", default="csv", help="分區檔案格式 (csv/columnar)")
+    parser.add_argument("--pattern", default="*", help="檔名篩選 (glob)")
+    args = parser.parse_args()
+
+    storage = DataStorage(base_path=args.base_path, storage_format=args.format, roots=args.roots)
+    importer = BulkImporter(storage, workers=args.workers)
+    report = importer.import_directory(args.source_dir, user_id=args.user_id, pattern=args.pattern)
+
+    logger.info(f"匯入完成: {report['rows_written']} 筆寫入 {report['partitions']} 個分區，"
+                f"{report['rows_per_second']} 筆/秒")
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"批次匯入失敗: {e}")
+        exit(1)
@@ -108,12 +108,12 @@ log_info "設定環境變數..."
 if [ "$ENV" = "production" ]; then
     export FLASK_ENV=production
     export FLASK_DEBUG=0
-    export FLASK_APP=backend.app:app
+    export FLASK_APP=backend.app:create_app
     log_debug "設定為生產環境"
 else
     export FLASK_ENV=development
     export FLASK_DEBUG=1
-    export FLASK_APP=backend.app:app
+    export FLASK_APP=backend.app:create_app
     log_debug "設定為開發環境"
 fi
 
@@ -125,7 +125,7 @@ log_debug "Python 路徑設定完成: $PYTHONPATH"
 if [ ! -f ".env" ]; then
     log_warning "未找到 .env 檔案，使用預設設定"
     cat > .env << EOL
-FLASK_APP=backend.app:app
+FLASK_APP=backend.app:create_app
 FLASK_ENV=$FLASK_ENV
 FLASK_DEBUG=$FLASK_DEBUG
 SECRET_KEY=dev-secret-key
@@ -169,15 +169,32 @@ python scripts/backup.py &
 BACKUP_PID=$!
 log_debug "備份服務啟動完成 (PID: $BACKUP_PID)"
 
+# 啟動洞察預先產生服務（每天凌晨產生活躍用戶的標準洞察）
+log_info "啟動洞察預先產生服務..."
+python scripts/precompute_insights.py --daily-at "${INSIGHT_DAILY_AT:-03:00}" &
+INSIGHT_PID=$!
+log_debug "洞察預先產生服務啟動完成 (PID: $INSIGHT_PID)"
+
 # 啟動應用程式
 log_info "啟動應用程式..."
 if [ "$ENV" = "production" ]; then
+    # 多個 worker 的 Prometheus 指標寫入同一個目錄，由 /metrics 彙總；每次啟動前清除上次留下的檔案
+    export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-${TMPDIR:-/tmp}/benson_running_prometheus}
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR" || handle_error "無法建立 Prometheus 指標目錄"
+    log_debug "Prometheus 指標目錄: $PROMETHEUS_MULTIPROC_DIR"
     if ! command -v gunicorn &> /dev/null; then
         log_info "安裝 gunicorn..."
         pip install gunicorn || handle_error "安裝 gunicorn 失敗"
     fi
-    log_debug "使用 gunicorn 啟動應用程式"
-    gunicorn -w 4 -b 0.0.0.0:5000 backend.app:app &
+    if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+        # ASGI 模式：LLM 端點在事件迴圈上等待上游，其餘端點由 Flask 在執行緒池中處理（見 backend/asgi.py）
+        log_debug "使用 uvicorn 啟動應用程式 (ASGI)"
+        uvicorn --factory backend.asgi:create_asgi_app --host 0.0.0.0 --port 5000 --workers 4 &
+    else
+        log_debug "使用 gunicorn 啟動應用程式"
+        gunicorn -c config/gunicorn.conf.py -w 4 -b 0.0.0.0:5000 "backend.app:create_app()" &
+    fi
     APP_PID=$!
 else
     log_debug "使用 flask run 啟動應用程式"
@@ -190,7 +207,8 @@ echo -e "\n${GREEN}部署完成！${NC}"
 echo -e "應用運行在: http://localhost:5000"
 echo -e "監控服務 PID: $MONITOR_PID"
 echo -e "備份服務 PID: $BACKUP_PID"
+echo -e "洞察預先產生服務 PID: $INSIGHT_PID"
 echo -e "應用服務 PID: $APP_PID"
 
 # 清理程序
-trap "kill $MONITOR_PID $BACKUP_PID $APP_PID 2>/dev/null" EXIT 
\ No newline at end of file
+trap "kill $MONITOR_PID $BACKUP_PID $INSIGHT_PID $APP_PID 2>/dev/null" EXIT 
\ No newline at end of file
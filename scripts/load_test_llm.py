@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import contextlib
+import subprocess
+from collections import Counter
+
+# 添加專案根目錄到 Python 路徑
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import httpx
+import uvicorn
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_stub_llm(latency: float):
+    """OpenAI 相容的 stub 上游（ASGI）：每個請求等待 latency 秒後回傳固定內容"""
+    body = json.dumps({"choices": [{"message": {"content": "1. 路線建議：河濱自行車道"}}],
+                       "usage": {"prompt_tokens": 120, "completion_tokens": 12}}).encode()
+
+    async def app(scope, receive, send):
+        if scope["type"] != "http":
+            return
+        while (await receive()).get("more_body"):
+            pass
+        await asyncio.sleep(latency)
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
+    return app
+
+
+def serve_stub_llm(port: int, latency: float) -> None:
+    uvicorn.run(make_stub_llm(latency), host="127.0.0.1", port=port, log_level="warning",
+                backlog=8192, timeout_keep_alive=60)
+
+
+def start_stub_llm(latency: float):
+    """以獨立 process 啟動 stub 上游（不與壓測客戶端搶 CPU），回傳 (process, base_url)"""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--stub-port", str(port),
+                                "--upstream-latency", str(latency)])
+    wait_until_listening(port, process, "stub LLM")
+    return process, f"http://127.0.0.1:{port}/v1"
+
+
+def wait_until_listening(port: int, process, name: str) -> None:
+    for _ in range(300):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{name} 無法啟動")
+
+
+def server_command(mode: str, port: int, args) -> list:
+    """各模式的啟動指令：sync 同 scripts/deploy.sh 的 gunicorn，async 為 uvicorn + backend.asgi"""
+    if mode == "sync":
+        command = [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "-b", f"127.0.0.1:{port}",
+                   "--backlog", "8192", "--timeout", str(int(args.timeout) + 10)]
+        if args.sync_threads > 1:
+            command += ["-k", "gthread", "--threads", str(args.sync_threads)]
+        return command + ["backend.app:create_app()"]
+    return [sys.executable, "-m", "uvicorn", "--factory", "backend.asgi:create_asgi_app", "--host", "127.0.0.1",
+            "--port", str(port), "--workers", str(args.workers), "--backlog", "8192", "--log-level", "warning"]
+
+
+def start_server(mode: str, upstream: str, args):
+    port = free_port()
+    env = dict(os.environ, OPENAI_API_KEY="load-test", OPENAI_BASE_URL=upstream, DATABASE_URL="sqlite://",
+               LLM_REQUEST_DEADLINE=str(args.timeout), LLM_TIMEOUT=str(args.timeout),
+               LLM_BREAKER_SLOW_SECONDS=str(args.timeout), PYTHONPATH=project_root)
+    process = subprocess.Popen(server_command(mode, port, args), cwd=project_root, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_listening(port, process, f"{mode} 模式的伺服器")
+    url = f"http://127.0.0.1:{port}"
+    # worker 載入應用程式後才開始計時
+    httpx.get(f"{url}/api/health", timeout=60).raise_for_status()
+    return process, url
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def run_load(url: str, requests: int, concurrency: int, timeout: float) -> dict:
+    """
+    以 concurrency 個同時連線送出 requests 個 /api/analyze/city 請求，期間每 0.1 秒探測一次 /api/health
+
+    每個請求的地點不同，提示不會被 single-flight 合併，每個請求都等待一次上游延遲。
+    客戶端連線分散在多個各 25 條連線的 AsyncClient（同 AsyncLLMGateway），避免壓測端本身成為瓶頸。
+    """
+    latencies, errors, health = [], Counter(), []
+    semaphore = asyncio.Semaphore(concurrency)
+    shards = max(1, concurrency // 25)
+    per_shard = -(-concurrency // shards)
+    # 閒置連線比伺服器的 keep-alive 逾時（uvicorn 5 秒、gunicorn 2 秒）更早關閉，避免重用已被關閉的連線
+    limits = httpx.Limits(max_connections=per_shard, max_keepalive_connections=per_shard, keepalive_expiry=1.0)
+    async with contextlib.AsyncExitStack() as stack:
+        clients = [await stack.enter_async_context(httpx.AsyncClient(base_url=url, limits=limits, timeout=timeout))
+                   for _ in range(shards)]
+        probe_client = await stack.enter_async_context(httpx.AsyncClient(base_url=url, timeout=timeout))
+
+        async def one(i: int) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await clients[i % shards].post(
+                        "/api/analyze/city", json={"sport": "running", "location": f"負載測試{i}"})
+                    error = None if response.status_code == 200 else f"HTTP {response.status_code}"
+                    if error is None and response.json().get("degraded"):
+                        error = "degraded"
+                except httpx.HTTPError as e:
+                    error = type(e).__name__
+                if error is None:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors[error] += 1
+
+        async def probe(stop: asyncio.Event) -> None:
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    await probe_client.get("/api/health")
+                    health.append(time.perf_counter() - started)
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.1)
+
+        stop = asyncio.Event()
+        prober = asyncio.ensure_future(probe(stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await prober
+    return {
+        "ok": len(latencies),
+        "errors": sum(errors.values()),
+        "error_kinds": dict(errors),
+        "elapsed_s": round(elapsed, 2),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "p99_s": round(percentile(latencies, 99), 3),
+        "health_p95_s": round(percentile(health, 95), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="比較同步（gunicorn）與 ASGI（uvicorn + backend.asgi）模式下 LLM 端點的併發能力")
+    parser.add_argument("--modes", nargs="+", choices=["sync", "async"], default=["sync", "async"])
+    parser.add_argument("--requests", type=int, default=200, help="總請求數")
+    parser.add_argument("--concurrency", type=int, default=200, help="同時連線數")
+    parser.add_argument("--upstream-latency", type=float, default=2.0, help="stub LLM 每次回應的延遲（秒）")
+    parser.add_argument("--workers", type=int, default=4, help="伺服器 worker process 數")
+    parser.add_argument("--sync-threads", type=int, default=1, help="sync 模式每個 worker 的執行緒數（>1 時使用 gthread）")
+    parser.add_argument("--timeout", type=float, default=300, help="單一請求的逾時（秒）")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    parser.add_argument("--stub-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.stub_port:
+        serve_stub_llm(args.stub_port, args.upstream_latency)
+        return
+
+    stub, upstream = start_stub_llm(args.upstream_latency)
+    results = {}
+    try:
+        for mode in args.modes:
+            process, url = start_server(mode, upstream, args)
+            try:
+                results[mode] = asyncio.run(run_load(url, args.requests, args.concurrency, args.timeout))
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        stub.terminate()
+        stub.wait(timeout=30)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"requests={args.requests} concurrency={args.concurrency} upstream_latency={args.upstream_latency}s "
+          f"workers={args.workers} sync_threads={args.sync_threads}")
+    print(f"{'mode':>6} {'ok':>6} {'errors':>7} {'elapsed_s':>10} {'rps':>8} {'p50_s':>8} {'p95_s':>8} "
+          f"{'p99_s':>8} {'health_p95_s':>13}")
+    for mode, result in results.items():
+        print(f"{mode:>6} {result['ok']:>6} {result['errors']:>7} {result['elapsed_s']:>10} {result['rps']:>8} "
+              f"{result['p50_s']:>8} {result['p95_s']:>8} {result['p99_s']:>8} {result['health_p95_s']:>13}")
+
+
+if __name__ == '__main__':
+    main()
@@ -71,6 +71,7 @@ def collect_application_metrics():
     try:
         # 這裡可以加入從應用程式收集指標的邏輯
         # 例如：從 Redis 或資料庫中讀取統計數據
+        # 分區快取在應用程式的 worker process 內，其指標由應用程式的 /metrics 端點匯出
         pass
     
     except Exception as e:
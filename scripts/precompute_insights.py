@@ -0,0 +1,82 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from datetime import datetime, timedelta
+
+# 添加專案根目錄到 Python 路徑
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from backend.app import create_app
+from backend.models.insight_precompute import STANDARD_INSIGHTS, InsightPrecomputer
+from config.config import Config
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def seconds_until(daily_at: str) -> float:
+    """距離下一次 HH:MM（本地時間）的秒數"""
+    hour, minute = map(int, daily_at.split(":"))
+    now = datetime.now()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def run_once(precomputer: InsightPrecomputer, args) -> None:
+    started = time.perf_counter()
+    report = precomputer.run(user_ids=args.users, active_days=args.active_days, force=args.force)
+    report["elapsed_seconds"] = round(time.perf_counter() - started, 1)
+    logger.info(f"洞察預先產生完成: {report['users']} 位用戶，新產生 {report['generated']}，"
+                f"沿用 {report['fresh']}，失敗 {report['failed']}")
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="預先產生活躍用戶的標準洞察，存入 ActivityAnalysis")
+    parser.add_argument("--users", type=int, nargs="+", help="只處理指定的用戶ID（預設為活躍用戶）")
+    parser.add_argument("--types", nargs="+", choices=STANDARD_INSIGHTS, default=STANDARD_INSIGHTS,
+                        help="要產生的洞察類型")
+    parser.add_argument("--workers", type=int, default=Config.INSIGHT_WORKERS,
+                        help="同時處理的用戶數")
+    parser.add_argument("--rate-limit", type=float, default=Config.INSIGHT_REQUESTS_PER_MINUTE,
+                        help="每分鐘 LLM 呼叫上限（依供應商的速率限制設定）")
+    parser.add_argument("--active-days", type=int, default=Config.INSIGHT_ACTIVE_DAYS,
+                        help="最近幾天有活動的用戶視為活躍用戶")
+    parser.add_argument("--force", action="store_true", help="活動沒有變化也重新產生")
+    parser.add_argument("--daily-at", metavar="HH:MM", help="常駐執行，每天在指定時間執行一次")
+    args = parser.parse_args()
+
+    app = create_app()
+    precomputer = InsightPrecomputer(app, insight_types=args.types, max_workers=args.workers,
+                                     requests_per_minute=args.rate_limit)
+    if not args.daily_at:
+        run_once(precomputer, args)
+        return
+    while True:
+        delay = seconds_until(args.daily_at)
+        logger.info(f"下一次洞察預先產生於 {delay / 3600:.1f} 小時後")
+        time.sleep(delay)
+        try:
+            run_once(precomputer, args)
+        except Exception as e:
+            logger.error(f"洞察預先產生失敗: {str(e)}", exc_info=True)
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"洞察預先產生失敗: {e}")
+        exit(1)
@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import argparse
+import logging
+
+# 添加專案根目錄到 Python 路徑
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from backend.utils.data_storage import DataStorage
+
+# 設定日誌
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="新增或移除儲存根目錄後，把用戶搬到雜湊環上所屬的根目錄")
+    parser.add_argument("--base-path", default="data", help="DataStorage 資料根目錄（目錄、備份與鎖）")
+    parser.add_argument("--roots", nargs="+", required=True, help="目前所有的儲存根目錄（含新增的根目錄）")
+    parser.add_argument("--retire", nargs="*", default=[], help="要清空並停用的舊根目錄")
+    parser.add_argument("--format", default="csv", help="分區檔案格式 (csv/columnar)")
+    parser.add_argument("--dry-run", action="store_true", help="只列出需要搬移的用戶數與大小")
+    args = parser.parse_args()
+
+    storage = DataStorage(base_path=args.base_path, storage_format=args.format, roots=args.roots)
+    report = storage.rebalance(retired_roots=args.retire, dry_run=args.dry_run)
+
+    logger.info(f"重新平衡完成: 搬移 {report['users_moved']}/{report['users_scanned']} 位用戶，"
+                f"{report['bytes_moved']} bytes")
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"重新平衡失敗: {e}")
+        exit(1)